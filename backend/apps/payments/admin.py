@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PaymentSettings, PaymentTransaction
+from .models import PaymentSettings, PaymentTransaction, BinancePayLedgerEntry
 
 
 @admin.register(PaymentSettings)
@@ -39,3 +39,10 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
         }),
     )
 
+
+@admin.register(BinancePayLedgerEntry)
+class BinancePayLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['order_id', 'amount', 'currency', 'order_type', 'transaction_time', 'synced_at']
+    list_filter = ['currency', 'order_type']
+    search_fields = ['order_id', 'transaction_id', 'payer_binance_id']
+    readonly_fields = [field.name for field in BinancePayLedgerEntry._meta.fields]
@@ -1,25 +1,151 @@
 """
 Binance Pay integration for personal account.
 Handles payment via Binance Pay internal transfers (no blockchain fees).
+
+Requests to Binance go through one keep-alive connection pool per worker
+process (``BinanceSession``), which lives on its own event loop thread so
+views calling through ``async_to_sync`` reuse connections instead of paying
+for a TLS handshake on every verification. ``get_pay_client`` returns the
+worker's client for the current ``PaymentSettings`` and only builds a new
+one when the credentials change. Every request is checked against the
+request-weight budget Binance reports (see ``weight``).
 """
 
+import asyncio
+import atexit
 import logging
+import os
+import threading
 import hmac
 import hashlib
 import time
 import aiohttp
-from typing import Optional, Dict, Any, List
+from collections import deque
+from typing import Optional, Dict, Any, List, AsyncIterator
 from asgiref.sync import sync_to_async
 from .models import PaymentSettings
+from .ledger import find_incoming_transaction, index_incoming_transactions, sync_ledger
+from .weight import WeightTracker, WeightLimitExceeded
 
 logger = logging.getLogger(__name__)
 
 
+class BinancePayError(Exception):
+    pass
+
+
+class BinanceSession:
+    """Pooled, keep-alive session to api.binance.com running on its own event loop."""
+    
+    POOL_LIMIT = 20
+    KEEPALIVE_TIMEOUT = 60
+    REQUEST_TIMEOUT = 30
+    DNS_CACHE_TTL = 300
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._pid = None
+        self.weights = WeightTracker()
+    
+    def _ensure_loop(self):
+        """Start the session event loop thread (again after a fork)"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._session = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name='binance-pay-client',
+                    daemon=True
+                )
+                self._thread.start()
+            return self._loop
+    
+    async def _get_session(self):
+        """Get the pooled session, creating it on the session loop if needed"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.POOL_LIMIT,
+                use_dns_cache=True,
+                ttl_dns_cache=self.DNS_CACHE_TTL,
+                keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+            )
+        return self._session
+    
+    async def _get(self, url: str, headers: Dict[str, str], weight: Dict[str, int], timeout: Optional[float]):
+        await self.weights.acquire(weight)
+        try:
+            session = await self._get_session()
+            kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+            async with session.get(url, headers=headers, **kwargs) as response:
+                self.weights.update(response.headers, response.status)
+                return response.status, await response.json(content_type=None)
+        finally:
+            self.weights.release(weight)
+    
+    async def get(self, url: str, headers: Dict[str, str], weight: Dict[str, int], timeout: float = None):
+        """
+        GET from any event loop over the pooled session and return ``(status, data)``.
+        
+        ``weight`` maps Binance weight counters to the request's weight.
+        Raises ``WeightLimitExceeded`` without calling Binance when the
+        weight budget is used up (see ``weight``).
+        """
+        future = asyncio.run_coroutine_threadsafe(self._get(url, headers, weight, timeout), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+    
+    def weight_stats(self):
+        return self.weights.stats()
+    
+    async def _close_session(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def close(self):
+        """Close the pooled session and stop the session loop"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid() or not thread.is_alive():
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._close_session(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error closing Binance session: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+
+binance_session = BinanceSession()
+atexit.register(binance_session.close)
+
+
 class BinancePayAPI:
     """Binance Pay API client for personal account internal transfers."""
     
     BASE_URL = "https://api.binance.com"
     
+    # Longest startTime..endTime range the history endpoint accepts
+    MAX_HISTORY_WINDOW_MS = 90 * 24 * 60 * 60 * 1000
+    
+    # History requests are heavily weighted, so only a few slices are fetched at once
+    HISTORY_CONCURRENCY = 3
+    
+    # Request weights by Binance counter (see weight.py)
+    HISTORY_WEIGHT = {'sapi_uid': 3000}
+    ACCOUNT_STATUS_WEIGHT = {'sapi_ip': 1}
+    
     def __init__(self, api_key: str = None, api_secret: str = None):
         """
         Initialize Binance Pay API client.
@@ -33,13 +159,10 @@ class BinancePayAPI:
         
     @classmethod
     async def from_settings(cls):
-        """Create instance from database settings"""
+        """Get the client for the database settings"""
         settings = await sync_to_async(PaymentSettings.objects.first)()
         if settings and settings.binance_enabled:
-            return cls(
-                api_key=settings.binance_api_key,
-                api_secret=settings.binance_api_secret
-            )
+            return get_pay_client(settings)
         return None
         
     def _generate_signature(self, params: str) -> str:
@@ -58,6 +181,118 @@ class BinancePayAPI:
             hashlib.sha256
         ).hexdigest()
     
+    async def _fetch_pay_transactions(self, start_time: int, end_time: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Fetch one page of Binance Pay transaction history.
+        
+        Raises:
+            BinancePayError: If Binance returns an error
+            WeightLimitExceeded: If the request weight budget is used up
+        """
+        timestamp = int(time.time() * 1000)
+        params = f"startTime={start_time}&endTime={end_time}&limit={limit}&recvWindow=60000&timestamp={timestamp}"
+        signature = self._generate_signature(params)
+        
+        headers = {
+            "X-MBX-APIKEY": self.api_key
+        }
+        
+        response_status, result = await binance_session.get(
+            f"{self.BASE_URL}/sapi/v1/pay/transactions?{params}&signature={signature}",
+            headers=headers,
+            weight=self.HISTORY_WEIGHT
+        )
+        
+        if response_status != 200:
+            raise BinancePayError(f"Binance Pay transaction history failed: {result}")
+        
+        # Binance Pay API returns data in 'data' field
+        transactions = result.get('data', []) or []
+        logger.debug(f"Retrieved {len(transactions)} Binance Pay transactions between {start_time} and {end_time}")
+        return transactions
+    
+    async def iter_pay_transactions(
+        self,
+        start_time: int = None,
+        end_time: int = None,
+        limit: int = 100,
+        slice_ms: int = None,
+        concurrency: int = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over all Binance Pay transactions in a time window.
+        
+        The history endpoint returns at most ``limit`` records per request
+        and has no page cursor. The window is split into slices of at most
+        ``slice_ms``. A full page holds the records from one end of its
+        slice, so the records strictly between its earliest and latest
+        times are complete: those are kept, and only the parts of the slice
+        before and after them are fetched again. A full page whose records
+        all share one time is split in half instead. Up to ``concurrency``
+        slices are fetched at once. Transactions are yielded as slices
+        complete, not in time order.
+        
+        Args:
+            start_time: Start timestamp in milliseconds (default: 30 days ago)
+            end_time: End timestamp in milliseconds (default: now)
+            limit: Records per request (max 100)
+            slice_ms: Largest slice to request (default and max: 90 days)
+            concurrency: Slices fetched at once (default: HISTORY_CONCURRENCY)
+            
+        Raises:
+            BinancePayError: If Binance returns an error
+            WeightLimitExceeded: If the request weight budget is used up
+        """
+        timestamp = int(time.time() * 1000)
+        
+        # Default to last 30 days if not specified
+        if not start_time:
+            start_time = timestamp - (30 * 24 * 60 * 60 * 1000)
+        if not end_time:
+            end_time = timestamp
+        slice_ms = min(slice_ms or self.MAX_HISTORY_WINDOW_MS, self.MAX_HISTORY_WINDOW_MS)
+        concurrency = concurrency or self.HISTORY_CONCURRENCY
+        
+        # Inclusive [start, end] slices, so neighbours never share a record
+        pending = deque(
+            (slice_start, min(slice_start + slice_ms - 1, end_time))
+            for slice_start in range(start_time, end_time + 1, slice_ms)
+        )
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < concurrency:
+                    slice_start, slice_end = pending.popleft()
+                    task = asyncio.ensure_future(self._fetch_pay_transactions(slice_start, slice_end, limit))
+                    running[task] = (slice_start, slice_end)
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    slice_start, slice_end = running.pop(task)
+                    transactions = task.result()
+                    
+                    if len(transactions) >= limit:
+                        # Some records were left out
+                        times = [int(tx.get('transactionTime', 0) or 0) for tx in transactions]
+                        first, last = min(times), max(times)
+                        if first < last:
+                            # Keep what the page covers and fetch the rest of the slice,
+                            # including the records at its bounds
+                            pending.extendleft([(last, slice_end), (slice_start, first)])
+                            transactions = [tx for tx, tx_time in zip(transactions, times) if first < tx_time < last]
+                        elif slice_end > slice_start:
+                            middle = (slice_start + slice_end) // 2
+                            pending.extendleft([(middle + 1, slice_end), (slice_start, middle)])
+                            continue
+                        else:
+                            logger.warning(f"More than {limit} Binance Pay transactions at {slice_start}; some may be missing")
+                    
+                    for tx in transactions:
+                        yield tx
+        finally:
+            for task in running:
+                task.cancel()
+    
     async def get_pay_transaction_history(
         self, 
         start_time: int = None, 
@@ -67,46 +302,22 @@ class BinancePayAPI:
         """
         Get Binance Pay transaction history.
         
+        The whole window is collected into a list for callers that need it
+        at once; the ledger sync streams ``iter_pay_transactions`` instead.
+        
         Args:
             start_time: Start timestamp in milliseconds (optional)
             end_time: End timestamp in milliseconds (optional)
-            limit: Number of records to retrieve (max 100)
+            limit: Records per request (max 100); all records in the
+                window are returned, see iter_pay_transactions
             
         Returns:
             List of transaction records or None on error
         """
         try:
-            timestamp = int(time.time() * 1000)
-            
-            # Default to last 30 days if not specified
-            if not start_time:
-                start_time = timestamp - (30 * 24 * 60 * 60 * 1000)
-            if not end_time:
-                end_time = timestamp
-            
-            params = f"startTime={start_time}&endTime={end_time}&limit={limit}&recvWindow=60000&timestamp={timestamp}"
-            signature = self._generate_signature(params)
-            
-            headers = {
-                "X-MBX-APIKEY": self.api_key
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.BASE_URL}/sapi/v1/pay/transactions?{params}&signature={signature}",
-                    headers=headers
-                ) as response:
-                    result = await response.json()
-                    
-                    if response.status == 200:
-                        # Binance Pay API returns data in 'data' field
-                        transactions = result.get('data', [])
-                        logger.info(f"Retrieved {len(transactions)} Binance Pay transactions")
-                        logger.debug(f"Binance Pay API full response: {result}")
-                        return transactions
-                    else:
-                        logger.error(f"Binance Pay transaction history failed: {result}")
-                        return None
+            transactions = [tx async for tx in self.iter_pay_transactions(start_time, end_time, limit)]
+            logger.info(f"Retrieved {len(transactions)} Binance Pay transactions")
+            return transactions
                         
         except Exception as e:
             logger.error(f"Error getting Binance Pay transaction history: {e}")
@@ -122,6 +333,8 @@ class BinancePayAPI:
         """
         Verify Binance Pay payment by Binance's order ID directly.
         User provides the order ID they see in their Binance Pay transaction.
+        The order is looked up in the local ledger; the ledger is refreshed
+        from Binance only when the order ID isn't there yet.
         
         Args:
             binance_order_id: The order ID from Binance Pay transaction
@@ -131,107 +344,174 @@ class BinancePayAPI:
             
         Returns:
             Dict with verification result or None on error
+            
+        Raises:
+            WeightLimitExceeded: If Binance can't be called until the weight budget frees up
         """
         try:
-            # Get recent transactions (last N hours + buffer)
             current_time = int(time.time() * 1000)
-            start_time = current_time - ((max_age_hours + 1) * 60 * 60 * 1000)
             
-            transactions = await self.get_pay_transaction_history(
-                start_time=start_time,
-                end_time=current_time,
-                limit=100
-            )
+            # Look the order up in the local ledger first
+            tx = await sync_to_async(find_incoming_transaction)(binance_order_id, currency)
             
-            if not transactions:
-                logger.warning("No transactions retrieved from Binance Pay API")
+            if tx is None:
+                # Not synced yet: refresh the ledger for the last N hours + buffer
+                logger.info(f"Binance order ID '{binance_order_id}' not in ledger, refreshing from Binance Pay API")
+                start_time = current_time - ((max_age_hours + 1) * 60 * 60 * 1000)
+                synced = await sync_ledger(self, start_time=start_time)
+                
+                # A failed sync still stores the slices it got, so look again either way
+                tx = await sync_to_async(find_incoming_transaction)(binance_order_id, currency)
+                
+                if tx is None and synced is None:
+                    logger.warning("No transactions retrieved from Binance Pay API")
+                    return {
+                        'verified': False,
+                        'error': 'Unable to retrieve transaction history'
+                    }
+            
+            if tx is None:
+                logger.error(f"❌ Transaction with Binance order ID '{binance_order_id}' not found in recent payments")
                 return {
                     'verified': False,
-                    'error': 'Unable to retrieve transaction history'
+                    'error': f'Transaction with Binance order ID "{binance_order_id}" not found in recent payments'
                 }
             
-            logger.info(f"Searching for Binance order ID '{binance_order_id}' in {len(transactions)} transactions")
-            logger.info(f"Search criteria: currency={currency}, expected_amount={expected_amount}, max_age_hours={max_age_hours}")
-            
-            # Search for transaction with matching Binance order ID
-            for idx, tx in enumerate(transactions, 1):
-                logger.debug(f"Transaction {idx}/{len(transactions)}: {tx}")
-                
-                # Check if this is an incoming payment
-                tx_type = tx.get('orderType')
-                amount_val = float(tx.get('amount', 0))
-                is_incoming = amount_val > 0
-                
-                if not is_incoming:
-                    logger.debug(f"  Skipped: amount={amount_val} (not incoming transfer)")
-                    continue
-                
-                # Check currency
-                tx_currency = tx.get('currency')
-                if tx_currency != currency:
-                    logger.debug(f"  Skipped: currency mismatch (expected {currency}, got {tx_currency})")
-                    continue
-                
-                # Match Binance order ID (use 'orderId' field from API)
-                tx_order_id = str(tx.get('orderId', ''))
-                logger.debug(f"  Checking order ID: tx_order_id='{tx_order_id}' vs binance_order_id='{binance_order_id}'")
-                
-                if tx_order_id == binance_order_id:
-                    logger.info(f"  ✅ Order ID matched! Transaction found: {tx}")
-                    
-                    # Check transaction age
-                    tx_time = tx.get('transactionTime', 0)
-                    age_hours = (current_time - tx_time) / (1000 * 60 * 60)
-                    
-                    if age_hours > max_age_hours:
-                        logger.warning(f"  Transaction too old: {age_hours:.1f} hours (max {max_age_hours} hours)")
-                        return {
-                            'verified': False,
-                            'error': f'Transaction is too old ({age_hours:.1f} hours). Must be within {max_age_hours} hour(s).'
-                        }
-                    
-                    # Verify amount
-                    tx_amount = float(tx.get('amount', 0))
-                    logger.info(f"  Amount check: expected={expected_amount}, received={tx_amount}, diff={abs(tx_amount - expected_amount)}")
-                    
-                    # Allow small difference (0.01) for rounding
-                    if abs(tx_amount - expected_amount) < 0.01:
-                        logger.info(f"  ✅ Payment verified successfully!")
+            logger.info(f"  ✅ Order ID matched! Transaction found: {tx}")
+            return self._check_transaction(tx, binance_order_id, expected_amount, currency, max_age_hours, current_time)
                         
-                        # Get payer info
-                        payer_info = tx.get('payerInfo', {}) or {}
-                        payer_name = payer_info.get('name', 'Unknown') if isinstance(payer_info, dict) else 'Unknown'
-                        
-                        return {
-                            'verified': True,
-                            'amount': tx_amount,
-                            'currency': tx.get('currency'),
-                            'binance_order_id': binance_order_id,
-                            'transaction_id': tx.get('transactionId', 'N/A'),
-                            'transaction_time': tx.get('transactionTime'),
-                            'age_hours': age_hours,
-                            'from_account': payer_name,
-                            'payer_binance_id': payer_info.get('binanceId', 'N/A') if isinstance(payer_info, dict) else 'N/A',
-                            'order_type': tx.get('orderType', 'N/A')
-                        }
-                    else:
-                        logger.error(f"  ❌ Amount mismatch: expected {expected_amount} {currency}, received {tx_amount} {currency}")
-                        return {
-                            'verified': False,
-                            'error': f'Amount mismatch: expected {expected_amount} {currency}, received {tx_amount} {currency}'
-                        }
+        except WeightLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error verifying Binance Pay payment: {e}")
+            return None
+    
+    async def verify_payments_by_binance_order_ids(
+        self,
+        payments: List[Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Verify several Binance Pay payments at once.
+        
+        All order IDs are looked up in the local ledger with one query. If
+        any are missing, the ledger is refreshed once over the widest
+        verification window in the batch and the missing ones are looked
+        up again, even if the refresh failed part way.
+        
+        Args:
+            payments: Dicts with binance_order_id, expected_amount,
+                currency and max_age_hours, as for a single verification
+            
+        Returns:
+            Dict of Binance order ID -> verification result. Results for
+            orders that weren't found, or couldn't be looked up, have
+            ``retryable`` set: the payment may still show up later.
+            
+        Raises:
+            WeightLimitExceeded: If Binance can't be called until the weight budget frees up
+        """
+        current_time = int(time.time() * 1000)
+        index = await sync_to_async(index_incoming_transactions)(
+            payment['binance_order_id'] for payment in payments
+        )
+        missing = [
+            payment for payment in payments
+            if (payment['binance_order_id'], payment['currency']) not in index
+        ]
+        
+        unavailable = False
+        if missing:
+            logger.info(f"{len(missing)} of {len(payments)} Binance order IDs not in ledger, refreshing from Binance Pay API")
+            max_age_hours = max(payment['max_age_hours'] for payment in missing)
+            start_time = current_time - ((max_age_hours + 1) * 60 * 60 * 1000)
+            synced = await sync_ledger(self, start_time=start_time)
             
-            # Transaction not found
-            logger.error(f"❌ Transaction with Binance order ID '{binance_order_id}' not found in {len(transactions)} recent payments")
-            logger.info(f"All order IDs checked: {[str(tx.get('orderId', 'N/A')) for tx in transactions if float(tx.get('amount', 0)) > 0]}")
+            # A failed sync still stores the slices it got, so look again either
+            # way; only orders that are still missing are reported unavailable
+            unavailable = synced is None
+            index.update(await sync_to_async(index_incoming_transactions)(
+                payment['binance_order_id'] for payment in missing
+            ))
+        
+        results = {}
+        for payment in payments:
+            binance_order_id = payment['binance_order_id']
+            tx = index.get((binance_order_id, payment['currency']))
+            if tx is not None:
+                results[binance_order_id] = self._check_transaction(
+                    tx, binance_order_id, float(payment['expected_amount']), payment['currency'],
+                    payment['max_age_hours'], current_time
+                )
+            elif unavailable:
+                results[binance_order_id] = {
+                    'verified': False,
+                    'retryable': True,
+                    'error': 'Unable to retrieve transaction history'
+                }
+            else:
+                results[binance_order_id] = {
+                    'verified': False,
+                    'retryable': True,
+                    'error': f'Transaction with Binance order ID "{binance_order_id}" not found in recent payments'
+                }
+        return results
+    
+    def _check_transaction(
+        self,
+        tx: Dict[str, Any],
+        binance_order_id: str,
+        expected_amount: float,
+        currency: str,
+        max_age_hours: int,
+        current_time: int
+    ) -> Dict[str, Any]:
+        """
+        Check age and amount of the incoming transaction matching an order ID.
+        
+        Returns:
+            Dict with verification result
+        """
+        # Check transaction age
+        tx_time = tx.get('transactionTime', 0)
+        age_hours = (current_time - tx_time) / (1000 * 60 * 60)
+        
+        if age_hours > max_age_hours:
+            logger.warning(f"  Transaction too old: {age_hours:.1f} hours (max {max_age_hours} hours)")
             return {
                 'verified': False,
-                'error': f'Transaction with Binance order ID "{binance_order_id}" not found in recent payments'
+                'error': f'Transaction is too old ({age_hours:.1f} hours). Must be within {max_age_hours} hour(s).'
+            }
+        
+        # Verify amount
+        tx_amount = float(tx.get('amount', 0))
+        logger.info(f"  Amount check: expected={expected_amount}, received={tx_amount}, diff={abs(tx_amount - expected_amount)}")
+        
+        # Allow small difference (0.01) for rounding
+        if abs(tx_amount - expected_amount) < 0.01:
+            logger.info(f"  ✅ Payment verified successfully!")
+            
+            # Get payer info
+            payer_info = tx.get('payerInfo', {}) or {}
+            payer_name = payer_info.get('name', 'Unknown') if isinstance(payer_info, dict) else 'Unknown'
+            
+            return {
+                'verified': True,
+                'amount': tx_amount,
+                'currency': tx.get('currency'),
+                'binance_order_id': binance_order_id,
+                'transaction_id': tx.get('transactionId', 'N/A'),
+                'transaction_time': tx.get('transactionTime'),
+                'age_hours': age_hours,
+                'from_account': payer_name,
+                'payer_binance_id': payer_info.get('binanceId', 'N/A') if isinstance(payer_info, dict) else 'N/A',
+                'order_type': tx.get('orderType', 'N/A')
+            }
+        else:
+            logger.error(f"  ❌ Amount mismatch: expected {expected_amount} {currency}, received {tx_amount} {currency}")
+            return {
+                'verified': False,
+                'error': f'Amount mismatch: expected {expected_amount} {currency}, received {tx_amount} {currency}'
             }
-                        
-        except Exception as e:
-            logger.error(f"Error verifying Binance Pay payment: {e}")
-            return None
     
     async def test_connection(self) -> bool:
         """
@@ -239,6 +519,9 @@ class BinancePayAPI:
         
         Returns:
             bool: True if connection is successful
+            
+        Raises:
+            WeightLimitExceeded: If Binance can't be called until the weight budget frees up
         """
         try:
             timestamp = int(time.time() * 1000)
@@ -249,14 +532,33 @@ class BinancePayAPI:
                 "X-MBX-APIKEY": self.api_key
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.BASE_URL}/sapi/v1/account/status?{params}&signature={signature}",
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    return response.status == 200
+            response_status, _ = await binance_session.get(
+                f"{self.BASE_URL}/sapi/v1/account/status?{params}&signature={signature}",
+                headers=headers,
+                weight=self.ACCOUNT_STATUS_WEIGHT,
+                timeout=10
+            )
+            return response_status == 200
                     
+        except WeightLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Binance connection test failed: {e}")
             return False
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_pay_client(settings: PaymentSettings) -> BinancePayAPI:
+    """Get this worker's client for the settings, rebuilt only when the credentials change"""
+    global _client
+    with _client_lock:
+        client = _client
+        if client is None or (client.api_key, client.api_secret) != (settings.binance_api_key, settings.binance_api_secret):
+            client = _client = BinancePayAPI(
+                api_key=settings.binance_api_key,
+                api_secret=settings.binance_api_secret
+            )
+        return client
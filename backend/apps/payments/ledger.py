@@ -0,0 +1,128 @@
+"""
+Local ledger of Binance Pay transactions.
+
+``sync_ledger`` pulls transactions newer than the ledger watermark (the
+latest ``transactionTime`` stored) and stores them, so verifying a payment
+is a single indexed lookup on ``orderId`` instead of a scan over the whole
+transaction history. Run it periodically with
+``python manage.py sync_binance_ledger``; verification also refreshes the
+ledger when an order ID is not found.
+"""
+
+import logging
+import time
+from decimal import Decimal
+from typing import Optional, Dict, Any, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+
+from .models import BinancePayLedgerEntry
+from .weight import WeightLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# Re-read this much before the watermark, for transactions that show up late
+SYNC_OVERLAP_MS = 5 * 60 * 1000
+
+# An empty or long-idle ledger starts this far back: the longest verification
+# window (24 hours) plus the one-hour buffer verification allows
+BACKFILL_MS = 25 * 60 * 60 * 1000
+
+# Transactions are streamed from Binance and stored in batches of this size
+STORE_BATCH_SIZE = 500
+
+
+def entry_from_transaction(tx: Dict[str, Any]) -> BinancePayLedgerEntry:
+    """Build a ledger entry from a pay history record"""
+    payer_info = tx.get('payerInfo', {}) or {}
+    if not isinstance(payer_info, dict):
+        payer_info = {}
+    return BinancePayLedgerEntry(
+        order_id=str(tx.get('orderId', '')),
+        transaction_id=str(tx.get('transactionId', '') or ''),
+        order_type=str(tx.get('orderType', '') or ''),
+        amount=Decimal(str(tx.get('amount', 0))),
+        currency=tx.get('currency', '') or '',
+        transaction_time=int(tx.get('transactionTime', 0) or 0),
+        payer_name=str(payer_info.get('name', '') or ''),
+        payer_binance_id=str(payer_info.get('binanceId', '') or ''),
+        raw=tx,
+    )
+
+
+def get_watermark() -> Optional[int]:
+    """Latest transaction time in the ledger, in milliseconds"""
+    return BinancePayLedgerEntry.objects.aggregate(watermark=Max('transaction_time'))['watermark']
+
+
+def store_transactions(transactions) -> int:
+    """Add pay history records to the ledger; records already stored are skipped"""
+    entries = [entry_from_transaction(tx) for tx in transactions if tx.get('orderId')]
+    BinancePayLedgerEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def find_incoming_transaction(binance_order_id: str, currency: str) -> Optional[Dict[str, Any]]:
+    """Pay history record of an incoming payment with this order ID, if the ledger has it"""
+    entry = BinancePayLedgerEntry.objects.filter(
+        order_id=binance_order_id,
+        currency=currency,
+        amount__gt=0
+    ).order_by('-transaction_time').first()
+    return entry.raw if entry else None
+
+
+def index_incoming_transactions(binance_order_ids) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Pay history records of incoming payments with these order IDs, keyed by (order ID, currency)"""
+    entries = BinancePayLedgerEntry.objects.filter(
+        order_id__in=list(binance_order_ids),
+        amount__gt=0
+    ).order_by('transaction_time')
+    # Ascending, so the newest record per key wins as in find_incoming_transaction
+    return {(entry.order_id, entry.currency): entry.raw for entry in entries}
+
+
+async def sync_ledger(client, start_time: int = None) -> Optional[int]:
+    """
+    Pull new transactions into the ledger.
+
+    Args:
+        client: BinancePayAPI client
+        start_time: Start timestamp in milliseconds (default: the watermark
+            less SYNC_OVERLAP_MS, at most BACKFILL_MS back)
+
+    Returns:
+        Number of transactions received, or None if the history request failed
+
+    Raises:
+        WeightLimitExceeded: If Binance can't be called until the weight budget
+            frees up; the transactions received until then are stored
+    """
+    current_time = int(time.time() * 1000)
+    if start_time is None:
+        watermark = await sync_to_async(get_watermark)()
+        start_time = current_time - BACKFILL_MS
+        if watermark:
+            start_time = max(start_time, watermark - SYNC_OVERLAP_MS)
+
+    count = 0
+    batch = []
+    try:
+        async for tx in client.iter_pay_transactions(start_time=start_time, end_time=current_time):
+            batch.append(tx)
+            if len(batch) >= STORE_BATCH_SIZE:
+                count += await sync_to_async(store_transactions)(batch)
+                batch = []
+        count += await sync_to_async(store_transactions)(batch)
+    except Exception as e:
+        # Keep what was received. It can leave gaps below the new watermark,
+        # which only cost a refresh when verification misses
+        await sync_to_async(store_transactions)(batch)
+        if isinstance(e, WeightLimitExceeded):
+            raise
+        logger.error(f"Error syncing Binance Pay ledger: {e}")
+        return None
+
+    logger.info(f"Synced {count} Binance Pay transactions into the ledger")
+    return count
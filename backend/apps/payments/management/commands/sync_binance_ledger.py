@@ -0,0 +1,29 @@
+"""
+Pull new Binance Pay transactions into the local ledger.
+
+    python manage.py sync_binance_ledger
+
+Run it from cron (or a systemd timer) every minute or so, so payments are
+usually verified from the ledger without calling Binance.
+"""
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.binance_pay import BinancePayAPI
+from apps.payments.ledger import sync_ledger
+
+
+class Command(BaseCommand):
+    help = 'Pull new Binance Pay transactions into the local ledger'
+
+    def handle(self, *args, **options):
+        client = async_to_sync(BinancePayAPI.from_settings)()
+        if client is None:
+            raise CommandError('Binance Pay is not enabled.')
+
+        count = async_to_sync(sync_ledger)(client)
+        if count is None:
+            raise CommandError('Unable to retrieve transaction history from Binance Pay.')
+
+        self.stdout.write(self.style.SUCCESS(f'Synced {count} Binance Pay transactions'))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BinancePayLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.CharField(max_length=255)),
+                ('transaction_id', models.CharField(blank=True, max_length=255)),
+                ('order_type', models.CharField(blank=True, max_length=50)),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('currency', models.CharField(max_length=10)),
+                ('transaction_time', models.BigIntegerField()),
+                ('payer_name', models.CharField(blank=True, max_length=255)),
+                ('payer_binance_id', models.CharField(blank=True, max_length=255)),
+                ('raw', models.JSONField(blank=True, default=dict)),
+                ('synced_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Binance Pay Ledger Entry',
+                'verbose_name_plural': 'Binance Pay Ledger',
+                'db_table': 'binance_pay_ledger',
+                'ordering': ['-transaction_time'],
+                'indexes': [models.Index(fields=['-transaction_time'], name='binance_pay_transac_c56ccb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order_id', 'transaction_id'), name='unique_binance_pay_ledger_entry')],
+            },
+        ),
+    ]
@@ -58,3 +58,33 @@ class PaymentTransaction(models.Model):
     def __str__(self):
         return f"{self.binance_order_id} - {self.amount} {self.currency} ({self.status})"
 
+
+
+class BinancePayLedgerEntry(models.Model):
+    """Binance Pay transaction mirrored from the pay history API"""
+    order_id = models.CharField(max_length=255)
+    transaction_id = models.CharField(max_length=255, blank=True)
+    order_type = models.CharField(max_length=50, blank=True)
+    amount = models.DecimalField(max_digits=20, decimal_places=8)
+    currency = models.CharField(max_length=10)
+    transaction_time = models.BigIntegerField()  # Timestamp in milliseconds
+    payer_name = models.CharField(max_length=255, blank=True)
+    payer_binance_id = models.CharField(max_length=255, blank=True)
+    raw = models.JSONField(default=dict, blank=True)
+    synced_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'binance_pay_ledger'
+        ordering = ['-transaction_time']
+        verbose_name = 'Binance Pay Ledger Entry'
+        verbose_name_plural = 'Binance Pay Ledger'
+        constraints = [
+            # Also serves order ID lookups
+            models.UniqueConstraint(fields=['order_id', 'transaction_id'], name='unique_binance_pay_ledger_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['-transaction_time']),
+        ]
+    
+    def __str__(self):
+        return f"{self.order_id} - {self.amount} {self.currency}"
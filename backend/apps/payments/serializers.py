@@ -40,3 +40,17 @@ class VerifyPaymentSerializer(serializers.Serializer):
     expected_amount = serializers.DecimalField(max_digits=20, decimal_places=8, required=True)
     currency = serializers.CharField(default='USDT')
     max_age_hours = serializers.IntegerField(default=1, min_value=1, max_value=24)
+
+
+class BatchVerifyPaymentSerializer(serializers.Serializer):
+    payments = serializers.ListField(
+        child=VerifyPaymentSerializer(),
+        min_length=1,
+        max_length=100
+    )
+    
+    def validate_payments(self, payments):
+        order_ids = [payment['binance_order_id'] for payment in payments]
+        if len(set(order_ids)) != len(order_ids):
+            raise serializers.ValidationError('Each Binance order ID can only be verified once per batch')
+        return payments
@@ -1,3 +1,755 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from aiohttp import web
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from . import binance_pay, ledger, weight
+from .binance_pay import BinancePayAPI, BinancePayError, BinanceSession, get_pay_client
+from .ledger import (
+    BACKFILL_MS, SYNC_OVERLAP_MS, find_incoming_transaction, get_watermark, index_incoming_transactions,
+    store_transactions, sync_ledger
+)
+from .models import BinancePayLedgerEntry, PaymentSettings, PaymentTransaction
+from .serializers import BatchVerifyPaymentSerializer
+from .weight import HEADROOM, WeightLimitExceeded, WeightTracker
+
+HOUR_MS = 60 * 60 * 1000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def pay_tx(order_id, amount='10', transaction_time=None, currency='USDT', transaction_id=None):
+    return {
+        'orderId': order_id,
+        'transactionId': transaction_id or f'T-{order_id}',
+        'orderType': 'C2C',
+        'amount': amount,
+        'currency': currency,
+        'transactionTime': transaction_time or now_ms(),
+        'payerInfo': {'name': 'Payer', 'binanceId': 42},
+    }
+
+
+class StubBinance:
+    """Answers every GET with ``response`` from a background event loop, recording the client ports"""
+
+    def __init__(self):
+        self.response = (200, {}, {})
+        self.peers = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.base_url = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _handle(self, request):
+        self.peers.append(request.transport.get_extra_info('peername')[1])
+        response_status, body, headers = self.response
+        return web.json_response(body, status=response_status, headers=headers)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class StubBinanceMixin:
+    """Runs a ``StubBinance`` for the test class and gives each test a fresh session"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.binance = StubBinance()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.binance.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.binance.response = (200, {}, {})
+        self.binance.peers.clear()
+        self.session = BinanceSession()
+        self.addCleanup(self.session.close)
+
+    def get(self, path='/sapi/v1/account/status', weight=None):
+        return async_to_sync(self.session.get)(
+            f'{self.binance.base_url}{path}', headers={}, weight=weight or {'sapi_ip': 1}
+        )
+
+
+class FakePayClient(BinancePayAPI):
+    """Serves pay history from a list, optionally failing with ``error`` after ``fail_after`` records"""
+
+    def __init__(self, transactions=(), fail_after=None, error=None):
+        super().__init__(api_key='key', api_secret='secret')
+        self.transactions = list(transactions)
+        self.fail_after = fail_after
+        self.error = error or BinancePayError('Binance API error: 500')
+        self.calls = []
+
+    async def iter_pay_transactions(self, start_time, end_time, limit=100, slice_ms=None, concurrency=None):
+        self.calls.append((start_time, end_time))
+        for position, tx in enumerate(self.transactions):
+            if position == self.fail_after:
+                raise self.error
+            yield tx
+        if self.fail_after is not None:
+            raise self.error
+
+
+class HistoryPayClient(BinancePayAPI):
+    """Answers history requests from a list of transaction times, like the Binance endpoint"""
+
+    def __init__(self, times=(), fail_on=None, error=None, newest_first=False):
+        super().__init__(api_key='key', api_secret='secret')
+        self.times = sorted(times, reverse=newest_first)
+        self.fail_on = fail_on
+        self.error = error or BinancePayError('Binance Pay transaction history failed: {}')
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _fetch_pay_transactions(self, start_time, end_time, limit):
+        self.requests.append((start_time, end_time))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if (start_time, end_time) == self.fail_on:
+                # Answered after the slices fetched alongside it
+                await asyncio.sleep(0.05)
+                raise self.error
+            await asyncio.sleep(0)
+            return [pay_tx(f'A{t}', transaction_time=t) for t in self.times if start_time <= t <= end_time][:limit]
+        finally:
+            self.in_flight -= 1
+
+
+class PayHistoryTests(SimpleTestCase):
+    async def collect(self, client, *args, **kwargs):
+        return [tx['transactionTime'] async for tx in client.iter_pay_transactions(*args, **kwargs)]
+
+    async def test_window_is_split_into_inclusive_slices(self):
+        client = HistoryPayClient([0, 99, 100, 250, 299])
+
+        self.assertEqual(sorted(await self.collect(client, 1, 299, slice_ms=100)), [99, 100, 250, 299])
+        self.assertEqual(sorted(client.requests), [(1, 100), (101, 200), (201, 299)])
+
+    async def test_full_slices_are_split_until_complete(self):
+        times = list(range(10, 20)) + [500]
+        client = HistoryPayClient(times)
+
+        self.assertEqual(sorted(await self.collect(client, 1, 1000, limit=3)), times)
+        self.assertIn((1, 1000), client.requests)
+        self.assertGreater(len(client.requests), 4)
+
+    async def test_full_pages_are_kept_and_only_the_rest_is_refetched(self):
+        times = list(range(100, 130))
+        for newest_first in (False, True):
+            client = HistoryPayClient(times, newest_first=newest_first)
+
+            self.assertEqual(sorted(await self.collect(client, 1, 1000, limit=10)), times)
+            self.assertEqual(len(client.requests), 7)
+
+    async def test_full_single_millisecond_slice_is_kept_with_a_warning(self):
+        client = HistoryPayClient([5, 5, 5])
+
+        with self.assertLogs('apps.payments.binance_pay', 'WARNING'):
+            self.assertEqual(await self.collect(client, 5, 6, limit=2), [5, 5])
+
+    async def test_slices_are_fetched_concurrently_up_to_the_limit(self):
+        client = HistoryPayClient(range(1000, 2000, 10))
+
+        self.assertEqual(len(await self.collect(client, 1000, 1999, slice_ms=50, concurrency=4)), 100)
+        self.assertEqual(len(client.requests), 20)
+        self.assertEqual(client.max_in_flight, 4)
+
+        client = HistoryPayClient(range(1000, 2000, 10))
+        await self.collect(client, 1000, 1999, slice_ms=50)
+        self.assertEqual(client.max_in_flight, BinancePayAPI.HISTORY_CONCURRENCY)
+
+    async def test_slices_never_exceed_the_history_window(self):
+        client = HistoryPayClient()
+        window = BinancePayAPI.MAX_HISTORY_WINDOW_MS
+
+        await self.collect(client, 1, 2 * window, slice_ms=10 * window)
+        self.assertEqual(sorted(client.requests), [(1, window), (window + 1, 2 * window)])
+
+    async def test_failed_slice_stops_the_iteration(self):
+        client = HistoryPayClient([10], fail_on=(101, 200))
+
+        with self.assertRaises(BinancePayError):
+            await self.collect(client, 1, 1000, slice_ms=100)
+        client.fail_on = (1, 1000)
+        with self.assertLogs('apps.payments.binance_pay', 'ERROR'):
+            self.assertIsNone(await client.get_pay_transaction_history(1, 1000))
+
+    async def test_history_lists_every_transaction(self):
+        client = HistoryPayClient(range(1, 301))
+
+        history = await client.get_pay_transaction_history(1, 1000)
+        self.assertEqual(sorted(tx['transactionTime'] for tx in history), list(range(1, 301)))
+
+    async def test_error_response_raises(self):
+        client = BinancePayAPI(api_key='key', api_secret='secret')
+
+        with mock.patch.object(binance_pay.binance_session, 'get', return_value=(400, {'code': -1102})):
+            with self.assertRaises(BinancePayError):
+                await client._fetch_pay_transactions(1, 2, 100)
+        with mock.patch.object(binance_pay.binance_session, 'get', return_value=(200, {'data': [pay_tx('A1')]})) as get:
+            self.assertEqual(len(await client._fetch_pay_transactions(1, 2, 100)), 1)
+        url = get.call_args.args[0]
+        self.assertIn('/sapi/v1/pay/transactions?startTime=1&endTime=2&limit=100', url)
+        self.assertIn('&signature=', url)
+        self.assertEqual(get.call_args.kwargs['weight'], BinancePayAPI.HISTORY_WEIGHT)
+
+
+class BinanceSessionTests(StubBinanceMixin, SimpleTestCase):
+    def test_requests_reuse_one_keep_alive_connection(self):
+        self.binance.response = (200, {'data': []}, {})
+
+        self.assertEqual(self.get(), (200, {'data': []}))
+        self.get()
+        asyncio.run(self.session.get(f'{self.binance.base_url}/', headers={}, weight={'sapi_ip': 1}))
+        self.assertEqual(len(self.binance.peers), 3)
+        self.assertEqual(len(set(self.binance.peers)), 1)
+
+    def test_close_stops_the_loop_and_a_new_request_restarts_it(self):
+        self.get()
+        thread = self.session._thread
+
+        self.session.close()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.get()[0], 200)
+        self.assertIsNot(self.session._thread, thread)
+        self.assertEqual(len(set(self.binance.peers)), 2)
+
+    def test_test_connection_uses_the_pooled_session(self):
+        client = BinancePayAPI(api_key='key', api_secret='secret')
+
+        with mock.patch.object(client, 'BASE_URL', self.binance.base_url), \
+                mock.patch.object(binance_pay, 'binance_session', self.session):
+            self.assertTrue(async_to_sync(client.test_connection)())
+            self.binance.response = (401, {'code': -2015}, {})
+            self.assertFalse(async_to_sync(client.test_connection)())
+        self.assertEqual(len(set(self.binance.peers)), 1)
+
+
+class PayClientTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, binance_pay, '_client', None)
+        binance_pay._client = None
+        self.settings = PaymentSettings.objects.create(
+            binance_api_key='key', binance_api_secret='secret', binance_enabled=True
+        )
+
+    def test_client_is_reused_until_the_credentials_change(self):
+        client = get_pay_client(self.settings)
+        self.assertIs(get_pay_client(self.settings), client)
+        self.assertEqual((client.api_key, client.api_secret), ('key', 'secret'))
+
+        self.settings.binance_api_secret = 'rotated'
+        self.settings.save()
+        rotated = get_pay_client(self.settings)
+        self.assertIsNot(rotated, client)
+        self.assertEqual(rotated.api_secret, 'rotated')
+        self.assertIs(get_pay_client(PaymentSettings.objects.get()), rotated)
+
+    async def test_from_settings_requires_binance_enabled(self):
+        client = await BinancePayAPI.from_settings()
+        self.assertIs(client, await BinancePayAPI.from_settings())
+        self.assertEqual(client.api_key, 'key')
+
+        await PaymentSettings.objects.aupdate(binance_enabled=False)
+        self.assertIsNone(await BinancePayAPI.from_settings())
+
+
+class FakeClock:
+    """Stands in for ``time`` and ``asyncio.sleep`` in the weight module"""
+
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class WeightTrackerTests(SimpleTestCase):
+    def setUp(self):
+        # 55 seconds into a minute, so the next one is 5 seconds away
+        self.clock = FakeClock(1_000_000 * 60 + 55)
+        for patcher in (
+            mock.patch.object(weight, 'time', SimpleNamespace(time=self.clock.time)),
+            mock.patch.object(weight, 'asyncio', SimpleNamespace(sleep=self.clock.sleep)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tracker = WeightTracker({'sapi_uid': 10000, 'sapi_ip': 100})
+
+    def test_used_weight_headers_are_parsed(self):
+        self.tracker.update({
+            'X-MBX-USED-WEIGHT-1M': '120',
+            'x-sapi-used-ip-weight-1m': '30',
+            'X-SAPI-USED-UID-WEIGHT-1M': '6000',
+            'X-MBX-USED-WEIGHT': '7',
+            'X-SAPI-USED-UID-WEIGHT-1M-EXTRA': '1',
+            'Content-Type': 'application/json',
+        }, 200)
+        self.assertEqual(self.tracker.used, {'mbx_ip': 120, 'sapi_ip': 30, 'sapi_uid': 6000})
+
+        self.tracker.update({'X-SAPI-USED-IP-WEIGHT-1M': 'n/a'}, 200)
+        self.assertEqual(self.tracker.used['sapi_ip'], 30)
+
+    def test_counters_reset_on_the_minute(self):
+        self.tracker.update({'X-SAPI-USED-UID-WEIGHT-1M': '6000'}, 200)
+        self.clock.now += 4
+        self.assertEqual(self.tracker.stats()['counters']['sapi_uid']['used'], 6000)
+
+        self.clock.now += 2
+        self.assertEqual(self.tracker.stats()['counters']['sapi_uid']['used'], 0)
+
+    def test_throttled_response_blocks_until_retry_after(self):
+        self.tracker.update({'Retry-After': '30'}, 429)
+
+        with self.assertRaises(WeightLimitExceeded) as raised:
+            async_to_sync(self.tracker.acquire)({'sapi_ip': 1})
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertEqual(self.tracker.stats()['blocked_for'], 30)
+
+        self.clock.now += 30
+        async_to_sync(self.tracker.acquire)({'sapi_ip': 1})
+        self.assertEqual(self.tracker.rejected, 1)
+
+    def test_ban_without_retry_after_lasts_the_default(self):
+        self.tracker.update({}, 418)
+        self.tracker.update({'Retry-After': 'soon'}, 429)
+
+        stats = self.tracker.stats()
+        self.assertEqual(stats['blocked_for'], weight.DEFAULT_RETRY_AFTER)
+        self.assertEqual(stats['throttled_responses'], {'418': 1, '429': 1})
+
+    def test_short_ban_is_waited_out(self):
+        self.tracker.update({'Retry-After': '3'}, 429)
+
+        async_to_sync(self.tracker.acquire)({'sapi_ip': 1})
+        self.assertEqual(self.clock.slept, [3])
+        self.assertEqual(self.tracker.delayed, 1)
+
+    def test_call_over_the_headroom_waits_for_the_next_minute(self):
+        self.tracker.update({'X-SAPI-USED-UID-WEIGHT-1M': str(int(10000 * HEADROOM) - 2000)}, 200)
+
+        async_to_sync(self.tracker.acquire)({'sapi_uid': 2000})
+        self.assertEqual(self.clock.slept, [])
+        self.tracker.release({'sapi_uid': 2000})
+
+        async_to_sync(self.tracker.acquire)({'sapi_uid': 2001})
+        self.assertEqual(self.clock.slept, [5])
+        self.assertEqual(self.tracker.stats()['counters']['sapi_uid']['in_flight'], 2001)
+
+    def test_call_too_far_from_the_next_minute_is_rejected(self):
+        self.clock.now -= 50
+        self.tracker.update({'X-SAPI-USED-UID-WEIGHT-1M': '9000'}, 200)
+
+        with self.assertRaises(WeightLimitExceeded) as raised:
+            async_to_sync(self.tracker.acquire)({'sapi_uid': 3000})
+        self.assertEqual(raised.exception.retry_after, 55)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_calls_in_flight_count_against_the_budget(self):
+        self.clock.now -= 50
+        for _ in range(3):
+            async_to_sync(self.tracker.acquire)({'sapi_uid': 3000})
+
+        with self.assertRaises(WeightLimitExceeded):
+            async_to_sync(self.tracker.acquire)({'sapi_uid': 3000})
+        self.tracker.release({'sapi_uid': 3000})
+        async_to_sync(self.tracker.acquire)({'sapi_uid': 3000})
+
+    def test_counters_without_a_limit_are_not_budgeted(self):
+        async_to_sync(self.tracker.acquire)({'mbx_ip': 10 ** 6})
+        self.assertEqual(self.clock.slept, [])
+
+
+class SessionWeightTests(StubBinanceMixin, SimpleTestCase):
+    def test_responses_update_the_session_budget(self):
+        self.binance.response = (200, {}, {'X-SAPI-USED-IP-WEIGHT-1M': '42'})
+
+        self.get()
+        counters = self.session.weight_stats()['counters']
+        self.assertEqual(counters['sapi_ip']['used'], 42)
+        self.assertEqual(counters['sapi_ip']['in_flight'], 0)
+
+    def test_no_call_is_made_after_a_429(self):
+        self.binance.response = (429, {'code': -1003}, {'Retry-After': '120'})
+
+        self.assertEqual(self.get()[0], 429)
+        with self.assertRaises(WeightLimitExceeded) as raised:
+            self.get()
+        self.assertEqual(raised.exception.retry_after, 120)
+        self.assertEqual(len(self.binance.peers), 1)
+
+
+class SyncWeightLimitTests(TestCase):
+    async def test_weight_limit_mid_sync_keeps_the_slices_received(self):
+        start_time = now_ms() - 25 * HOUR_MS
+        client = HistoryPayClient(
+            [start_time + hour * HOUR_MS + HOUR_MS // 2 for hour in range(25)],
+            fail_on=(start_time + 10 * HOUR_MS, start_time + 11 * HOUR_MS - 1),
+            error=WeightLimitExceeded('Binance request weight limit reached', 30)
+        )
+        client.MAX_HISTORY_WINDOW_MS = HOUR_MS
+
+        with self.assertRaises(WeightLimitExceeded):
+            await sync_ledger(client, start_time=start_time)
+        self.assertEqual(await BinancePayLedgerEntry.objects.acount(), 24)
+        self.assertFalse(await BinancePayLedgerEntry.objects.filter(
+            transaction_time=start_time + 10 * HOUR_MS + HOUR_MS // 2
+        ).aexists())
+
+
+class WeightViewTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        self.http = APIClient()
+        self.http.force_authenticate(user)
+        PaymentSettings.objects.create(pk=1, binance_api_key='key', binance_api_secret='secret', binance_enabled=True)
+        weights = binance_pay.binance_session.weights
+        self.addCleanup(setattr, weights, 'blocked_until', weights.blocked_until)
+
+    def test_weight_usage_reports_the_session_budget(self):
+        response = self.http.get('/api/payments/settings/weight_usage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['data']['counters']), {'mbx_ip', 'sapi_ip', 'sapi_uid'})
+
+    def test_exhausted_budget_is_answered_with_retry_after(self):
+        binance_pay.binance_session.weights.blocked_until = time.time() + 41.5
+
+        response = self.http.post('/api/payments/settings/test_connection/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '42')
+        self.assertFalse(response.data['success'])
+
+
+class LedgerTests(TestCase):
+    def test_store_skips_records_already_in_the_ledger(self):
+        store_transactions([pay_tx('A1'), pay_tx('A2')])
+        store_transactions([pay_tx('A1'), pay_tx('A3'), {'transactionId': 'no-order'}])
+
+        self.assertEqual(
+            sorted(BinancePayLedgerEntry.objects.values_list('order_id', flat=True)), ['A1', 'A2', 'A3']
+        )
+        entry = BinancePayLedgerEntry.objects.get(order_id='A1')
+        self.assertEqual(entry.payer_name, 'Payer')
+        self.assertEqual(entry.payer_binance_id, '42')
+        self.assertEqual(entry.raw['transactionId'], 'T-A1')
+
+    def test_watermark_is_the_latest_transaction_time(self):
+        self.assertIsNone(get_watermark())
+        store_transactions([pay_tx('A1', transaction_time=1000), pay_tx('A2', transaction_time=3000)])
+        self.assertEqual(get_watermark(), 3000)
+
+    def test_lookup_ignores_outgoing_and_other_currencies(self):
+        store_transactions([
+            pay_tx('A1', amount='-10', transaction_id='out'),
+            pay_tx('A1', currency='BUSD', transaction_id='busd'),
+            pay_tx('A1', transaction_time=1000, transaction_id='old'),
+            pay_tx('A1', transaction_time=2000, transaction_id='new'),
+        ])
+
+        self.assertEqual(find_incoming_transaction('A1', 'USDT')['transactionId'], 'new')
+        self.assertIsNone(find_incoming_transaction('A1', 'BNB'))
+        self.assertIsNone(find_incoming_transaction('A2', 'USDT'))
+        index = index_incoming_transactions(['A1', 'A2'])
+        self.assertEqual(index[('A1', 'USDT')]['transactionId'], 'new')
+        self.assertEqual(index[('A1', 'BUSD')]['transactionId'], 'busd')
+        self.assertEqual(len(index), 2)
+
+    async def test_empty_ledger_backfills(self):
+        client = FakePayClient([pay_tx('A1')])
+        before = now_ms()
+        self.assertEqual(await sync_ledger(client), 1)
+
+        (start_time, end_time), = client.calls
+        self.assertAlmostEqual(start_time, before - BACKFILL_MS, delta=5000)
+        self.assertEqual(end_time - start_time, BACKFILL_MS)
+        self.assertEqual(await BinancePayLedgerEntry.objects.acount(), 1)
+
+    async def test_sync_resumes_before_the_watermark(self):
+        watermark = now_ms() - HOUR_MS
+        await sync_to_async(store_transactions)([pay_tx('A1', transaction_time=watermark)])
+        client = FakePayClient([pay_tx('A1', transaction_time=watermark), pay_tx('A2')])
+
+        self.assertEqual(await sync_ledger(client), 2)
+        self.assertEqual(client.calls[0][0], watermark - SYNC_OVERLAP_MS)
+        self.assertEqual(await BinancePayLedgerEntry.objects.acount(), 2)
+
+    async def test_idle_ledger_starts_at_most_the_backfill_window_back(self):
+        await sync_to_async(store_transactions)([pay_tx('A1', transaction_time=now_ms() - 7 * 24 * HOUR_MS)])
+        client = FakePayClient()
+
+        await sync_ledger(client)
+        start_time, end_time = client.calls[0]
+        self.assertEqual(end_time - start_time, BACKFILL_MS)
+
+    async def test_explicit_start_time_is_used_as_is(self):
+        client = FakePayClient()
+        await sync_ledger(client, start_time=1234)
+        self.assertEqual(client.calls[0][0], 1234)
+
+    async def test_failed_sync_keeps_the_records_received(self):
+        client = FakePayClient([pay_tx('A1'), pay_tx('A2'), pay_tx('A3')], fail_after=2)
+
+        with self.assertLogs('apps.payments.ledger', 'ERROR'):
+            self.assertIsNone(await sync_ledger(client))
+        self.assertEqual(await BinancePayLedgerEntry.objects.acount(), 2)
+
+    async def test_weight_limit_keeps_the_records_received(self):
+        client = FakePayClient(
+            [pay_tx('A1'), pay_tx('A2'), pay_tx('A3')], fail_after=2,
+            error=WeightLimitExceeded('Binance request weight limit reached', 30)
+        )
+
+        with self.assertRaises(WeightLimitExceeded):
+            await sync_ledger(client)
+        self.assertEqual(await BinancePayLedgerEntry.objects.acount(), 2)
+
+    async def test_records_are_stored_in_batches(self):
+        client = FakePayClient([pay_tx(f'A{i}') for i in range(5)])
+
+        with mock.patch.object(ledger, 'STORE_BATCH_SIZE', 2), \
+                mock.patch.object(ledger, 'store_transactions', wraps=store_transactions) as store:
+            self.assertEqual(await sync_ledger(client), 5)
+        self.assertEqual([len(call.args[0]) for call in store.call_args_list], [2, 2, 1])
+
+
+class VerifyPaymentTests(TestCase):
+    async def verify(self, client, order_id='A1', amount=10, max_age_hours=1):
+        return await client.verify_payment_by_binance_order_id(order_id, amount, 'USDT', max_age_hours)
+
+    async def test_order_in_the_ledger_is_verified_without_calling_binance(self):
+        await sync_to_async(store_transactions)([pay_tx('A1')])
+        client = FakePayClient()
+
+        result = await self.verify(client)
+        self.assertTrue(result['verified'])
+        self.assertEqual(result['transaction_id'], 'T-A1')
+        self.assertEqual(result['from_account'], 'Payer')
+        self.assertEqual(client.calls, [])
+
+    async def test_missing_order_refreshes_the_verification_window(self):
+        client = FakePayClient([pay_tx('A1')])
+        before = now_ms()
+
+        self.assertTrue((await self.verify(client, max_age_hours=3))['verified'])
+        self.assertAlmostEqual(client.calls[0][0], before - 4 * HOUR_MS, delta=5000)
+
+    async def test_order_received_before_a_failed_sync_is_verified(self):
+        client = FakePayClient([pay_tx('A1'), pay_tx('A2')], fail_after=1)
+
+        with self.assertLogs('apps.payments.ledger', 'ERROR'):
+            result = await self.verify(client)
+        self.assertTrue(result['verified'])
+
+    async def test_failed_sync_without_the_order_is_reported_unavailable(self):
+        client = FakePayClient([pay_tx('A2')], fail_after=1)
+
+        with self.assertLogs('apps.payments.ledger', 'ERROR'), self.assertLogs('apps.payments.binance_pay', 'WARNING'):
+            result = await self.verify(client)
+        self.assertEqual(result, {'verified': False, 'error': 'Unable to retrieve transaction history'})
+
+    async def test_unknown_order_is_not_found(self):
+        with self.assertLogs('apps.payments.binance_pay', 'ERROR'):
+            result = await self.verify(FakePayClient([pay_tx('A2')]))
+        self.assertFalse(result['verified'])
+        self.assertIn('not found in recent payments', result['error'])
+
+    async def test_amount_and_age_are_checked(self):
+        await sync_to_async(store_transactions)([
+            pay_tx('A1', amount='9.5'),
+            pay_tx('A2', transaction_time=now_ms() - 2 * HOUR_MS),
+        ])
+        client = FakePayClient()
+
+        with self.assertLogs('apps.payments.binance_pay', 'WARNING'):
+            self.assertIn('Amount mismatch', (await self.verify(client, 'A1'))['error'])
+            self.assertIn('too old', (await self.verify(client, 'A2'))['error'])
+        self.assertTrue((await self.verify(client, 'A2', max_age_hours=3))['verified'])
+
+
+def batch_payment(order_id, amount='10', currency='USDT', max_age_hours=1):
+    return {'binance_order_id': order_id, 'expected_amount': amount, 'currency': currency, 'max_age_hours': max_age_hours}
+
+
+class BatchVerifyTests(TestCase):
+    async def test_orders_in_the_ledger_are_verified_without_calling_binance(self):
+        await sync_to_async(store_transactions)([pay_tx('A1'), pay_tx('A2', amount='5')])
+        client = FakePayClient()
+
+        with self.assertLogs('apps.payments.binance_pay', 'ERROR'):
+            results = await client.verify_payments_by_binance_order_ids([batch_payment('A1'), batch_payment('A2')])
+        self.assertTrue(results['A1']['verified'])
+        self.assertIn('Amount mismatch', results['A2']['error'])
+        self.assertEqual(client.calls, [])
+
+    async def test_missing_orders_share_one_refresh_over_the_widest_window(self):
+        await sync_to_async(store_transactions)([pay_tx('A1')])
+        client = FakePayClient([pay_tx('A2'), pay_tx('A3', currency='BUSD')])
+        before = now_ms()
+
+        results = await client.verify_payments_by_binance_order_ids([
+            batch_payment('A1', max_age_hours=24),
+            batch_payment('A2', max_age_hours=2),
+            batch_payment('A3', max_age_hours=3),
+            batch_payment('A4'),
+        ])
+        self.assertEqual(len(client.calls), 1)
+        self.assertAlmostEqual(client.calls[0][0], before - 4 * HOUR_MS, delta=5000)
+        self.assertEqual({order_id: result['verified'] for order_id, result in results.items()},
+                         {'A1': True, 'A2': True, 'A3': False, 'A4': False})
+        self.assertIn('not found in recent payments', results['A3']['error'])
+        self.assertTrue(results['A3']['retryable'])
+        self.assertNotIn('retryable', results['A1'])
+
+    async def test_failed_refresh_only_marks_orders_still_missing_unavailable(self):
+        client = FakePayClient([pay_tx('A1'), pay_tx('A2')], fail_after=1)
+
+        with self.assertLogs('apps.payments.ledger', 'ERROR'):
+            results = await client.verify_payments_by_binance_order_ids([batch_payment('A1'), batch_payment('A2')])
+        self.assertTrue(results['A1']['verified'])
+        self.assertEqual(results['A2'], {
+            'verified': False, 'retryable': True, 'error': 'Unable to retrieve transaction history'
+        })
+
+
+class BatchVerifyViewTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction can't be used after the IntegrityError of a conflict
+    url = '/api/payments/transactions/verify_payments/'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        self.http = APIClient()
+        self.http.force_authenticate(self.user)
+        PaymentSettings.objects.create(pk=1, binance_api_key='key', binance_api_secret='secret', binance_enabled=True)
+        self.pay_client = FakePayClient()
+        patcher = mock.patch('apps.payments.views.get_pay_client', return_value=self.pay_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, *payments):
+        return self.http.post(self.url, {'payments': list(payments)}, format='json')
+
+    def test_duplicate_order_ids_are_rejected(self):
+        serializer = BatchVerifyPaymentSerializer(data={'payments': [batch_payment('A1'), batch_payment('A1', '5')]})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('payments', serializer.errors)
+
+        response = self.post(batch_payment('A1'), batch_payment('A1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('payments', response.data['errors'])
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_batch_verification_is_admin_only(self):
+        buyer = get_user_model().objects.create_user(username='buyer', email='buyer@example.com')
+        self.http.force_authenticate(buyer)
+
+        self.assertEqual(self.post(batch_payment('A1')).status_code, 403)
+        self.assertEqual(self.pay_client.calls, [])
+
+    def test_batch_size_is_bounded(self):
+        self.assertEqual(self.post().status_code, 400)
+        self.assertEqual(self.post(*(batch_payment(f'A{i}') for i in range(101))).status_code, 400)
+
+    def test_definitive_results_are_recorded_together(self):
+        store_transactions([pay_tx('A1'), pay_tx('A2', amount='5')])
+        PaymentTransaction.objects.create(binance_order_id='A3', amount='10', status='verified')
+
+        with self.assertNumQueries(7), self.assertLogs('apps.payments.binance_pay', 'ERROR'):
+            response = self.post(batch_payment('A1'), batch_payment('A2'), batch_payment('A3'), batch_payment('A4'))
+        self.assertEqual(response.status_code, 200)
+        results = {result['binance_order_id']: result for result in response.data['data']['results']}
+        self.assertTrue(results['A1']['verified'])
+        self.assertEqual(results['A1']['transaction']['status'], 'verified')
+        self.assertIn('Amount mismatch', results['A2']['message'])
+        self.assertEqual(results['A3']['message'], 'This payment has already been processed')
+        self.assertIn('not found in recent payments', results['A4']['message'])
+        self.assertIsNone(results['A4']['transaction'])
+        self.assertEqual(response.data['data']['summary'], {
+            'total': 4, 'verified': 1, 'failed': 1, 'already_processed': 1, 'not_recorded': 1
+        })
+        self.assertEqual(
+            dict(PaymentTransaction.objects.values_list('binance_order_id', 'status')),
+            {'A1': 'verified', 'A2': 'failed', 'A3': 'verified'}
+        )
+        self.assertIsNone(PaymentTransaction.objects.get(binance_order_id='A1').user)
+
+    def test_lookup_failures_are_not_recorded(self):
+        self.pay_client.transactions = [pay_tx('A1')]
+        self.pay_client.fail_after = 1
+
+        with self.assertLogs('apps.payments.ledger', 'ERROR'):
+            response = self.post(batch_payment('A1'), batch_payment('A2'))
+        self.assertEqual(response.status_code, 200)
+        results = {result['binance_order_id']: result for result in response.data['data']['results']}
+        self.assertTrue(results['A1']['verified'])
+        self.assertEqual(results['A2']['message'], 'Unable to retrieve transaction history')
+        self.assertEqual(list(PaymentTransaction.objects.values_list('binance_order_id', flat=True)), ['A1'])
+
+        # The order can be verified once Binance answers again
+        self.pay_client.transactions = [pay_tx('A2')]
+        self.pay_client.fail_after = None
+        response = self.post(batch_payment('A2'))
+        self.assertTrue(response.data['data']['results'][0]['verified'])
+        self.assertEqual(PaymentTransaction.objects.count(), 2)
+
+    def test_order_recorded_by_a_concurrent_request_is_a_conflict(self):
+        store_transactions([pay_tx('A1'), pay_tx('A2')])
+        verify = self.pay_client.verify_payments_by_binance_order_ids
+
+        async def racing_verify(payments):
+            await PaymentTransaction.objects.acreate(binance_order_id='A2', amount='10', status='verified')
+            return await verify(payments)
+
+        with mock.patch.object(self.pay_client, 'verify_payments_by_binance_order_ids', racing_verify):
+            response = self.post(batch_payment('A1'), batch_payment('A2'))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(PaymentTransaction.objects.values_list('binance_order_id', flat=True)), ['A2'])
+
+    def test_exhausted_weight_budget_records_nothing(self):
+        self.pay_client.fail_after = 0
+        self.pay_client.error = WeightLimitExceeded('Binance request weight limit reached', 30)
+
+        response = self.post(batch_payment('A1'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_disabled_binance_pay_is_rejected(self):
+        PaymentSettings.objects.update(binance_enabled=False)
+
+        response = self.post(batch_payment('A1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], 'Binance Pay is not enabled')
@@ -2,15 +2,56 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.db import IntegrityError
 from django.utils import timezone
 from asgiref.sync import async_to_sync
 from .models import PaymentSettings, PaymentTransaction
 from .serializers import (
     PaymentSettingsSerializer, 
     PaymentTransactionSerializer,
-    VerifyPaymentSerializer
+    VerifyPaymentSerializer,
+    BatchVerifyPaymentSerializer
 )
-from .binance_pay import BinancePayAPI
+from .binance_pay import binance_session, get_pay_client
+from .weight import WeightLimitExceeded
+
+
+def weight_limited_response(e):
+    """429 telling the client when to retry, returned instead of calling Binance"""
+    response = Response({
+        'success': False,
+        'message': str(e)
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def transaction_from_result(user, payment, result):
+    """Unsaved transaction record for a verification result (verified or failed)"""
+    if result and result.get('verified'):
+        return PaymentTransaction(
+            user=user,
+            binance_order_id=payment['binance_order_id'],
+            transaction_id=result.get('transaction_id', ''),
+            amount=result.get('amount'),
+            currency=result.get('currency'),
+            status='verified',
+            from_account=result.get('from_account', ''),
+            payer_binance_id=result.get('payer_binance_id', ''),
+            order_type=result.get('order_type', ''),
+            transaction_time=result.get('transaction_time'),
+            verified_at=timezone.now(),
+            metadata=result
+        )
+    return PaymentTransaction(
+        user=user,
+        binance_order_id=payment['binance_order_id'],
+        amount=payment['expected_amount'],
+        currency=payment['currency'],
+        status='failed',
+        notes=result.get('error', 'Verification failed') if result else 'Verification failed',
+        metadata=result or {}
+    )
 
 
 class PaymentSettingsViewSet(viewsets.ModelViewSet):
@@ -55,10 +96,7 @@ class PaymentSettingsViewSet(viewsets.ModelViewSet):
                     'message': 'Binance Pay is not enabled'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            client = BinancePayAPI(
-                api_key=settings.binance_api_key,
-                api_secret=settings.binance_api_secret
-            )
+            client = get_pay_client(settings)
             
             result = async_to_sync(client.test_connection)()
             
@@ -73,11 +111,21 @@ class PaymentSettingsViewSet(viewsets.ModelViewSet):
                     'message': 'Connection failed. Please check your API credentials.'
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
+        except WeightLimitExceeded as e:
+            return weight_limited_response(e)
         except Exception as e:
             return Response({
                 'success': False,
                 'message': f'Connection test failed: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['get'])
+    def weight_usage(self, request):
+        """Binance request weight used in the current minute by this worker's client"""
+        return Response({
+            'success': True,
+            'data': binance_session.weight_stats()
+        })
 
 
 class PaymentTransactionViewSet(viewsets.ModelViewSet):
@@ -136,11 +184,8 @@ class PaymentTransactionViewSet(viewsets.ModelViewSet):
                     'data': PaymentTransactionSerializer(existing).data
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Initialize Binance Pay client
-            client = BinancePayAPI(
-                api_key=settings.binance_api_key,
-                api_secret=settings.binance_api_secret
-            )
+            # Get the Binance Pay client
+            client = get_pay_client(settings)
             
             # Verify payment
             result = async_to_sync(client.verify_payment_by_binance_order_id)(
@@ -150,49 +195,127 @@ class PaymentTransactionViewSet(viewsets.ModelViewSet):
                 max_age_hours=serializer.validated_data['max_age_hours']
             )
             
-            if result and result.get('verified'):
-                # Create transaction record
-                transaction = PaymentTransaction.objects.create(
-                    user=request.user,
-                    binance_order_id=binance_order_id,
-                    transaction_id=result.get('transaction_id', ''),
-                    amount=result.get('amount'),
-                    currency=result.get('currency'),
-                    status='verified',
-                    from_account=result.get('from_account', ''),
-                    payer_binance_id=result.get('payer_binance_id', ''),
-                    order_type=result.get('order_type', ''),
-                    transaction_time=result.get('transaction_time'),
-                    verified_at=timezone.now(),
-                    metadata=result
-                )
-                
+            # Record the verification result
+            transaction = transaction_from_result(request.user, serializer.validated_data, result)
+            transaction.save()
+            
+            if transaction.status == 'verified':
                 return Response({
                     'success': True,
                     'message': 'Payment verified successfully',
                     'data': PaymentTransactionSerializer(transaction).data
                 })
             else:
-                # Record failed verification
-                transaction = PaymentTransaction.objects.create(
-                    user=request.user,
-                    binance_order_id=binance_order_id,
-                    amount=serializer.validated_data['expected_amount'],
-                    currency=serializer.validated_data['currency'],
-                    status='failed',
-                    notes=result.get('error', 'Verification failed') if result else 'Verification failed',
-                    metadata=result or {}
-                )
-                
                 return Response({
                     'success': False,
                     'message': result.get('error', 'Payment verification failed') if result else 'Verification failed',
                     'data': PaymentTransactionSerializer(transaction).data
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
+        except WeightLimitExceeded as e:
+            # Nothing is recorded, so the order can be verified again later
+            return weight_limited_response(e)
+        except Exception as e:
+            return Response({
+                'success': False,
+                'message': f'Verification error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def verify_payments(self, request):
+        """
+        Verify a batch of Binance Pay payments with one history refresh (admin only).
+        
+        Only verified payments and definitive rejections are recorded, without
+        an owner. Orders that weren't found or couldn't be looked up are
+        reported but not recorded, so they can be verified again later.
+        """
+        serializer = BatchVerifyPaymentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'message': 'Validation error',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            # Check if payment settings are configured
+            settings = PaymentSettings.objects.first()
+            if not settings or not settings.binance_enabled:
+                return Response({
+                    'success': False,
+                    'message': 'Binance Pay is not enabled'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Skip order IDs that were already processed
+            payments = serializer.validated_data['payments']
+            existing = {
+                transaction.binance_order_id: transaction
+                for transaction in PaymentTransaction.objects.filter(
+                    binance_order_id__in=[payment['binance_order_id'] for payment in payments]
+                )
+            }
+            pending = [payment for payment in payments if payment['binance_order_id'] not in existing]
+            
+            # Verify the rest together
+            results = {}
+            if pending:
+                client = get_pay_client(settings)
+                results = async_to_sync(client.verify_payments_by_binance_order_ids)(pending)
+            
+            # Record the definitive results at once
+            transactions = PaymentTransaction.objects.bulk_create([
+                transaction_from_result(None, payment, results[payment['binance_order_id']])
+                for payment in pending
+                if results.get(payment['binance_order_id']) and not results[payment['binance_order_id']].get('retryable')
+            ])
+            created = {transaction.binance_order_id: transaction for transaction in transactions}
+            
+            data = []
+            for payment in payments:
+                binance_order_id = payment['binance_order_id']
+                if binance_order_id in existing:
+                    data.append({
+                        'binance_order_id': binance_order_id,
+                        'verified': False,
+                        'message': 'This payment has already been processed',
+                        'transaction': PaymentTransactionSerializer(existing[binance_order_id]).data
+                    })
+                    continue
+                transaction = created.get(binance_order_id)
+                result = results.get(binance_order_id) or {}
+                verified = transaction is not None and transaction.status == 'verified'
+                data.append({
+                    'binance_order_id': binance_order_id,
+                    'verified': verified,
+                    'message': 'Payment verified successfully' if verified else result.get('error', 'Payment verification failed'),
+                    'transaction': PaymentTransactionSerializer(transaction).data if transaction else None
+                })
+            
+            return Response({
+                'success': True,
+                'data': {
+                    'results': data,
+                    'summary': {
+                        'total': len(payments),
+                        'verified': sum(1 for transaction in transactions if transaction.status == 'verified'),
+                        'failed': sum(1 for transaction in transactions if transaction.status == 'failed'),
+                        'already_processed': len(existing),
+                        'not_recorded': len(pending) - len(transactions),
+                    }
+                }
+            })
+            
+        except IntegrityError:
+            return Response({
+                'success': False,
+                'message': 'Some of these payments were processed by another request. Please retry the batch.'
+            }, status=status.HTTP_409_CONFLICT)
+        except WeightLimitExceeded as e:
+            # Nothing is recorded, so the batch can be verified again later
+            return weight_limited_response(e)
         except Exception as e:
             return Response({
                 'success': False,
                 'message': f'Verification error: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
@@ -0,0 +1,149 @@
+"""
+Request-weight budget for Binance API calls.
+
+Binance counts the weight of requests per minute, per IP and (for SAPI
+endpoints such as Binance Pay) per account, and reports the running totals
+in ``X-MBX-USED-WEIGHT-1M``, ``X-SAPI-USED-IP-WEIGHT-1M`` and
+``X-SAPI-USED-UID-WEIGHT-1M`` response headers. Going over a limit is
+answered with 429, and calls made after a 429 get the IP banned (418),
+which would stop every payment verification.
+
+``WeightTracker`` keeps the last reported totals for the current minute plus
+the weight of calls still in flight. A call that would take a counter past
+``HEADROOM`` of its limit waits for the next minute, or raises
+``WeightLimitExceeded`` if that is more than ``MAX_DELAY`` seconds away.
+After a 418/429 no call is made until its ``Retry-After`` has passed.
+
+All tracker state lives on the Binance session loop.
+"""
+
+import asyncio
+import math
+import re
+import time
+from collections import Counter
+from typing import Dict
+
+USED_WEIGHT_HEADER = re.compile(r'^x-(mbx|sapi)-used-(?:(ip|uid)-)?weight-1m$')
+
+# Per-minute limits by counter, as published by Binance
+WEIGHT_LIMITS = {
+    'mbx_ip': 6000,
+    'sapi_ip': 12000,
+    'sapi_uid': 180000,
+}
+
+# Share of a limit calls may use; the rest is left for rounding and other clients of the key
+HEADROOM = 0.9
+
+# Longest a call waits for budget before it is rejected, in seconds
+MAX_DELAY = 10
+
+# Ban length assumed when a 418/429 carries no Retry-After, in seconds
+DEFAULT_RETRY_AFTER = 60
+
+
+class WeightLimitExceeded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def current_minute():
+    return int(time.time() // 60)
+
+
+def seconds_to_next_minute():
+    return 60 - time.time() % 60
+
+
+class WeightTracker:
+    """Used request weight per Binance counter for the current minute."""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or WEIGHT_LIMITS)
+        self.used = {}
+        self.minute = current_minute()
+        self.reserved = Counter()
+        self.blocked_until = 0.0
+        self.delayed = 0
+        self.rejected = 0
+        self.throttled_responses = Counter()
+
+    def _roll(self):
+        """Start a new minute; Binance resets the 1M counters on the minute"""
+        minute = current_minute()
+        if minute != self.minute:
+            self.minute = minute
+            self.used = {}
+
+    def _wait_time(self, weight: Dict[str, int]) -> float:
+        """Seconds until ``weight`` fits in the budget, or 0 if it fits now"""
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        self._roll()
+        for counter, amount in weight.items():
+            limit = self.limits.get(counter)
+            if limit and self.used.get(counter, 0) + self.reserved[counter] + amount > limit * HEADROOM:
+                return seconds_to_next_minute()
+        return 0.0
+
+    async def acquire(self, weight: Dict[str, int]):
+        """Reserve ``weight`` (counter -> weight), waiting for budget or raising ``WeightLimitExceeded``"""
+        delayed = False
+        while True:
+            wait = self._wait_time(weight)
+            if not wait:
+                break
+            if wait > MAX_DELAY:
+                self.rejected += 1
+                raise WeightLimitExceeded('Binance request weight limit reached', math.ceil(wait))
+            if not delayed:
+                self.delayed += 1
+                delayed = True
+            await asyncio.sleep(wait)
+        self.reserved.update(weight)
+
+    def release(self, weight: Dict[str, int]):
+        self.reserved.subtract(weight)
+
+    def update(self, headers, response_status):
+        """Record the used weight reported by a response, and any ban"""
+        self._roll()
+        for name, value in headers.items():
+            match = USED_WEIGHT_HEADER.match(name.lower())
+            if match:
+                family, scope = match.groups()
+                try:
+                    self.used[f"{family}_{scope or 'ip'}"] = int(value)
+                except ValueError:
+                    pass
+
+        if response_status in (418, 429):
+            self.throttled_responses[response_status] += 1
+            try:
+                retry_after = int(headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+            except ValueError:
+                retry_after = DEFAULT_RETRY_AFTER
+            self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+
+    def stats(self):
+        self._roll()
+        now = time.time()
+        return {
+            'counters': {
+                counter: {
+                    'used': self.used.get(counter, 0),
+                    'in_flight': self.reserved[counter],
+                    'limit': limit,
+                    'usage': round(self.used.get(counter, 0) / limit, 4),
+                }
+                for counter, limit in self.limits.items()
+            },
+            'resets_in': round(seconds_to_next_minute(), 1),
+            'blocked_for': round(max(0.0, self.blocked_until - now), 1),
+            'delayed': self.delayed,
+            'rejected': self.rejected,
+            'throttled_responses': {str(code): count for code, count in self.throttled_responses.items()},
+        }
@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import CheckAPIConfig
+from .models import CheckAPIConfig, BulkRegisterJob, CleanupJob, RegisteredPhone, RegistryMirrorState
 
 
 @admin.register(CheckAPIConfig)
 class CheckAPIConfigAdmin(admin.ModelAdmin):
-    list_display = ('name', 'base_url', 'is_active', 'created_at', 'updated_at')
+    list_display = ('name', 'base_url', 'is_active', 'weight', 'created_at', 'updated_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('name', 'base_url')
     readonly_fields = ('created_at', 'updated_at')
@@ -14,10 +14,42 @@ class CheckAPIConfigAdmin(admin.ModelAdmin):
             'fields': ('name', 'is_active')
         }),
         ('API Configuration', {
-            'fields': ('base_url', 'api_key')
+            'fields': ('base_url', 'api_key', 'weight')
+        }),
+        ('Rate Limiting', {
+            'fields': (
+                'rate_limit_per_second', 'rate_limit_burst', 'rate_limit_queue_size', 'rate_limit_queue_timeout'
+            )
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(BulkRegisterJob)
+class BulkRegisterJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'total_numbers', 'chunks_succeeded', 'chunks_failed', 'created_by', 'created_at')
+    list_filter = ('status', 'file_format', 'created_at')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'completed_at')
+
+
+@admin.register(CleanupJob)
+class CleanupJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'retention_days', 'steps_completed', 'steps_total', 'deleted_count', 'created_by', 'created_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'completed_at')
+
+
+@admin.register(RegisteredPhone)
+class RegisteredPhoneAdmin(admin.ModelAdmin):
+    list_display = ('phone_number', 'botname', 'country', 'iso2', 'quality', 'is_bulked', 'registered_at')
+    list_filter = ('is_bulked', 'quality', 'iso2')
+    search_fields = ('phone_number', 'botname')
+    readonly_fields = ('synced_at',)
+
+
+@admin.register(RegistryMirrorState)
+class RegistryMirrorStateAdmin(admin.ModelAdmin):
+    list_display = ('last_synced_at', 'watermark', 'last_sync_rows', 'last_full_sync_at')
@@ -0,0 +1,167 @@
+"""
+Stale-while-revalidate cache for ``phone_analytics``.
+
+Results are keyed by the upstream and the normalized (``start_date``,
+``end_date``, ``is_bulked``) query. Closed ranges that end before today cannot
+change and are kept for ``ANALYTICS_CACHE_HISTORICAL_TTL``. Ranges that
+include today are fresh for ``ANALYTICS_CACHE_FRESH_TTL``; after that they are
+still served for up to ``ANALYTICS_CACHE_STALE_TTL`` more seconds while one
+background request refreshes them. After a failed refresh the key is not
+refreshed again for ``ANALYTICS_CACHE_REFRESH_BACKOFF`` seconds, doubling with
+each further failure up to ``MAX_REFRESH_BACKOFF``.
+
+Cached responses carry a ``cache`` block with the status (``hit``, ``stale``,
+``miss`` or ``refreshed``), ``fetched_at`` and ``age_seconds``.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .cache import TTLCache
+from .client import get_client
+from .conf import get_setting
+from .serializers import PhoneAnalyticsSerializer
+
+ANALYTICS_PARAMS = ['start_date', 'end_date', 'is_bulked']
+MAX_REFRESH_BACKOFF = 300
+
+
+class AnalyticsCache:
+    """Analytics results with per-range lifetimes and background revalidation."""
+
+    def __init__(self, maxsize):
+        self.entries = TTLCache(maxsize=maxsize)
+        self._refreshing = set()
+        # key -> (consecutive failed refreshes, monotonic time before which none is started)
+        self._backoff = {}
+        self._lock = threading.Lock()
+        self.stale_served = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def key(self, config, params):
+        """Cache key for a query, or None if the query can't be cached"""
+        serializer = PhoneAnalyticsSerializer(data=params)
+        if not serializer.is_valid():
+            return None
+        data = serializer.validated_data
+        return (config.base_url, config.api_key) + tuple(data.get(name) for name in ANALYTICS_PARAMS)
+
+    def is_closed(self, key):
+        # key is (base_url, api_key, start_date, end_date, is_bulked)
+        end_date = key[3]
+        return end_date is not None and end_date < timezone.localdate()
+
+    def get(self, config, params):
+        """Return cached analytics with ``cache`` metadata, or None on a miss"""
+        key = self.key(config, params)
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        data, fetched_at = entry
+        age = time.time() - fetched_at
+        cache_status = 'hit'
+        if not self.is_closed(key) and age > get_setting('ANALYTICS_CACHE_FRESH_TTL'):
+            cache_status = 'stale'
+            self.stale_served += 1
+            self.refresh_in_background(config, key, params)
+        return self.annotate(data, cache_status, fetched_at)
+
+    def put(self, config, params, response_status, response_data, cache_status='miss'):
+        """Store a fresh upstream result and return it with ``cache`` metadata"""
+        if response_status != 200 or not isinstance(response_data, dict):
+            return response_data
+        key = self.key(config, params)
+        if key is None:
+            return response_data
+        fetched_at = self.store(key, response_data)
+        return self.annotate(response_data, cache_status, fetched_at)
+
+    def store(self, key, data):
+        if self.is_closed(key):
+            ttl = get_setting('ANALYTICS_CACHE_HISTORICAL_TTL')
+        else:
+            ttl = get_setting('ANALYTICS_CACHE_FRESH_TTL') + get_setting('ANALYTICS_CACHE_STALE_TTL')
+        fetched_at = time.time()
+        if ttl > 0:
+            self.entries.set(key, (data, fetched_at), ttl)
+        return fetched_at
+
+    def annotate(self, data, cache_status, fetched_at):
+        return {
+            **data,
+            'cache': {
+                'status': cache_status,
+                'fetched_at': datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc),
+                'age_seconds': round(time.time() - fetched_at, 1),
+            },
+        }
+
+    def refresh_in_background(self, config, key, params):
+        """Start one upstream refresh for a stale key on the client loop, unless backing off"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            failures, retry_at = self._backoff.get(key, (0, 0.0))
+            if time.monotonic() < retry_at:
+                return
+            self._refreshing.add(key)
+        self.refreshes += 1
+
+        headers = {
+            'X-API-Key': config.api_key,
+        }
+        future = get_client().submit(get_client().fetch(
+            'GET', f"{config.base_url}/api/phone/analytics", headers, params=params, idempotent=True
+        ))
+
+        def done(future):
+            refreshed = False
+            try:
+                if not future.cancelled() and future.exception() is None:
+                    response_status, response_data = future.result()
+                    if response_status == 200 and isinstance(response_data, dict):
+                        self.store(key, response_data)
+                        refreshed = True
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+                    if refreshed:
+                        self._backoff.pop(key, None)
+                    else:
+                        self.refresh_failures += 1
+                        delay = min(get_setting('ANALYTICS_CACHE_REFRESH_BACKOFF') * 2 ** failures, MAX_REFRESH_BACKOFF)
+                        self._backoff[key] = (failures + 1, time.monotonic() + delay)
+
+        future.add_done_callback(done)
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+            self._backoff.clear()
+
+    def stats(self):
+        return {
+            **self.entries.stats(),
+            'stale_served': self.stale_served,
+            'background_refreshes': self.refreshes,
+            'failed_refreshes': self.refresh_failures,
+        }
+
+
+analytics_cache = AnalyticsCache(maxsize=get_setting('ANALYTICS_CACHE_MAXSIZE'))
+
+
+def analytics_params(query):
+    """Analytics query parameters to forward upstream"""
+    return {key: query[key] for key in ANALYTICS_PARAMS if query.get(key) is not None}
+
+
+def wants_refresh(query):
+    return query.get('refresh') in ('1', 'true', 'True')
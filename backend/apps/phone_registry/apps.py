@@ -5,3 +5,6 @@ class PhoneRegistryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.phone_registry'
     verbose_name = 'Phone Registry'
+
+    def ready(self):
+        from . import signals  # noqa: F401
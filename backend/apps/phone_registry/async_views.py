@@ -0,0 +1,395 @@
+"""
+Native async versions of the phone registry proxy views.
+
+These are served instead of the DRF views in ``views.py`` when the app runs
+under ASGI (see ``config/asgi.py``). Each request awaits the shared Check API
+client rather than blocking a worker thread for the upstream round trip.
+"""
+
+import asyncio
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .analytics_cache import analytics_cache, analytics_params, wants_refresh
+from .balancer import probe_upstream
+from .batching import get_batcher
+from .bloom import phone_bloom
+from .cache import cache_check_result, get_cached_check, invalidate_phone_numbers
+from .client import RawBody, get_client
+from .conf import get_setting
+from .config_cache import get_active_config
+from .export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, EXPORT_FILTERS, RegistryPager, astream_export
+from .mirror import local_check, local_list
+from .normalization import normalize_batch
+from .ratelimit import RateLimitExceeded
+from .serializers import (
+    PhoneCheckSerializer, PhoneRegisterSerializer, PhoneBulkRegisterSerializer,
+    PhoneListSerializer, SpamAnalysisSerializer, SpamBatchAnalysisSerializer
+)
+from .spam import spam_analyzer
+from .spam_batch import SpamBatch, aordered_results, astream_results
+from .views import get_api_config
+
+
+async def amake_api_request(method, endpoint, headers, data=None, params=None, coalesce=None, raw=False):
+    """Make async API request to external Check API over the shared connection pool"""
+    return await get_client().arequest(
+        method, endpoint, headers, data=data, params=params, coalesce=coalesce, raw=raw
+    )
+
+
+def async_admin_api_view(methods):
+    """
+    Async counterpart of ``@api_view`` + ``IsAuthenticated, IsAdminUser``.
+
+    Authenticates the JWT bearer token, requires a staff user and parses the
+    JSON body into ``request.data``.
+    """
+    def decorator(view_func):
+        @csrf_exempt
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({
+                    'detail': f'Method "{request.method}" not allowed.'
+                }, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+            try:
+                auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+            except APIException as e:
+                return JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+
+            if auth is None:
+                return JsonResponse({
+                    'detail': 'Authentication credentials were not provided.'
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+            request.user = auth[0]
+            if not request.user.is_staff:
+                return JsonResponse({
+                    'detail': 'You do not have permission to perform this action.'
+                }, status=status.HTTP_403_FORBIDDEN)
+
+            try:
+                if request.content_type == 'application/json':
+                    request.data = json.loads(request.body) if request.body else {}
+                else:
+                    request.data = request.POST
+            except ValueError as e:
+                return JsonResponse({
+                    'detail': f'JSON parse error - {str(e)}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def validation_error(serializer):
+    return JsonResponse({
+        'success': False,
+        'message': 'Validation error',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+async def proxy_request(method, path, data=None, params=None, on_response=None, coalesce=None, upstream=None,
+                        extra_data=None, passthrough=False):
+    """
+    Forward a request to the Check API and relay its response.
+
+    ``on_response(status, data)`` is called with the upstream result before
+    it is returned, e.g. to update local caches. ``coalesce`` is passed on to
+    the client's single-flight request sharing. ``upstream(config)`` can
+    replace the plain request with another coroutine returning ``(status, data)``.
+    ``extra_data`` is merged into dict responses. With ``passthrough`` (and
+    ``PASSTHROUGH_RESPONSES``) the upstream body is relayed without decoding,
+    so ``on_response`` gets a ``RawBody``.
+    """
+    config, error = await sync_to_async(get_api_config)()
+    if error:
+        return JsonResponse({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+        endpoint = f"{config.base_url}{path}"
+        headers = {
+            'X-API-Key': config.api_key,
+        }
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+
+        if upstream is not None:
+            response_status, response_data = await upstream(config)
+        else:
+            response_status, response_data = await amake_api_request(
+                method, endpoint, headers, data=data, params=params, coalesce=coalesce,
+                raw=passthrough and get_setting('PASSTHROUGH_RESPONSES')
+            )
+        if on_response is not None:
+            on_response(response_status, response_data)
+        if isinstance(response_data, RawBody):
+            return HttpResponse(
+                response_data.content, status=response_status, content_type=response_data.content_type
+            )
+        if extra_data and isinstance(response_data, dict):
+            response_data = {**response_data, **extra_data}
+
+        return JsonResponse(response_data, status=response_status, safe=False)
+
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error connecting to Check API: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def rate_limited_response(e):
+    response = JsonResponse({
+        'success': False,
+        'message': str(e)
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def query_params(request, keys):
+    return {key: request.GET[key] for key in keys if key in request.GET}
+
+
+@async_admin_api_view(['POST'])
+async def phone_check(request):
+    """Check if a phone number exists in the registry"""
+    serializer = PhoneCheckSerializer(data=request.data)
+    if not serializer.is_valid():
+        return validation_error(serializer)
+
+    phone_number = serializer.validated_data['phone_number']
+    cached_data = get_cached_check(phone_number)
+    if cached_data is not None:
+        return JsonResponse(cached_data)
+
+    local_data = await sync_to_async(local_check)(phone_number) or phone_bloom.check(phone_number)
+    if local_data is not None:
+        return JsonResponse(local_data)
+
+    async def batched_check(config):
+        return await get_batcher().acheck(config, phone_number)
+
+    def record_check(response_status, response_data):
+        cache_check_result(phone_number, response_status, response_data)
+        phone_bloom.record_result(phone_number, response_status, response_data)
+
+    upstream = batched_check if get_setting('CHECK_BATCHING') else None
+
+    return await proxy_request(
+        'POST', '/api/phone/check', data=serializer.validated_data, coalesce=True, upstream=upstream,
+        on_response=record_check
+    )
+
+
+@async_admin_api_view(['POST'])
+async def phone_register(request):
+    """Register a new phone number with full details"""
+    serializer = PhoneRegisterSerializer(data=request.data)
+    if not serializer.is_valid():
+        return validation_error(serializer)
+
+    await sync_to_async(phone_bloom.add)([serializer.validated_data['phone_number']])
+    return await proxy_request(
+        'POST', '/api/phone/register', data=serializer.validated_data, passthrough=True,
+        on_response=lambda *response: invalidate_phone_numbers([serializer.validated_data['phone_number']])
+    )
+
+
+@async_admin_api_view(['POST'])
+async def phone_bulk_register(request):
+    """Register multiple phone numbers in bulk"""
+    serializer = PhoneBulkRegisterSerializer(data=request.data)
+    if not serializer.is_valid():
+        return validation_error(serializer)
+
+    # Canonicalize and de-duplicate before anything is sent upstream
+    phone_numbers, normalization = normalize_batch(serializer.validated_data['phone_numbers'])
+    if not phone_numbers:
+        return JsonResponse({
+            'success': False,
+            'message': 'Validation error',
+            'errors': {'phone_numbers': ['No valid phone numbers provided.']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    await sync_to_async(phone_bloom.add)(phone_numbers)
+    return await proxy_request(
+        'POST', '/api/phone/bulk-register', data={'phone_numbers': phone_numbers},
+        on_response=lambda *response: invalidate_phone_numbers(phone_numbers),
+        extra_data={'normalization': normalization}
+    )
+
+
+@async_admin_api_view(['GET'])
+async def phone_list(request):
+    """Retrieve phone registry with pagination and filtering"""
+    list_serializer = PhoneListSerializer(data=request.GET)
+    if list_serializer.is_valid():
+        local_data = await sync_to_async(local_list)(list_serializer.validated_data)
+        if local_data is not None:
+            return JsonResponse(local_data)
+
+    params = query_params(request, [
+        'page', 'limit', 'botname', 'country', 'iso2', 'is_bulked', 'quality', 'order_by', 'order_direction'
+    ])
+    return await proxy_request('GET', '/api/phone/list', params=params, passthrough=True)
+
+
+@async_admin_api_view(['GET'])
+async def phone_export(request):
+    """Stream the full phone registry as CSV or NDJSON"""
+    file_format = request.GET.get('file_format', 'csv')
+    if file_format not in EXPORT_CONTENT_TYPES:
+        return JsonResponse({
+            'success': False,
+            'message': 'Validation error',
+            'errors': {'file_format': ['Must be "csv" or "ndjson".']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    config, error = await sync_to_async(get_api_config)()
+    if error:
+        return JsonResponse({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+        pager = RegistryPager(config, query_params(request, EXPORT_FILTERS))
+        response_status, response_data = await pager.afirst_page()
+        if response_status != 200:
+            return JsonResponse(response_data, status=response_status, safe=False)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error connecting to Check API: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    response = StreamingHttpResponse(
+        astream_export(pager, response_data, file_format),
+        content_type=EXPORT_CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="phone_registry.{file_format}"'
+    return response
+
+
+@async_admin_api_view(['GET'])
+async def phone_analytics(request):
+    """Get analytics and statistics for phone number registry"""
+    params = analytics_params(request.GET)
+    refresh = wants_refresh(request.GET)
+
+    async def cached_analytics(config):
+        if not refresh:
+            cached_data = analytics_cache.get(config, params)
+            if cached_data is not None:
+                return 200, cached_data
+        headers = {
+            'X-API-Key': config.api_key,
+        }
+        response_status, response_data = await amake_api_request(
+            'GET', f"{config.base_url}/api/phone/analytics", headers, params=params
+        )
+        return response_status, analytics_cache.put(
+            config, params, response_status, response_data, cache_status='refreshed' if refresh else 'miss'
+        )
+
+    return await proxy_request('GET', '/api/phone/analytics', params=params, upstream=cached_analytics)
+
+
+@async_admin_api_view(['POST'])
+async def analyze_spam(request):
+    """Analyze account status message using multilingual NLP detection"""
+    serializer = SpamAnalysisSerializer(data=request.data)
+    if not serializer.is_valid():
+        return validation_error(serializer)
+
+    message = serializer.validated_data['message']
+    known_data = spam_analyzer.lookup(message)
+    if isinstance(known_data, RawBody):
+        return HttpResponse(known_data.content, content_type=known_data.content_type)
+    if known_data is not None:
+        return JsonResponse(known_data)
+
+    return await proxy_request(
+        'POST', '/api/analyze-spam', data=serializer.validated_data, coalesce=True, passthrough=True,
+        on_response=lambda response_status, response_data: spam_analyzer.store(
+            message, response_status, response_data
+        )
+    )
+
+
+@async_admin_api_view(['POST'])
+async def analyze_spam_batch(request):
+    """Analyze a list of account status messages, in input order or streamed as NDJSON"""
+    serializer = SpamBatchAnalysisSerializer(data=request.data)
+    if not serializer.is_valid():
+        return validation_error(serializer)
+
+    config, error = await sync_to_async(get_api_config)()
+    if error:
+        return JsonResponse({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    batch = SpamBatch(config, serializer.validated_data['messages'])
+    if serializer.validated_data['stream']:
+        return StreamingHttpResponse(astream_results(batch), content_type='application/x-ndjson')
+
+    return JsonResponse({
+        'success': True,
+        'data': {
+            **batch.summary(),
+            'results': await aordered_results(batch),
+        }
+    })
+
+
+@async_admin_api_view(['POST'])
+async def test_config(request):
+    """Test Check API connection"""
+    try:
+        # The configured upstream, as in the sync view, not whichever one the balancer picks
+        config = await sync_to_async(get_active_config)()
+        if not config:
+            return JsonResponse({
+                'success': False,
+                'message': 'No active configuration found. Please save configuration first.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Same request as the background health probe, with a dummy phone number
+        ok, message = await asyncio.wrap_future(get_client().submit(probe_upstream(config)))
+        if ok:
+            return JsonResponse({
+                'success': True,
+                'message': message,
+            })
+        return JsonResponse({
+            'success': False,
+            'message': message
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Connection test failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,174 @@
+"""
+Load balancing across all active Check API configurations.
+
+``get_api_config()`` picks one active ``CheckAPIConfig`` per request, by
+smooth weighted round robin or, with ``LOAD_BALANCING = 'least_outstanding'``,
+by the fewest in-flight requests per unit of ``weight`` (ties broken by
+weighted round robin).
+
+When more than one upstream is active, a probe runs on the client loop every
+``HEALTH_CHECK_INTERVAL`` seconds and makes the same request as the
+connection test, outside the per-key rate limiter. An upstream is ejected after ``HEALTH_CHECK_FAILURES`` failed
+probes in a row and readmitted after ``HEALTH_CHECK_SUCCESSES`` successful
+ones. If every upstream is ejected, all of them are used again rather than
+failing every request.
+"""
+
+import asyncio
+import os
+import threading
+
+from django.utils import timezone
+
+from .client import get_client
+from .conf import get_setting
+from .config_cache import config_cache
+
+PROBE_PHONE_NUMBER = '+1234567890'
+
+
+async def probe_upstream(config):
+    """Test a Check API connection; returns ``(ok, message)``. Must run on the client loop."""
+    endpoint = f"{config.base_url}/api/phone/check"
+    headers = {
+        'X-API-Key': config.api_key,
+        'Content-Type': 'application/json'
+    }
+    try:
+        # Outside the per-key rate limiter, so probes never take tokens from real traffic
+        response_status, _ = await get_client().fetch(
+            'POST', endpoint, headers, data={'phone_number': PROBE_PHONE_NUMBER}, rate_limited=False
+        )
+    except Exception as e:
+        return False, f'Connection test failed: {str(e)}'
+
+    # Any response (even if the phone doesn't exist) means the connection works
+    if response_status < 500:
+        return True, 'Connection successful! Check API is reachable.'
+    return False, f'Connection failed with status {response_status}'
+
+
+class UpstreamState:
+    """Health and round-robin state of one ``CheckAPIConfig``."""
+
+    def __init__(self):
+        self.healthy = True
+        self.current_weight = 0
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.times_ejected = 0
+        self.last_probe_at = None
+        self.last_message = ''
+
+
+class UpstreamBalancer:
+    """Chooses an upstream per request and probes upstream health in the background."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self.configs = []
+        self._prober = None
+        self._prober_pid = None
+
+    def _state(self, config):
+        state = self._states.get(config.pk)
+        if state is None:
+            state = self._states[config.pk] = UpstreamState()
+        return state
+
+    def choose(self, configs):
+        """Pick the upstream for one request from the active configs"""
+        self.configs = configs
+        if len(configs) == 1:
+            return configs[0]
+
+        self._ensure_prober()
+        with self._lock:
+            candidates = [config for config in configs if self._state(config).healthy] or configs
+            if get_setting('LOAD_BALANCING') == 'least_outstanding':
+                client = get_client()
+                scores = {
+                    config.pk: client.outstanding_requests(config.base_url) / max(1, config.weight)
+                    for config in candidates
+                }
+                lowest = min(scores.values())
+                candidates = [config for config in candidates if scores[config.pk] == lowest]
+            return self._weighted_round_robin(candidates)
+
+    def _weighted_round_robin(self, candidates):
+        # Smooth weighted round robin: spreads picks evenly instead of in bursts
+        total = 0
+        chosen = None
+        for config in candidates:
+            state = self._state(config)
+            state.current_weight += max(1, config.weight)
+            total += max(1, config.weight)
+            if chosen is None or state.current_weight > self._state(chosen).current_weight:
+                chosen = config
+        self._state(chosen).current_weight -= total
+        return chosen
+
+    def _ensure_prober(self):
+        """Start the health probe on the client loop (again after a fork or a crash)"""
+        if self._prober is not None and self._prober_pid == os.getpid() and not self._prober.done():
+            return
+        with self._lock:
+            if self._prober is None or self._prober_pid != os.getpid() or self._prober.done():
+                self._prober_pid = os.getpid()
+                self._prober = get_client().submit(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            configs = self.configs
+            if len(configs) > 1:
+                results = await asyncio.gather(*(probe_upstream(config) for config in configs))
+                for config, (ok, message) in zip(configs, results):
+                    self.record_probe(config, ok, message)
+            await asyncio.sleep(get_setting('HEALTH_CHECK_INTERVAL'))
+
+    def record_probe(self, config, ok, message):
+        with self._lock:
+            state = self._state(config)
+            state.last_probe_at = timezone.now()
+            state.last_message = message
+            if ok:
+                state.consecutive_failures = 0
+                state.consecutive_successes += 1
+                if not state.healthy and state.consecutive_successes >= get_setting('HEALTH_CHECK_SUCCESSES'):
+                    state.healthy = True
+            else:
+                state.consecutive_successes = 0
+                state.consecutive_failures += 1
+                if state.healthy and state.consecutive_failures >= get_setting('HEALTH_CHECK_FAILURES'):
+                    state.healthy = False
+                    state.times_ejected += 1
+
+    def stats(self):
+        client = get_client()
+        with self._lock:
+            return [
+                {
+                    'id': config.pk,
+                    'name': config.name,
+                    'base_url': config.base_url,
+                    'weight': config.weight,
+                    'healthy': self._state(config).healthy,
+                    'outstanding': client.outstanding_requests(config.base_url),
+                    'times_ejected': self._state(config).times_ejected,
+                    'last_probe_at': self._state(config).last_probe_at,
+                    'last_probe_result': self._state(config).last_message,
+                }
+                for config in self.configs
+            ]
+
+
+balancer = UpstreamBalancer()
+
+
+def get_balanced_config():
+    """Get the active Check API configuration to use for one request, or None"""
+    configs = config_cache.get_active_configs()
+    if not configs:
+        return None
+    return balancer.choose(configs)
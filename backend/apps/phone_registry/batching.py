@@ -0,0 +1,169 @@
+"""
+Micro-batching of single phone checks into upstream bulk check calls.
+
+When ``CHECK_BATCHING`` is enabled, ``phone_check`` requests arriving within
+``CHECK_BATCH_WINDOW_MS`` of each other (or until ``CHECK_BATCH_MAX_SIZE``
+numbers are queued) are collected into one batch, and the same number in any
+spelling is checked upstream once. The Check API has no bulk check endpoint,
+so by default each distinct number in a batch gets one ``/api/phone/check``
+call. A deployment that offers one can set ``CHECK_BATCH_ENDPOINT``: the
+batch is then sent as one call taking ``{"phone_numbers": [...]}`` and
+returning ``{"results": [{"phone_number": ..., "exists": ...}, ...]}``, and
+each caller receives its own entry as if it had called ``/api/phone/check``.
+
+All batch state lives on the shared client's event loop, so sync views and
+async views feed the same batches.
+"""
+
+import asyncio
+import threading
+
+from .client import get_client
+from .conf import get_setting
+from .normalization import normalize_phone_number
+
+
+class PendingBatch:
+    """Checks queued for one upstream (base URL + API key)."""
+
+    def __init__(self, base_url, api_key):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.waiters = {}
+        self.timer = None
+
+
+class CheckBatcher:
+    """Collects single phone checks and sends them upstream in batches."""
+
+    def __init__(self, client, window_ms=None, max_size=None, endpoint=None):
+        self.client = client
+        self.window = (window_ms if window_ms is not None else get_setting('CHECK_BATCH_WINDOW_MS')) / 1000
+        self.max_size = max_size or get_setting('CHECK_BATCH_MAX_SIZE')
+        self.endpoint = endpoint if endpoint is not None else get_setting('CHECK_BATCH_ENDPOINT')
+        self._pending = {}
+        self.batches_sent = 0
+        self.checks_batched = 0
+
+    async def _check(self, base_url, api_key, phone_number):
+        """Queue a check on the client loop and wait for its batch"""
+        key = (base_url, api_key)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = PendingBatch(base_url, api_key)
+            self._pending[key] = batch
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+        future = asyncio.get_running_loop().create_future()
+        batch.waiters.setdefault(normalize_phone_number(phone_number), []).append((phone_number, future))
+        if len(batch.waiters) >= self.max_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch):
+        headers = {
+            'X-API-Key': batch.api_key,
+            'Content-Type': 'application/json'
+        }
+        phone_numbers = [waiters[0][0] for waiters in batch.waiters.values()]
+        self.batches_sent += 1
+        self.checks_batched += sum(len(waiters) for waiters in batch.waiters.values())
+
+        if not self.endpoint:
+            # No bulk check endpoint: one single check per distinct number
+            for waiters in batch.waiters.values():
+                asyncio.ensure_future(self._check_single(batch, waiters))
+            return
+
+        try:
+            response_status, response_data = await self.client.fetch(
+                'POST', f"{batch.base_url}{self.endpoint}", headers,
+                data={'phone_numbers': phone_numbers}, idempotent=True
+            )
+        except Exception as e:
+            self._resolve_all(batch, error=e)
+            return
+
+        if response_status != 200 or not isinstance(response_data, dict):
+            self._resolve_all(batch, result=(response_status, response_data))
+            return
+
+        results = {
+            normalize_phone_number(str(item.get('phone_number', ''))): item
+            for item in response_data.get('results', [])
+        }
+        for normalized, waiters in batch.waiters.items():
+            item = results.get(normalized)
+            if item is None:
+                # Not answered by the batch endpoint: fall back to a single check
+                asyncio.ensure_future(self._check_single(batch, waiters))
+                continue
+            for _, future in waiters:
+                if not future.done():
+                    future.set_result((200, item))
+
+    async def _check_single(self, batch, waiters):
+        headers = {
+            'X-API-Key': batch.api_key,
+            'Content-Type': 'application/json'
+        }
+        try:
+            result = await self.client.fetch(
+                'POST', f"{batch.base_url}/api/phone/check", headers,
+                data={'phone_number': waiters[0][0]}, idempotent=True
+            )
+        except Exception as e:
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in waiters:
+            if not future.done():
+                future.set_result(result)
+
+    def _resolve_all(self, batch, result=None, error=None):
+        for waiters in batch.waiters.values():
+            for _, future in waiters:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def check(self, config, phone_number):
+        """Check a phone number through the batcher, blocking; returns ``(status, data)``"""
+        return self.client.submit(self._check(config.base_url, config.api_key, phone_number)).result()
+
+    async def acheck(self, config, phone_number):
+        """Check a phone number through the batcher from any event loop"""
+        future = self.client.submit(self._check(config.base_url, config.api_key, phone_number))
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            'batches_sent': self.batches_sent,
+            'checks_batched': self.checks_batched,
+            'average_batch_size': self.checks_batched / self.batches_sent if self.batches_sent else 0.0,
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Get the process-wide phone check batcher"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = CheckBatcher(get_client())
+    return _batcher
@@ -0,0 +1,345 @@
+"""
+Bloom filter of registered phone numbers for fast "not registered" answers.
+
+``python manage.py build_phone_bloom`` walks the registry through
+``/api/phone/list`` and writes a Bloom filter file. Every worker memory-maps
+the same file, so it is kept once in the page cache and a rebuild (written
+next to it and swapped in with a rename) is picked up by all workers within
+``BLOOM_RELOAD_INTERVAL`` seconds.
+
+With ``BLOOM_SERVE_CHECK`` enabled, ``phone_check`` answers numbers that are
+definitely not in the filter locally. Numbers that may be in it still go
+upstream, and the upstream answer shows whether the filter was right.
+Numbers are added to the shared file before a registration is sent, so a
+registration that times out can't leave a false negative behind.
+
+Numbers registered upstream by other clients are only picked up by the next
+rebuild, so the filter is not used once it is older than
+``BLOOM_MAX_STALENESS`` seconds.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .conf import get_setting
+from .export import RegistryPager, iter_pages
+from .normalization import normalize_phone_number
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+MAGIC = b'PRBF'
+VERSION = 2
+# magic, version, hash count, bit count, capacity, insertions, built at (epoch seconds), bits set
+HEADER = struct.Struct('<4sHHQQQdQ')
+HEADER_SIZE = 64
+INSERTIONS_OFFSET = struct.calcsize('<4sHHQQ')
+BUILT_AT_OFFSET = struct.calcsize('<4sHHQQQ')
+BITS_SET_OFFSET = struct.calcsize('<4sHHQQQd')
+
+# Records registered while a build runs are added afterwards, with this margin for late arrivals
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+
+
+class BloomBuildError(Exception):
+    pass
+
+
+def get_bloom_path():
+    return get_setting('BLOOM_FILTER_PATH') or os.path.join(
+        settings.BASE_DIR, 'media', 'phone_registry', 'registered_phones.bloom'
+    )
+
+
+class BloomFilter:
+    """Bloom filter stored in a memory-mapped file shared by all workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'r+b')
+        self.identity = os.fstat(self._file.fileno())[1:3]
+        self.buffer = mmap.mmap(self._file.fileno(), 0)
+        magic, version, self.hash_count, self.bit_count, self.capacity, _, self.built_at, _ = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a phone registry Bloom filter')
+
+    @classmethod
+    def create(cls, path, capacity, false_positive_rate):
+        """Write an empty filter sized for ``capacity`` numbers at ``false_positive_rate``"""
+        capacity = max(1, capacity)
+        bit_count = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        bit_count = (bit_count + 7) // 8 * 8
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, hash_count, bit_count, capacity, 0, 0.0, 0).ljust(HEADER_SIZE, b'\0'))
+            f.truncate(HEADER_SIZE + bit_count // 8)
+        return cls(path)
+
+    @property
+    def insertions(self):
+        return struct.unpack_from('<Q', self.buffer, INSERTIONS_OFFSET)[0]
+
+    @property
+    def bits_set(self):
+        return struct.unpack_from('<Q', self.buffer, BITS_SET_OFFSET)[0]
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def __contains__(self, key):
+        buffer = self.buffer
+        return all(buffer[HEADER_SIZE + (position >> 3)] & (1 << (position & 7)) for position in self.positions(key))
+
+    def add(self, keys):
+        """Add keys; locks the file so concurrent writers in other workers don't lose bits"""
+        buffer = self.buffer
+        added = 0
+        newly_set = 0
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            for key in keys:
+                for position in self.positions(key):
+                    index = HEADER_SIZE + (position >> 3)
+                    bit = 1 << (position & 7)
+                    if not buffer[index] & bit:
+                        buffer[index] = buffer[index] | bit
+                        newly_set += 1
+                added += 1
+            struct.pack_into('<Q', buffer, INSERTIONS_OFFSET, self.insertions + added)
+            # Kept in the header so stats don't have to scan the bit array
+            struct.pack_into('<Q', buffer, BITS_SET_OFFSET, self.bits_set + newly_set)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        return added
+
+    def set_built_at(self, timestamp):
+        self.built_at = timestamp
+        struct.pack_into('<d', self.buffer, BUILT_AT_OFFSET, timestamp)
+        self.buffer.flush()
+
+    def fill_ratio(self):
+        return self.bits_set / self.bit_count
+
+    def close(self):
+        if not self.buffer.closed:
+            self.buffer.close()
+        self._file.close()
+
+
+class PhoneBloom:
+    """The shared registered-numbers filter as seen by one worker, with check outcome counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._checked_at = 0.0
+        self.definite_negatives = 0
+        self.possible_positives = 0
+        self.confirmed_positives = 0
+        self.false_positives = 0
+
+    def current(self, force=False):
+        """The filter file as of the last reload check, reopened if it was rebuilt"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < get_setting('BLOOM_RELOAD_INTERVAL'):
+            return self._filter
+        with self._lock:
+            self._checked_at = now
+            try:
+                identity = os.stat(get_bloom_path())[1:3]
+            except OSError:
+                identity = None
+            if self._filter is not None and self._filter.identity == identity:
+                return self._filter
+            # The old mapping is not closed here; requests may still be reading it
+            self._filter = None
+            if identity is not None:
+                try:
+                    self._filter = BloomFilter(get_bloom_path())
+                except (OSError, ValueError):
+                    self._filter = None
+            return self._filter
+
+    def usable(self):
+        """The filter, if checks may be answered from it"""
+        if not get_setting('BLOOM_SERVE_CHECK'):
+            return None
+        bloom = self.current()
+        if bloom is None or not bloom.built_at:
+            return None
+        max_staleness = get_setting('BLOOM_MAX_STALENESS')
+        if max_staleness and time.time() - bloom.built_at > max_staleness:
+            return None
+        return bloom
+
+    def check(self, phone_number):
+        """
+        Answer a phone check for a number that is definitely not registered.
+
+        Returns None when the number may be registered (or the filter can't
+        be used) so the check goes upstream.
+        """
+        bloom = self.usable()
+        if bloom is None:
+            return None
+        if normalize_phone_number(phone_number) in bloom:
+            self.possible_positives += 1
+            return None
+        self.definite_negatives += 1
+        return {
+            'exists': False,
+            'phone_number': phone_number,
+            'freshness': {
+                'source': 'bloom',
+                'built_at': datetime.fromtimestamp(bloom.built_at, tz=dt_timezone.utc),
+                'age_seconds': round(time.time() - bloom.built_at, 1),
+            },
+        }
+
+    def record_result(self, phone_number, response_status, response_data):
+        """Count whether an upstream check of a possible positive found the number"""
+        if response_status != 200 or not isinstance(response_data, dict):
+            return
+        bloom = self.usable()
+        if bloom is None or normalize_phone_number(phone_number) not in bloom:
+            return
+        if response_data.get('exists'):
+            self.confirmed_positives += 1
+        else:
+            self.false_positives += 1
+
+    def add(self, phone_numbers):
+        """Add numbers about to be registered to the shared filter"""
+        bloom = self.current(force=True)
+        if bloom is not None:
+            bloom.add(normalize_phone_number(phone_number) for phone_number in phone_numbers)
+
+    def stats(self):
+        checked_negatives = self.definite_negatives + self.false_positives
+        data = {
+            'enabled': get_setting('BLOOM_SERVE_CHECK'),
+            'path': get_bloom_path(),
+            'loaded': False,
+            'definite_negatives': self.definite_negatives,
+            'possible_positives': self.possible_positives,
+            'confirmed_positives': self.confirmed_positives,
+            'false_positives': self.false_positives,
+            # Share of unregistered numbers the filter failed to rule out
+            'observed_false_positive_rate': self.false_positives / checked_negatives if checked_negatives else None,
+        }
+        bloom = self.current()
+        if bloom is None:
+            return data
+        fill_ratio = bloom.fill_ratio()
+        return {
+            **data,
+            'loaded': True,
+            'built_at': datetime.fromtimestamp(bloom.built_at, tz=dt_timezone.utc) if bloom.built_at else None,
+            'capacity': bloom.capacity,
+            'insertions': bloom.insertions,
+            'size_bytes': bloom.bit_count // 8,
+            'hash_count': bloom.hash_count,
+            'fill_ratio': round(fill_ratio, 4),
+            'estimated_false_positive_rate': fill_ratio ** bloom.hash_count,
+        }
+
+
+phone_bloom = PhoneBloom()
+
+
+def phone_numbers_of(items):
+    return [normalize_phone_number(str(item['phone_number'])) for item in items if item.get('phone_number')]
+
+
+def build_bloom(config, stdout=None):
+    """
+    Rebuild the filter file from the full registry and swap it in.
+
+    Returns the number of registry records added.
+    """
+    pager = RegistryPager(config, {}, order_direction='desc')
+    response_status, response_data = pager.first_page()
+    if response_status != 200 or not isinstance(response_data, dict):
+        raise BloomBuildError(f"Check API returned status {response_status}")
+
+    path = get_bloom_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Leave room for growth until the next rebuild
+    total = int(response_data.get('total') or 0)
+    capacity = max(get_setting('BLOOM_MIN_CAPACITY'), math.ceil(total * 1.25))
+    started_at = timezone.now()
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    bloom = BloomFilter.create(temp_path, capacity, get_setting('BLOOM_FALSE_POSITIVE_RATE'))
+    added = 0
+    try:
+        pages = iter_pages(pager, response_data)
+        try:
+            for items in pages:
+                added += bloom.add(phone_numbers_of(items))
+                if stdout is not None:
+                    stdout.write(f"Added {added} of {total} records")
+        finally:
+            pages.close()
+        bloom.set_built_at(started_at.timestamp())
+        os.replace(temp_path, path)
+    except BaseException:
+        bloom.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # Registrations that went straight upstream during the walk were added
+    # to the old file; pick them up now that the new one is in place
+    added += catch_up(bloom, config, started_at - CATCH_UP_OVERLAP)
+    bloom.close()
+    return added
+
+
+def catch_up(bloom, config, since):
+    """Add records registered since ``since``, walking newest first"""
+    pager = RegistryPager(config, {}, order_direction='desc')
+    response_status, response_data = pager.first_page()
+    if response_status != 200 or not isinstance(response_data, dict):
+        raise BloomBuildError(f"Check API returned status {response_status}")
+
+    added = 0
+    pages = iter_pages(pager, response_data)
+    try:
+        for items in pages:
+            recent = []
+            passed = False
+            for item in items:
+                registered_at = parse_datetime(str(item.get('registered_at') or ''))
+                if registered_at is not None and timezone.is_naive(registered_at):
+                    registered_at = timezone.make_aware(registered_at, dt_timezone.utc)
+                if registered_at is not None and registered_at < since:
+                    passed = True
+                else:
+                    recent.append(item)
+            added += bloom.add(phone_numbers_of(recent))
+            if passed:
+                break
+    finally:
+        pages.close()
+    return added
@@ -0,0 +1,97 @@
+"""
+In-process result caches for Check API responses.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from .conf import get_setting
+from .normalization import normalize_phone_number
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time to live and hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+phone_check_cache = TTLCache(maxsize=get_setting('CHECK_CACHE_MAXSIZE'))
+
+
+def get_cached_check(phone_number):
+    """Get a cached phone check result, or None"""
+    return phone_check_cache.get(normalize_phone_number(phone_number))
+
+
+def cache_check_result(phone_number, response_status, response_data):
+    """Cache a successful phone check result (found and not-found use separate TTLs)"""
+    if response_status != 200 or not isinstance(response_data, dict):
+        return
+    if response_data.get('exists'):
+        ttl = get_setting('CHECK_CACHE_POSITIVE_TTL')
+    else:
+        ttl = get_setting('CHECK_CACHE_NEGATIVE_TTL')
+    if ttl > 0:
+        phone_check_cache.set(normalize_phone_number(phone_number), response_data, ttl)
+
+
+def invalidate_phone_numbers(phone_numbers):
+    """Drop cached check results for the given phone numbers"""
+    for phone_number in phone_numbers:
+        phone_check_cache.delete(normalize_phone_number(phone_number))
+
+
+def get_cache_stats():
+    return {
+        'phone_check': phone_check_cache.stats(),
+    }
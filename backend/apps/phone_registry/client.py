@@ -0,0 +1,359 @@
+"""
+Shared HTTP client for the external Check API.
+
+A single ``aiohttp.ClientSession`` is kept per worker process. It lives on a
+dedicated event loop thread so that both sync views and async code can share
+the same keep-alive connection pool instead of opening a session per call.
+
+Every call goes through a per-endpoint circuit breaker (see ``resilience``).
+Idempotent calls are retried with jittered backoff and, with
+``HEDGE_REQUESTS``, get a second attempt once they run past the endpoint's
+p95 latency. Configs with a rate limit are shaped by a token bucket first
+(see ``ratelimit``). Per-phase latencies and status codes of every call are
+recorded through aiohttp trace hooks (see ``metrics``).
+"""
+
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .conf import get_setting
+from .metrics import RequestTiming, UpstreamMetrics, make_trace_config
+from .ratelimit import RateLimiterRegistry
+from .resilience import CircuitOpenError, EndpointRegistry, retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+class RawBody:
+    """Undecoded upstream response body, relayed as-is by passthrough views."""
+
+    __slots__ = ('content', 'content_type')
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+
+
+class CheckAPIClient:
+    """Pooled, keep-alive client for the Check API running on its own event loop."""
+
+    def __init__(self, pool_limit=None, pool_limit_per_host=None, dns_cache_ttl=None,
+                 keepalive_timeout=None, request_timeout=None):
+        self.pool_limit = pool_limit or get_setting('POOL_LIMIT')
+        self.pool_limit_per_host = pool_limit_per_host or get_setting('POOL_LIMIT_PER_HOST')
+        self.dns_cache_ttl = dns_cache_ttl or get_setting('DNS_CACHE_TTL')
+        self.keepalive_timeout = keepalive_timeout or get_setting('KEEPALIVE_TIMEOUT')
+        self.request_timeout = request_timeout or get_setting('REQUEST_TIMEOUT')
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._pid = None
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}
+        self.coalesced_requests = 0
+        self.endpoints = EndpointRegistry()
+        self.rate_limiters = RateLimiterRegistry()
+        self.outstanding = Counter()
+        self.metrics = UpstreamMetrics()
+
+    def _ensure_loop(self):
+        """Start the client event loop thread (again after a fork)"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._session = None
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name='check-api-client',
+                    daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    async def _get_session(self):
+        """Get the pooled session, creating it on the client loop if needed"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                trace_configs=[make_trace_config()] if get_setting('UPSTREAM_METRICS') else None
+            )
+        return self._session
+
+    async def fetch(self, method, url, headers, data=None, params=None, idempotent=False, raw=False, rate_limited=True):
+        """
+        Make a request and return ``(status, data)``; must run on the client loop (see ``submit``).
+
+        Raises ``CircuitOpenError`` without calling upstream while the
+        endpoint's breaker is open. ``idempotent`` calls are retried on
+        connection errors, timeouts and 5xx responses and may be hedged.
+        With ``raw`` the body is not decoded and ``data`` is a ``RawBody``.
+        Calls that are not ``rate_limited`` (health probes) skip the
+        per-key token bucket, so they neither use up nor wait for its tokens.
+        """
+        origin = upstream_origin(url)
+        self.outstanding[origin] += 1
+        try:
+            return await self._fetch_with_retries(method, url, headers, data, params, idempotent, raw, rate_limited)
+        finally:
+            self.outstanding[origin] -= 1
+
+    async def _fetch_with_retries(self, method, url, headers, data, params, idempotent, raw, rate_limited):
+        endpoint = self.endpoints.get(method, url)
+        limiter = self.rate_limiters.get(headers.get('X-API-Key')) if rate_limited else None
+        send = functools.partial(self._timed_fetch, endpoint, method, url, headers, data, params, raw)
+        attempts = 1 + (get_setting('RETRY_MAX_ATTEMPTS') if idempotent else 0)
+        attempt = 0
+        while True:
+            attempt += 1
+            if not endpoint.allow():
+                raise CircuitOpenError(f"Circuit open for {method} {url}")
+            try:
+                if limiter is not None:
+                    await limiter.acquire(url)
+                if idempotent and get_setting('HEDGE_REQUESTS'):
+                    response_status, response_data = await self._hedged_fetch(endpoint, limiter, send)
+                else:
+                    response_status, response_data = await send()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                endpoint.record_failure()
+                if attempt >= attempts:
+                    raise
+            except BaseException:
+                # Not an upstream failure (rate limited, bad JSON, cancellation): just free a half-open trial
+                endpoint.release()
+                raise
+            else:
+                if response_status < 500:
+                    return response_status, response_data
+                endpoint.record_failure()
+                if attempt >= attempts:
+                    return response_status, response_data
+            endpoint.retries += 1
+            await asyncio.sleep(retry_delay(attempt))
+
+    async def _timed_fetch(self, endpoint, method, url, headers, data, params, raw):
+        timing = RequestTiming()
+        session = await self._get_session()
+        try:
+            async with session.request(
+                method=method,
+                url=url,
+                headers=headers,
+                json=data,
+                params=params,
+                trace_request_ctx=timing
+            ) as response:
+                if raw:
+                    response_data = RawBody(await response.read(), response.headers.get('Content-Type', 'application/json'))
+                else:
+                    response_data = await response.json()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.metrics.record_error(url, e)
+            raise
+        timing.finished = time.monotonic()
+        self.metrics.record(url, timing, response.status)
+        if response.status < 500:
+            endpoint.record_success(timing.finished - timing.started)
+        return response.status, response_data
+
+    async def _hedged_fetch(self, endpoint, limiter, send):
+        """Send a second attempt if the first runs past the p95 latency; the first to succeed wins"""
+        delay = endpoint.hedge_delay()
+        primary = asyncio.ensure_future(send())
+        pending = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and (limiter is None or limiter.try_acquire()):
+                    endpoint.hedges += 1
+                    pending.add(asyncio.ensure_future(send()))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            endpoint.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the client loop and return a concurrent future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _submit_request(self, method, url, headers, data=None, params=None, coalesce=None, raw=False):
+        """
+        Submit a request, sharing one upstream call between identical in-flight requests.
+
+        GET requests are coalesced by default; pass ``coalesce=True`` for
+        idempotent POSTs. Callers must treat the shared response as read-only.
+        """
+        if coalesce is None:
+            coalesce = method == 'GET'
+        # Coalesced requests are the read-only ones, so they are also safe to retry
+        idempotent = coalesce
+        if not self._coalesces(method, coalesce):
+            return self.submit(self.fetch(
+                method, url, headers, data=data, params=params, idempotent=idempotent, raw=raw
+            ))
+
+        key = request_key(method, url, headers, data, params, raw)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced_requests += 1
+                return future
+            future = self.submit(self.fetch(
+                method, url, headers, data=data, params=params, idempotent=True, raw=raw
+            ))
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget_inflight(key, done))
+        return future
+
+    def _coalesces(self, method, coalesce):
+        """Whether a request may share its upstream call with identical ones"""
+        if coalesce is None:
+            coalesce = method == 'GET'
+        return coalesce and get_setting('COALESCE_REQUESTS')
+
+    def _forget_inflight(self, key, future):
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def single_flight_stats(self):
+        with self._inflight_lock:
+            return {
+                'in_flight': len(self._inflight),
+                'coalesced': self.coalesced_requests,
+            }
+
+    def outstanding_requests(self, base_url):
+        """Requests currently in flight to the upstream serving ``base_url``"""
+        return self.outstanding.get(upstream_origin(base_url), 0)
+
+    def endpoint_stats(self):
+        return self.endpoints.stats()
+
+    async def _call(self, function):
+        return function()
+
+    def metrics_stats(self):
+        """Snapshot of the latency metrics, taken on the client loop that updates them"""
+        return self.submit(self._call(self.metrics.stats)).result()
+
+    def reset_metrics(self):
+        """Clear the latency metrics on the client loop and wait until it is done"""
+        self.submit(self._call(self.metrics.clear)).result()
+
+    def configure_rate_limits(self, configs):
+        """Apply the rate limits of the given ``CheckAPIConfig`` rows on the client loop"""
+        limits = [
+            (config.name, config.api_key, config.rate_limit_per_second, config.rate_limit_burst,
+             config.rate_limit_queue_size, config.rate_limit_queue_timeout)
+            for config in configs
+        ]
+        self._ensure_loop().call_soon_threadsafe(self.rate_limiters.configure, limits)
+
+    def rate_limit_stats(self):
+        return self.rate_limiters.stats()
+
+    def request(self, method, url, headers, data=None, params=None, coalesce=None, raw=False):
+        """Make a blocking request and return ``(status, data)``"""
+        return self._submit_request(method, url, headers, data, params, coalesce, raw).result()
+
+    async def arequest(self, method, url, headers, data=None, params=None, coalesce=None, raw=False):
+        """Make a request from any event loop and return ``(status, data)``"""
+        future = self._submit_request(method, url, headers, data, params, coalesce, raw)
+        if self._coalesces(method, coalesce):
+            # Other callers may be waiting on the same upstream call, so cancelling
+            # this caller (e.g. a client disconnect) must not cancel it for them
+            return await asyncio.shield(asyncio.wrap_future(future))
+        return await asyncio.wrap_future(future)
+
+    async def _close_session(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def close(self):
+        """Close the pooled session and stop the client loop"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid() or not thread.is_alive():
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._close_session(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error closing Check API session: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+
+def upstream_origin(url):
+    """Scheme and host of a URL, identifying one upstream deployment"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def request_key(method, url, headers, data, params, raw=False):
+    """Hash identifying identical upstream requests (method, URL, API key, params, body, raw or decoded)"""
+    payload = json.dumps(
+        [method.upper(), url, headers.get('X-API-Key'), params or {}, data, raw],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Get the process-wide Check API client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = CheckAPIClient()
+    return _client
+
+
+def close_client():
+    """Close the process-wide Check API client (called at worker exit)"""
+    if _client is not None:
+        _client.close()
+
+
+atexit.register(close_client)
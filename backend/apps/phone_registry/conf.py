@@ -0,0 +1,92 @@
+"""
+Settings for the phone registry app.
+
+Values come from ``settings.PHONE_REGISTRY`` and fall back to the defaults below.
+"""
+
+from django.conf import settings
+
+DEFAULTS = {
+    # Serve proxy endpoints as native async views (enabled by config/asgi.py)
+    'ASYNC_VIEWS': False,
+    # Upstream connection pool
+    'POOL_LIMIT': 100,
+    'POOL_LIMIT_PER_HOST': 50,
+    'DNS_CACHE_TTL': 300,
+    'KEEPALIVE_TIMEOUT': 30,
+    'REQUEST_TIMEOUT': 30,
+    # Share one upstream call between identical concurrent requests
+    'COALESCE_REQUESTS': True,
+    # Relay upstream bodies undecoded where the view doesn't inspect them
+    'PASSTHROUGH_RESPONSES': True,
+    # Load balancing across active configurations
+    'LOAD_BALANCING': 'round_robin',
+    'HEALTH_CHECK_INTERVAL': 10,
+    'HEALTH_CHECK_FAILURES': 2,
+    'HEALTH_CHECK_SUCCESSES': 2,
+    # Circuit breakers, retries and hedging
+    'CIRCUIT_FAILURE_THRESHOLD': 5,
+    'CIRCUIT_RESET_TIMEOUT': 30,
+    'RETRY_MAX_ATTEMPTS': 2,
+    'RETRY_BACKOFF_BASE': 0.2,
+    'RETRY_BACKOFF_MAX': 2,
+    'HEDGE_REQUESTS': False,
+    'HEDGE_MIN_SAMPLES': 20,
+    # Per-phase latency histograms and status counts
+    'UPSTREAM_METRICS': True,
+    # Micro-batch single phone checks into one upstream bulk check call
+    'CHECK_BATCHING': False,
+    'CHECK_BATCH_WINDOW_MS': 10,
+    'CHECK_BATCH_MAX_SIZE': 100,
+    'CHECK_BATCH_ENDPOINT': '',
+    # Active config cache: version stamp check interval and max age (seconds)
+    'CONFIG_VERSION_CHECK_INTERVAL': 1,
+    'CONFIG_CACHE_MAX_AGE': 30,
+    # phone_check result cache (TTLs in seconds)
+    'CHECK_CACHE_MAXSIZE': 10000,
+    'CHECK_CACHE_POSITIVE_TTL': 300,
+    'CHECK_CACHE_NEGATIVE_TTL': 30,
+    # phone_analytics stale-while-revalidate cache
+    'ANALYTICS_CACHE_MAXSIZE': 1000,
+    'ANALYTICS_CACHE_FRESH_TTL': 60,
+    'ANALYTICS_CACHE_STALE_TTL': 3600,
+    'ANALYTICS_CACHE_HISTORICAL_TTL': 86400,
+    'ANALYTICS_CACHE_REFRESH_BACKOFF': 5,
+    # Spam analysis fast path and batches
+    'SPAM_LOCAL_MATCHER': True,
+    'SPAM_PHRASES_FILE': '',
+    'SPAM_CACHE_MAXSIZE': 10000,
+    'SPAM_CACHE_TTL': 86400,
+    'SPAM_BATCH_CONCURRENCY': 8,
+    # Streaming registry export
+    'EXPORT_PAGE_SIZE': 1000,
+    'EXPORT_PREFETCH_PAGES': 4,
+    # Local registry mirror
+    'MIRROR_SERVE_LIST': False,
+    'MIRROR_SERVE_CHECK': False,
+    'MIRROR_MAX_STALENESS': 900,
+    'MIRROR_SYNC_PAGE_SIZE': 1000,
+    'MIRROR_SYNC_OVERLAP': 300,
+    # Bloom filter of registered numbers
+    'BLOOM_SERVE_CHECK': False,
+    'BLOOM_FILTER_PATH': '',
+    'BLOOM_FALSE_POSITIVE_RATE': 0.01,
+    'BLOOM_MIN_CAPACITY': 1000000,
+    'BLOOM_MAX_STALENESS': 3600,
+    'BLOOM_RELOAD_INTERVAL': 10,
+    # Background bulk register jobs
+    'JOB_FILES_DIR': None,
+    'BULK_JOB_CHUNK_SIZE': 1000,
+    'BULK_JOB_CONCURRENCY': 4,
+    'BULK_JOB_MAX_RETRIES': 3,
+    'BULK_JOB_STALE_AFTER': 900,
+    # Cleanup jobs
+    'CLEANUP_JOB_STEP_DAYS': 30,
+    'CLEANUP_JOB_MAX_RETRIES': 3,
+    'CLEANUP_JOB_STALE_AFTER': 900,
+}
+
+
+def get_setting(name):
+    """Return a phone registry setting, falling back to its default"""
+    return getattr(settings, 'PHONE_REGISTRY', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,89 @@
+"""
+In-process cache of the active Check API configuration.
+
+Every proxied request needs the active ``CheckAPIConfig``. Instead of querying
+the database each time, the active rows are kept in memory and invalidated by
+model signals and ``update_config``. A version stamp in Django's cache lets
+other workers notice changes; with a process-local cache backend the
+``CONFIG_CACHE_MAX_AGE`` setting bounds how stale a worker can get.
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .client import get_client
+from .conf import get_setting
+from .models import CheckAPIConfig
+
+VERSION_CACHE_KEY = 'phone_registry:config_version'
+
+
+def get_config_version():
+    """Get the shared config version stamp, creating it if missing"""
+    return cache.get_or_set(VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def bump_config_version():
+    """Publish a new config version stamp to all workers"""
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+class ConfigCache:
+    """Thread-safe cache of the active Check API configurations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configs = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _is_fresh(self, now):
+        if self._configs is None or now - self._loaded_at >= get_setting('CONFIG_CACHE_MAX_AGE'):
+            return False
+        if now - self._checked_at < get_setting('CONFIG_VERSION_CHECK_INTERVAL'):
+            return True
+        self._checked_at = now
+        return get_config_version() == self._version
+
+    def get_active_configs(self):
+        """Get the active configurations, reloading them if stale"""
+        with self._lock:
+            if self._is_fresh(time.monotonic()):
+                return self._configs
+
+        # Read the version before querying so a concurrent change is never masked
+        version = get_config_version()
+        configs = list(CheckAPIConfig.objects.filter(is_active=True).order_by('pk'))
+
+        with self._lock:
+            now = time.monotonic()
+            self._configs = configs
+            self._version = version
+            self._loaded_at = now
+            self._checked_at = now
+        get_client().configure_rate_limits(configs)
+        return configs
+
+    def clear(self):
+        with self._lock:
+            self._configs = None
+            self._version = None
+
+
+config_cache = ConfigCache()
+
+
+def get_active_config():
+    """Get the first active Check API configuration, or None"""
+    configs = config_cache.get_active_configs()
+    return configs[0] if configs else None
+
+
+def invalidate_config_cache():
+    """Drop the cached configuration in this worker and signal the others"""
+    bump_config_version()
+    config_cache.clear()
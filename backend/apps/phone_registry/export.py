@@ -0,0 +1,180 @@
+"""
+Streaming export of the full phone registry.
+
+The Check API only serves the registry page by page. The export walks the
+pages itself, keeping up to ``EXPORT_PREFETCH_PAGES`` requests in flight,
+and renders each page as soon as it arrives so memory use stays bounded by
+the prefetch window rather than the registry size.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import math
+from collections import deque
+
+from .client import get_client
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FILTERS = ['botname', 'country', 'iso2', 'is_bulked', 'quality']
+EXPORT_FIELDS = ['phone_number', 'registered_at', 'botname', 'country', 'iso2', 'twofa', 'quality', 'is_bulked']
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+class RegistryPager:
+    """Builds page requests for a filtered walk over ``/api/phone/list``."""
+
+    def __init__(self, config, filters, order_direction='asc', limit=None):
+        self.client = get_client()
+        self.endpoint = f"{config.base_url}/api/phone/list"
+        self.headers = {
+            'X-API-Key': config.api_key,
+        }
+        self.limit = limit or get_setting('EXPORT_PAGE_SIZE')
+        self.prefetch = get_setting('EXPORT_PREFETCH_PAGES')
+        self.params = {
+            **filters,
+            'limit': self.limit,
+            'order_by': 'registered_at',
+            'order_direction': order_direction,
+        }
+        self.last_page = None
+
+    def fetch(self, page):
+        """Coroutine fetching one page on the client loop"""
+        return self.client.fetch(
+            'GET', self.endpoint, self.headers, params={**self.params, 'page': page}, idempotent=True
+        )
+
+    def _learn_page_count(self, response_status, response_data):
+        if response_status == 200 and isinstance(response_data, dict):
+            total = response_data.get('total')
+            items = response_data.get('items', [])
+            if total is not None and 0 < len(items) < min(int(total), self.limit):
+                # The Check API capped the page size; keep paging at its size
+                self.limit = len(items)
+                self.params['limit'] = self.limit
+            if total is not None:
+                self.last_page = max(1, math.ceil(int(total) / self.limit))
+        return response_status, response_data
+
+    def first_page(self):
+        """Fetch page 1 (blocking) and learn the page count from its total"""
+        return self._learn_page_count(*self.client.submit(self.fetch(1)).result())
+
+    async def afirst_page(self):
+        """Fetch page 1 from any event loop and learn the page count from its total"""
+        return self._learn_page_count(*await asyncio.wrap_future(self.client.submit(self.fetch(1))))
+
+    def has_page(self, page):
+        return self.last_page is None or page <= self.last_page
+
+    def items(self, page, response_status, response_data):
+        if response_status != 200 or not isinstance(response_data, dict):
+            raise ExportError(f"Check API returned status {response_status} for page {page}")
+        return response_data.get('items', [])
+
+
+def iter_pages(pager, first_data):
+    """Yield the items of each page, prefetching the following pages concurrently"""
+    items = first_data.get('items', [])
+    yield items
+    if len(items) < pager.limit:
+        return
+
+    pending = deque()
+    next_page = 2
+    try:
+        while True:
+            while len(pending) < pager.prefetch and pager.has_page(next_page):
+                pending.append((next_page, pager.client.submit(pager.fetch(next_page))))
+                next_page += 1
+            if not pending:
+                return
+            page, future = pending.popleft()
+            items = pager.items(page, *future.result())
+            yield items
+            if len(items) < pager.limit:
+                return
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def aiter_pages(pager, first_data):
+    """Async version of ``iter_pages`` for the ASGI views"""
+    items = first_data.get('items', [])
+    yield items
+    if len(items) < pager.limit:
+        return
+
+    pending = deque()
+    next_page = 2
+    try:
+        while True:
+            while len(pending) < pager.prefetch and pager.has_page(next_page):
+                future = asyncio.wrap_future(pager.client.submit(pager.fetch(next_page)))
+                pending.append((next_page, future))
+                next_page += 1
+            if not pending:
+                return
+            page, future = pending.popleft()
+            items = pager.items(page, *(await future))
+            yield items
+            if len(items) < pager.limit:
+                return
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def render_page(items, file_format, header=False):
+    """Render one page of registry items as CSV or NDJSON text"""
+    if file_format == 'ndjson':
+        return ''.join(json.dumps(item) + '\n' for item in items)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    writer.writerows(items)
+    return buffer.getvalue()
+
+
+def stream_export(pager, first_data, file_format):
+    """Yield the rendered export page by page for ``StreamingHttpResponse``"""
+    try:
+        for index, items in enumerate(iter_pages(pager, first_data)):
+            yield render_page(items, file_format, header=index == 0)
+    except Exception as e:
+        # Headers are already sent. Re-raise so the server aborts the
+        # response instead of ending it cleanly, and the client can tell
+        # the file is incomplete
+        logger.error(f"Phone registry export aborted: {e}")
+        raise
+
+
+async def astream_export(pager, first_data, file_format):
+    """Async version of ``stream_export`` for the ASGI views"""
+    index = 0
+    try:
+        async for items in aiter_pages(pager, first_data):
+            yield render_page(items, file_format, header=index == 0)
+            index += 1
+    except Exception as e:
+        # Headers are already sent. Re-raise so the server aborts the
+        # response instead of ending it cleanly, and the client can tell
+        # the file is incomplete
+        logger.error(f"Phone registry export aborted: {e}")
+        raise
@@ -0,0 +1,453 @@
+"""
+Background jobs for long-running phone registry operations.
+
+Jobs run in a daemon thread of the worker that accepted them, so the HTTP
+request returns immediately with a job id. Progress is written to the job row
+so any worker can answer status requests.
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import random
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics_cache import analytics_cache
+from .bloom import phone_bloom
+from .cache import invalidate_phone_numbers, phone_check_cache
+from .client import get_client
+from .conf import get_setting
+from .config_cache import get_active_config
+from .mirror import prune_mirror
+from .models import BulkRegisterJob, CleanupJob
+from .normalization import PhoneNumberDeduplicator
+
+logger = logging.getLogger(__name__)
+
+
+def get_job_files_dir():
+    return get_setting('JOB_FILES_DIR') or os.path.join(settings.BASE_DIR, 'media', 'phone_registry')
+
+
+def save_job_file(uploaded_file, suffix):
+    """Copy an uploaded file to the job files directory and return its path"""
+    directory = get_job_files_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.{suffix}")
+    with open(path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def iter_phone_numbers(path, file_format):
+    """
+    Stream phone numbers from a CSV or NDJSON file.
+
+    CSV files use the ``phone_number`` column if there is a header row,
+    otherwise the first column. NDJSON lines are either strings or objects
+    with a ``phone_number`` key.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if file_format == 'ndjson':
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                value = json.loads(line)
+                if isinstance(value, dict):
+                    value = value.get('phone_number')
+                if value:
+                    yield str(value).strip()
+            return
+
+        reader = csv.reader(f)
+        column = 0
+        for index, row in enumerate(reader):
+            if not row:
+                continue
+            if index == 0 and 'phone_number' in row:
+                column = row.index('phone_number')
+                continue
+            if column < len(row) and row[column].strip():
+                yield row[column].strip()
+
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def send_with_retries(config, method, path, data, max_retries):
+    """
+    Send one job request upstream, retrying failures with jittered backoff.
+
+    Returns ``(attempts, status, data, error)``; ``error`` is set when the
+    last attempt failed to connect or got a 5xx/429.
+    """
+    client = get_client()
+    endpoint = f"{config.base_url}{path}"
+    headers = {
+        'X-API-Key': config.api_key,
+        'Content-Type': 'application/json'
+    }
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response_status, response_data = await client.fetch(method, endpoint, headers, data=data)
+            if response_status < 500 and response_status != 429:
+                return attempt, response_status, response_data, None
+            error = f'Check API returned status {response_status}'
+        except Exception as e:
+            error = str(e)
+        if attempt > max_retries:
+            return attempt, None, None, error
+        await asyncio.sleep(random.uniform(0, min(30, 2 ** attempt)))
+
+
+# Seconds between progress writes while chunks are in flight, so a live job is never expired
+HEARTBEAT_INTERVAL = 60
+
+# Fields a bulk register worker saves while it runs. Status changes are made
+# with conditional updates instead, so a job failed by
+# expire_stale_bulk_register_jobs is never brought back by its worker
+BULK_PROGRESS_FIELDS = [
+    'total_numbers', 'duplicates_collapsed', 'invalid_numbers', 'chunks_total', 'chunks_succeeded',
+    'chunks_failed', 'newly_registered', 'already_exists', 'failed', 'chunk_results', 'updated_at',
+]
+
+
+class BulkRegisterRunner:
+    """Sends a bulk register job's chunks with bounded concurrency and records progress."""
+
+    def __init__(self, job):
+        self.job = job
+        self.concurrency = get_setting('BULK_JOB_CONCURRENCY')
+        self.max_retries = get_setting('BULK_JOB_MAX_RETRIES')
+        self.deduplicator = PhoneNumberDeduplicator()
+
+    def run(self):
+        job = self.job
+        config = get_active_config()
+        if config is None:
+            self.finish('failed', error='No active API configuration found.')
+            return
+
+        now = timezone.now()
+        if not BulkRegisterJob.objects.filter(pk=job.pk, status='pending').update(
+            status='processing', started_at=now, updated_at=now
+        ):
+            logger.warning(f"Bulk register job {job.pk} is no longer pending, not starting it")
+            return
+        job.status = 'processing'
+        job.started_at = now
+
+        client = get_client()
+        in_flight = {}
+        chunks = enumerate(iter_chunks(self.iter_numbers(), job.chunk_size))
+        exhausted = False
+
+        try:
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < self.concurrency:
+                    try:
+                        index, phone_numbers = next(chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    phone_bloom.add(phone_numbers)
+                    future = client.submit(send_with_retries(
+                        config, 'POST', '/api/phone/bulk-register', {'phone_numbers': phone_numbers}, self.max_retries
+                    ))
+                    in_flight[future] = (index, phone_numbers)
+                    job.total_numbers += len(phone_numbers)
+                    job.chunks_total += 1
+
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, phone_numbers = in_flight.pop(future)
+                    self.record_chunk(index, phone_numbers, *future.result())
+                self.save_progress()
+        except Exception:
+            # E.g. a malformed line in the file: let the chunks already sent
+            # finish and record them before the job is marked failed
+            self.drain(in_flight)
+            raise
+
+        self.save_progress()
+        status = 'completed' if job.chunks_failed == 0 else 'failed'
+        error = '' if status == 'completed' else f'{job.chunks_failed} of {job.chunks_total} chunks failed'
+        self.finish(status, error=error)
+
+    def drain(self, in_flight):
+        """Wait for chunks still in flight and record their results"""
+        for future in as_completed(in_flight):
+            index, phone_numbers = in_flight[future]
+            try:
+                self.record_chunk(index, phone_numbers, *future.result())
+            except Exception as e:
+                self.record_chunk(index, phone_numbers, 1, None, None, str(e))
+        in_flight.clear()
+        self.save_progress()
+
+    def save_progress(self):
+        job = self.job
+        job.duplicates_collapsed = self.deduplicator.collapsed
+        job.invalid_numbers = self.deduplicator.invalid
+        job.save(update_fields=BULK_PROGRESS_FIELDS)
+
+    def iter_numbers(self):
+        return self.deduplicator.filter(iter_phone_numbers(self.job.file_path, self.job.file_format))
+
+    def record_chunk(self, index, phone_numbers, attempts, response_status, response_data, error):
+        job = self.job
+        result = {
+            'index': index,
+            'size': len(phone_numbers),
+            'attempts': attempts,
+            'status': response_status,
+        }
+        if error is None and response_status < 400 and isinstance(response_data, dict):
+            job.chunks_succeeded += 1
+            for field in ('newly_registered', 'already_exists', 'failed'):
+                count = int(response_data.get(field, 0) or 0)
+                setattr(job, field, getattr(job, field) + count)
+                result[field] = count
+            invalidate_phone_numbers(phone_numbers)
+        else:
+            job.chunks_failed += 1
+            result['error'] = error or str(response_data)[:500]
+        job.chunk_results.append(result)
+
+    def finish(self, status, error=''):
+        """Mark the job finished, unless it was already failed (e.g. as stale)"""
+        job = self.job
+        now = timezone.now()
+        if BulkRegisterJob.objects.filter(pk=job.pk, status__in=['pending', 'processing']).update(
+            status=status, error=error, completed_at=now, updated_at=now
+        ):
+            job.status = status
+            job.error = error
+            job.completed_at = now
+        else:
+            job.refresh_from_db(fields=['status', 'error', 'completed_at', 'updated_at'])
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+
+
+def run_in_background(target, *args):
+    """Run a job function in a daemon thread with its own DB connection"""
+    def runner():
+        try:
+            target(*args)
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=runner, daemon=True)
+    thread.start()
+    return thread
+
+
+def run_bulk_register_job(job_id):
+    job = BulkRegisterJob.objects.get(pk=job_id)
+    try:
+        BulkRegisterRunner(job).run()
+    except Exception as e:
+        logger.exception(f"Bulk register job {job_id} failed")
+        BulkRegisterRunner(job).finish('failed', error=str(e))
+
+
+def expire_stale_bulk_register_jobs():
+    """Fail bulk register jobs whose worker stopped reporting progress, e.g. after a restart"""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('BULK_JOB_STALE_AFTER'))
+    return BulkRegisterJob.objects.filter(status__in=['pending', 'processing'], updated_at__lt=cutoff).update(
+        status='failed', error='Job stopped reporting progress', completed_at=timezone.now()
+    )
+
+
+def start_bulk_register_job(job):
+    return run_in_background(run_bulk_register_job, job.pk)
+
+
+# Fields a cleanup worker saves after each step; status changes are conditional updates
+CLEANUP_PROGRESS_FIELDS = ['deleted_count', 'mirror_deleted_count', 'steps_completed', 'step_results', 'updated_at']
+
+# Fields the Check API may report the number of deleted records in
+DELETED_COUNT_FIELDS = ('deleted_count', 'deleted', 'deleted_records')
+
+
+def deleted_count(response_data):
+    if isinstance(response_data, dict):
+        for field in DELETED_COUNT_FIELDS:
+            value = response_data.get(field)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+    return None
+
+
+class CleanupRunner:
+    """
+    Runs a retention cleanup as a series of smaller upstream deletes.
+
+    One retention delete over a large registry can outlast the request
+    timeout. The runner looks up the oldest record and deletes in slices of
+    ``CLEANUP_JOB_STEP_DAYS``, oldest first, down to the requested
+    retention. Each slice is a complete cleanup call, so a job that stops
+    half way has still only deleted records past the retention period.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.max_retries = get_setting('CLEANUP_JOB_MAX_RETRIES')
+
+    def run(self):
+        job = self.job
+        config = get_active_config()
+        if config is None:
+            self.finish('failed', error='No active API configuration found.')
+            return
+
+        steps = self.plan_steps(config)
+        now = timezone.now()
+        if not CleanupJob.objects.filter(pk=job.pk, is_running=True, status='pending').update(
+            status='processing', started_at=now, steps_total=len(steps), updated_at=now
+        ):
+            logger.warning(f"Cleanup job {job.pk} is no longer pending, not starting it")
+            return
+        job.status = 'processing'
+        job.started_at = now
+        job.steps_total = len(steps)
+
+        client = get_client()
+        for retention_days in steps:
+            # Stop if the job was failed as stale; another cleanup may be running now
+            if not CleanupJob.objects.filter(pk=job.pk, is_running=True).update(
+                current_retention_days=retention_days, updated_at=timezone.now()
+            ):
+                logger.warning(f"Cleanup job {job.pk} is no longer running, stopping")
+                job.refresh_from_db()
+                return
+            job.current_retention_days = retention_days
+            result = client.submit(send_with_retries(
+                config, 'DELETE', '/api/phone/cleanup', {'retention_days': retention_days}, self.max_retries
+            )).result()
+            if not self.record_step(retention_days, *result):
+                self.finish('failed', error=f'Cleanup of records older than {retention_days} days failed')
+                return
+        self.finish('completed')
+
+    def plan_steps(self, config):
+        """Retention periods to clean up with, from the oldest record down to the job's retention"""
+        target = self.job.retention_days
+        oldest = self.oldest_registered_at(config)
+        if oldest is None:
+            return [target]
+        step = max(1, get_setting('CLEANUP_JOB_STEP_DAYS'))
+        oldest_days = (timezone.now() - oldest).days
+        return list(range(oldest_days - step, target, -step)) + [target]
+
+    def oldest_registered_at(self, config):
+        """Registration time of the oldest upstream record, or None if unknown"""
+        try:
+            response_status, response_data = get_client().request(
+                'GET', f"{config.base_url}/api/phone/list", {'X-API-Key': config.api_key},
+                params={'page': 1, 'limit': 1, 'order_by': 'registered_at', 'order_direction': 'asc'}
+            )
+        except Exception as e:
+            logger.warning(f"Cleanup job {self.job.pk} could not find the oldest record: {e}")
+            return None
+        if response_status != 200 or not isinstance(response_data, dict) or not response_data.get('items'):
+            return None
+        registered_at = parse_datetime(str(response_data['items'][0].get('registered_at') or ''))
+        if registered_at is not None and timezone.is_naive(registered_at):
+            registered_at = timezone.make_aware(registered_at)
+        return registered_at
+
+    def record_step(self, retention_days, attempts, response_status, response_data, error):
+        job = self.job
+        result = {
+            'retention_days': retention_days,
+            'attempts': attempts,
+            'status': response_status,
+        }
+        succeeded = error is None and response_status < 400
+        if succeeded:
+            count = deleted_count(response_data)
+            result['deleted'] = count
+            job.deleted_count += count or 0
+            job.mirror_deleted_count += prune_mirror(retention_days)
+            job.steps_completed += 1
+        else:
+            result['error'] = error or str(response_data)[:500]
+        # Retention deletes arbitrary numbers, so drop every cached result
+        phone_check_cache.clear()
+        analytics_cache.clear()
+        job.step_results.append(result)
+        job.save(update_fields=CLEANUP_PROGRESS_FIELDS)
+        return succeeded
+
+    def finish(self, status, error=''):
+        """Mark the job finished, unless it was already failed (e.g. as stale)"""
+        job = self.job
+        now = timezone.now()
+        if CleanupJob.objects.filter(pk=job.pk, is_running=True).update(
+            status=status, error=error, is_running=False, completed_at=now, updated_at=now
+        ):
+            job.status = status
+            job.error = error
+            job.is_running = False
+            job.completed_at = now
+        else:
+            job.refresh_from_db(fields=['status', 'error', 'is_running', 'completed_at', 'updated_at'])
+
+
+def expire_stale_cleanup_jobs():
+    """Fail running cleanup jobs whose worker stopped reporting progress, e.g. after a restart"""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('CLEANUP_JOB_STALE_AFTER'))
+    return CleanupJob.objects.filter(is_running=True, updated_at__lt=cutoff).update(
+        status='failed', is_running=False, error='Job stopped reporting progress', completed_at=timezone.now()
+    )
+
+
+def create_cleanup_job(user, retention_days):
+    """Create a cleanup job; returns ``(job, None)``, or ``(None, running_job)`` if one is already running"""
+    expire_stale_cleanup_jobs()
+    try:
+        with transaction.atomic():
+            return CleanupJob.objects.create(created_by=user, retention_days=retention_days), None
+    except IntegrityError:
+        return None, CleanupJob.objects.filter(is_running=True).first()
+
+
+def run_cleanup_job(job_id):
+    job = CleanupJob.objects.get(pk=job_id)
+    try:
+        CleanupRunner(job).run()
+    except Exception as e:
+        logger.exception(f"Cleanup job {job_id} failed")
+        CleanupRunner(job).finish('failed', error=str(e))
+
+
+def start_cleanup_job(job):
+    return run_in_background(run_cleanup_job, job.pk)
@@ -0,0 +1,220 @@
+"""
+Benchmark concurrent ``phone_check`` throughput of the WSGI and ASGI views
+against a local stand-in Check API.
+
+    python manage.py bench_check_api --requests 2000 --concurrency 200
+
+Every mode keeps ``--concurrency`` checks in flight through the real view
+functions, including JWT authentication, validation and the response, with
+a staff user and a ``CheckAPIConfig`` pointing at the stand-in. These are
+created in a throwaway test database, so the configured database is not
+touched. ``sync`` mode calls the WSGI view (``views.phone_check``) from one
+blocked thread per in-flight check. ``async`` mode calls the ASGI view
+(``async_views.phone_check``) as coroutines on one event loop. ``batch``
+mode calls the ASGI view with ``CHECK_BATCHING`` enabled, so the checks are
+batched (``--batch-window-ms`` / ``--batch-size``). The Check API has no
+bulk check endpoint, so a batch is sent as single checks unless
+``--batch-endpoint`` names one, which the stand-in then serves.
+Mirror and Bloom filter answers are turned off, and each mode checks numbers
+no earlier mode has checked, so every check goes upstream.
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from aiohttp import web
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.phone_registry import async_views, batching, views
+from apps.phone_registry.batching import CheckBatcher
+from apps.phone_registry.client import get_client
+from apps.phone_registry.config_cache import config_cache
+from apps.phone_registry.conf import get_setting
+from apps.phone_registry.models import CheckAPIConfig
+
+CHECK_PATH = '/api/phone/check/'
+
+
+class StubCheckAPI:
+    """Minimal in-process stand-in for the Check API with fixed latency."""
+
+    def __init__(self, latency, port=0, bulk_path=''):
+        self.latency = latency
+        self.port = port
+        self.bulk_path = bulk_path
+        self.request_count = 0
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = None
+
+    async def check(self, request):
+        self.request_count += 1
+        await asyncio.sleep(self.latency)
+        data = await request.json()
+        phone_number = data.get('phone_number', '')
+        return web.json_response({'exists': phone_number.endswith('1'), 'phone_number': phone_number})
+
+    async def check_bulk(self, request):
+        self.request_count += 1
+        await asyncio.sleep(self.latency)
+        data = await request.json()
+        return web.json_response({'results': [
+            {'exists': phone_number.endswith('1'), 'phone_number': phone_number}
+            for phone_number in data.get('phone_numbers', [])
+        ]})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/api/phone/check', self.check)
+        if self.bulk_path:
+            app.router.add_post(self.bulk_path, self.check_bulk)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def summarize(latencies, statuses, elapsed, upstream_requests):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for response_status in statuses if response_status != 200),
+        'upstream_requests': upstream_requests,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark phone_check throughput of the WSGI and ASGI views, with and without micro-batching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Total phone checks per mode')
+        parser.add_argument('--concurrency', type=int, default=200, help='In-flight checks in every mode')
+        parser.add_argument('--latency-ms', type=float, default=50.0, help='Stub Check API response latency')
+        parser.add_argument('--batch-window-ms', type=float, default=10.0, help='Batching window in batch mode')
+        parser.add_argument('--batch-size', type=int, default=100, help='Maximum batch size in batch mode')
+        parser.add_argument(
+            '--batch-endpoint', default=get_setting('CHECK_BATCH_ENDPOINT'),
+            help='Bulk check path for batch mode, served by the stand-in (default: none, single checks)'
+        )
+        parser.add_argument('--modes', default='sync,async,batch', help='Comma-separated modes to run')
+
+    def handle(self, *args, **options):
+        stub = StubCheckAPI(latency=options['latency_ms'] / 1000, bulk_path=options['batch_endpoint'])
+        base_url = stub.start()
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = get_user_model().objects.create_user(username='bench', email='bench@example.com', is_staff=True)
+            CheckAPIConfig.objects.create(name='bench', base_url=base_url, api_key='bench')
+            config_cache.clear()
+            authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+            total = options['requests']
+
+            for index, mode in enumerate(options['modes'].split(',')):
+                mode = mode.strip()
+                # Numbers no earlier mode has checked, so no answer is cached
+                numbers = [f'+1555{index:02d}{i:07d}' for i in range(total)]
+                upstream_before = stub.request_count
+                with self.view_settings(batched=mode == 'batch', options=options):
+                    if mode == 'sync':
+                        run = self.run_sync(numbers, authorization, options['concurrency'])
+                    elif mode in ('async', 'batch'):
+                        run = asyncio.run(self.run_async(numbers, authorization, options['concurrency']))
+                    else:
+                        self.stderr.write(f"Unknown mode: {mode}")
+                        continue
+                self.report(mode, summarize(*run, stub.request_count - upstream_before))
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            stub.stop()
+
+    @contextmanager
+    def view_settings(self, batched, options):
+        """Send every check upstream, through a batcher with the benchmark's window and size in batch mode"""
+        phone_registry = {
+            **getattr(settings, 'PHONE_REGISTRY', {}),
+            'CHECK_BATCHING': batched,
+            'MIRROR_SERVE_CHECK': False,
+            'BLOOM_SERVE_CHECK': False,
+        }
+        previous_batcher = batching._batcher
+        if batched:
+            batching._batcher = CheckBatcher(
+                get_client(), window_ms=options['batch_window_ms'], max_size=options['batch_size'],
+                endpoint=options['batch_endpoint']
+            )
+        try:
+            with override_settings(PHONE_REGISTRY=phone_registry):
+                yield
+        finally:
+            batching._batcher = previous_batcher
+
+    def run_sync(self, numbers, authorization, threads):
+        factory = RequestFactory()
+
+        def one(phone_number):
+            request = factory.post(
+                CHECK_PATH, {'phone_number': phone_number}, content_type='application/json',
+                HTTP_AUTHORIZATION=authorization
+            )
+            started = time.perf_counter()
+            response = views.phone_check(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+            connection.close()
+            return elapsed, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(one, numbers))
+        return [latency for latency, _ in results], [code for _, code in results], time.perf_counter() - started
+
+    async def run_async(self, numbers, authorization, concurrency):
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(phone_number):
+            request = factory.post(
+                CHECK_PATH, {'phone_number': phone_number}, content_type='application/json',
+                headers={'Authorization': authorization}
+            )
+            async with semaphore:
+                started = time.perf_counter()
+                response = await async_views.phone_check(request)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(phone_number) for phone_number in numbers))
+        return [latency for latency, _ in results], [code for _, code in results], time.perf_counter() - started
+
+    def report(self, mode, result):
+        self.stdout.write(
+            f"{mode:>6}: {result['requests']} requests in {result['elapsed_s']:.2f}s "
+            f"-> {result['throughput_rps']:.0f} req/s "
+            f"(p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms), "
+            f"{result['errors']} errors, {result['upstream_requests']} upstream requests"
+        )
@@ -0,0 +1,29 @@
+"""
+Rebuild the Bloom filter of registered phone numbers from the Check API.
+
+    python manage.py build_phone_bloom
+
+Run it from cron (or a systemd timer) more often than ``BLOOM_MAX_STALENESS``
+so ``phone_check`` keeps answering unregistered numbers locally.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.phone_registry.bloom import build_bloom, get_bloom_path
+from apps.phone_registry.config_cache import get_active_config
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Bloom filter of registered phone numbers from the Check API'
+
+    def handle(self, *args, **options):
+        config = get_active_config()
+        if config is None:
+            raise CommandError('No active API configuration found.')
+
+        try:
+            added = build_bloom(config, stdout=self.stdout if options['verbosity'] > 1 else None)
+        except Exception as e:
+            raise CommandError(f'Bloom filter build failed: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {added} registry records to {get_bloom_path()}'))
@@ -0,0 +1,34 @@
+"""
+Sync the local phone registry mirror from the Check API.
+
+    python manage.py sync_phone_registry          # new records since the watermark
+    python manage.py sync_phone_registry --full   # everything, dropping rows removed upstream
+
+Run it from cron (or a systemd timer) more often than ``MIRROR_MAX_STALENESS``
+so the mirror keeps being served.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.phone_registry.config_cache import get_active_config
+from apps.phone_registry.mirror import record_sync_error, sync_mirror
+
+
+class Command(BaseCommand):
+    help = 'Incrementally sync the local phone registry mirror from the Check API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-sync the whole registry instead of new records')
+
+    def handle(self, *args, **options):
+        config = get_active_config()
+        if config is None:
+            raise CommandError('No active API configuration found.')
+
+        try:
+            written = sync_mirror(config, full=options['full'], stdout=self.stdout if options['verbosity'] > 1 else None)
+        except Exception as e:
+            record_sync_error(e)
+            raise CommandError(f'Registry sync failed: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Synced {written} registry records'))
@@ -0,0 +1,217 @@
+"""
+Latency histograms and status counts for Check API calls.
+
+The client session carries an aiohttp ``TraceConfig`` that timestamps each
+upstream call. Every call then lands in a histogram per phase:
+
+- ``queue``: waiting for a free connection in the pool
+- ``dns``: resolving the host (only on a DNS cache miss)
+- ``connect``: opening the TCP connection, including the TLS handshake
+  (aiohttp reports both as one step)
+- ``server``: from sending the request until the response headers arrive
+- ``body``: reading the response body
+- ``total``: the whole call
+
+``queue``, ``dns`` and ``connect`` are only recorded when they happen, so
+calls on a reused keep-alive connection add nothing to them. Calls are
+grouped by upstream and endpoint (the last URL path segment, e.g. ``check``
+or ``bulk-register``). Status codes and errors are counted per endpoint.
+
+All state is only touched on the client event loop: calls are recorded
+there, and ``CheckAPIClient.metrics_stats`` / ``reset_metrics`` run the
+snapshot and the reset there too, so no locking is needed.
+"""
+
+import time
+from collections import Counter
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import aiohttp
+
+PHASES = ['queue', 'dns', 'connect', 'server', 'body', 'total']
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+BUCKET_BOUNDS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        index = 0
+        while index < len(BUCKET_BOUNDS_MS) and ms > BUCKET_BOUNDS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKET_BOUNDS_MS[index - 1] if index else 0.0
+                upper = min(BUCKET_BOUNDS_MS[index], self.max) if index < len(BUCKET_BOUNDS_MS) else self.max
+                return round(min(lower + (upper - lower) * (rank - seen) / count, self.max), 2)
+            seen += count
+        return round(self.max, 2)
+
+    def stats(self):
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS + ['+Inf'], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count, 2) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max, 2),
+            'buckets': buckets,
+        }
+
+
+class EndpointMetrics:
+    """Phase histograms and status counts for one upstream endpoint."""
+
+    def __init__(self, upstream, endpoint):
+        self.upstream = upstream
+        self.endpoint = endpoint
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def stats(self):
+        return {
+            'upstream': self.upstream,
+            'endpoint': self.endpoint,
+            'statuses': {str(code): count for code, count in sorted(self.statuses.items())},
+            'errors': dict(self.errors),
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'phases': {phase: histogram.stats() for phase, histogram in self.phases.items()},
+        }
+
+
+class RequestTiming:
+    """Timestamps of one upstream call, filled in by the trace hooks."""
+
+    __slots__ = ('started', 'queued', 'dequeued', 'dns_started', 'dns', 'connect_started', 'connected',
+                 'reused', 'headers_sent', 'response_started', 'finished')
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.queued = self.dequeued = None
+        self.dns_started = None
+        self.dns = 0.0
+        self.connect_started = self.connected = None
+        self.reused = False
+        self.headers_sent = self.response_started = self.finished = None
+
+
+def _timing(trace_config_ctx):
+    timing = trace_config_ctx.trace_request_ctx
+    return timing if isinstance(timing, RequestTiming) else None
+
+
+def _stamp(attribute):
+    async def hook(session, trace_config_ctx, params):
+        timing = _timing(trace_config_ctx)
+        if timing is not None:
+            setattr(timing, attribute, time.monotonic())
+    return hook
+
+
+async def _on_dns_resolvehost_end(session, trace_config_ctx, params):
+    timing = _timing(trace_config_ctx)
+    if timing is not None and timing.dns_started is not None:
+        timing.dns += time.monotonic() - timing.dns_started
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    timing = _timing(trace_config_ctx)
+    if timing is not None:
+        timing.reused = True
+
+
+def make_trace_config():
+    """Trace hooks that fill in the ``RequestTiming`` passed as ``trace_request_ctx``"""
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+    trace_config.on_connection_queued_start.append(_stamp('queued'))
+    trace_config.on_connection_queued_end.append(_stamp('dequeued'))
+    trace_config.on_connection_create_start.append(_stamp('connect_started'))
+    trace_config.on_connection_create_end.append(_stamp('connected'))
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_dns_resolvehost_start.append(_stamp('dns_started'))
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_request_headers_sent.append(_stamp('headers_sent'))
+    trace_config.on_request_end.append(_stamp('response_started'))
+    return trace_config
+
+
+def endpoint_name(url):
+    """Short endpoint name from an upstream URL, e.g. ``check`` for ``.../api/phone/check``"""
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    return segments[-1] if segments else '/'
+
+
+class UpstreamMetrics:
+    """``EndpointMetrics`` per (upstream, endpoint)."""
+
+    def __init__(self):
+        self._endpoints = {}
+
+    def get(self, url):
+        parts = urlsplit(url)
+        key = (f"{parts.scheme}://{parts.netloc}", endpoint_name(url))
+        metrics = self._endpoints.get(key)
+        if metrics is None:
+            metrics = self._endpoints[key] = EndpointMetrics(*key)
+        return metrics
+
+    def record(self, url, timing, response_status):
+        """Record a completed call"""
+        metrics = self.get(url)
+        metrics.statuses[response_status] += 1
+        phases = metrics.phases
+        if timing.queued is not None and timing.dequeued is not None:
+            phases['queue'].observe(timing.dequeued - timing.queued)
+        if timing.dns:
+            phases['dns'].observe(timing.dns)
+        if timing.connect_started is not None and timing.connected is not None:
+            # DNS resolution happens inside connection creation; count it once
+            phases['connect'].observe(max(0.0, timing.connected - timing.connect_started - timing.dns))
+            metrics.new_connections += 1
+        elif timing.reused:
+            metrics.reused_connections += 1
+        if timing.headers_sent is not None and timing.response_started is not None:
+            phases['server'].observe(timing.response_started - timing.headers_sent)
+        if timing.response_started is not None and timing.finished is not None:
+            phases['body'].observe(timing.finished - timing.response_started)
+        phases['total'].observe((timing.finished or time.monotonic()) - timing.started)
+
+    def record_error(self, url, error):
+        """Record a call that failed without a response"""
+        self.get(url).errors[type(error).__name__] += 1
+
+    def stats(self):
+        return [metrics.stats() for metrics in list(self._endpoints.values())]
+
+    def clear(self):
+        self._endpoints.clear()
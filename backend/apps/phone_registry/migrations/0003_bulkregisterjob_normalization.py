@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0002_bulkregisterjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkregisterjob',
+            name='duplicates_collapsed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bulkregisterjob',
+            name='invalid_numbers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
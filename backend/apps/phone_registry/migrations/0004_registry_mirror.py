@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0003_bulkregisterjob_normalization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegisteredPhone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=32, unique=True)),
+                ('registered_at', models.DateTimeField(db_index=True)),
+                ('botname', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('country', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('iso2', models.CharField(blank=True, db_index=True, max_length=10)),
+                ('twofa', models.CharField(blank=True, max_length=1000)),
+                ('quality', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('is_bulked', models.BooleanField(default=False)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Registered Phone (mirror)',
+                'verbose_name_plural': 'Registered Phones (mirror)',
+                'db_table': 'phone_registry_registered_phones',
+                'ordering': ['-registered_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistryMirrorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.DateTimeField(blank=True, help_text='Newest registered_at seen upstream', null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('last_sync_rows', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Registry Mirror State',
+                'db_table': 'phone_registry_mirror_state',
+            },
+        ),
+    ]
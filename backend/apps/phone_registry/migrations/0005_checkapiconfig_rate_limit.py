@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:06
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0004_registry_mirror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkapiconfig',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(default=10, help_text='Requests that may be sent at once before the rate limit applies', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='checkapiconfig',
+            name='rate_limit_per_second',
+            field=models.FloatField(default=0, help_text='Maximum requests per second sent to the Check API (0 = unlimited)', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='checkapiconfig',
+            name='rate_limit_queue_size',
+            field=models.PositiveIntegerField(default=100, help_text='Requests allowed to wait for the rate limit before returning 429'),
+        ),
+        migrations.AddField(
+            model_name='checkapiconfig',
+            name='rate_limit_queue_timeout',
+            field=models.FloatField(default=5, help_text='Seconds a request may wait for the rate limit before returning 429', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
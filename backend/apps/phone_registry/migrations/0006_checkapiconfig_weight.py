@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0005_checkapiconfig_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkapiconfig',
+            name='weight',
+            field=models.PositiveIntegerField(default=1, help_text='Share of requests sent to this upstream when several configurations are active', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
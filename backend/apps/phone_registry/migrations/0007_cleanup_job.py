@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0006_checkapiconfig_weight'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleanupJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retention_days', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('is_running', models.BooleanField(default=True, help_text='Set while pending or processing; only one job may run')),
+                ('steps_total', models.PositiveIntegerField(default=0)),
+                ('steps_completed', models.PositiveIntegerField(default=0)),
+                ('current_retention_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('deleted_count', models.PositiveBigIntegerField(default=0)),
+                ('mirror_deleted_count', models.PositiveBigIntegerField(default=0)),
+                ('step_results', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='phone_cleanup_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cleanup Job',
+                'verbose_name_plural': 'Cleanup Jobs',
+                'db_table': 'phone_registry_cleanup_jobs',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_running', True)), fields=('is_running',), name='phone_registry_one_running_cleanup')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone_registry', '0007_cleanup_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkregisterjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
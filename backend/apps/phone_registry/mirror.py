@@ -0,0 +1,194 @@
+"""
+Local mirror of the Check API phone registry.
+
+``python manage.py sync_phone_registry`` copies registry records into
+``RegisteredPhone``. Incremental syncs walk ``/api/phone/list`` newest first
+and stop once they pass the stored ``registered_at`` watermark (less
+``MIRROR_SYNC_OVERLAP`` seconds for records that arrive late), so a sync
+costs a page or two instead of a full walk.
+
+With ``MIRROR_SERVE_LIST`` / ``MIRROR_SERVE_CHECK`` enabled, ``phone_list``
+and ``phone_check`` answer from the mirror while it is younger than
+``MIRROR_MAX_STALENESS`` seconds. Local responses carry a ``freshness`` block
+so callers can see how old the data is.
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .conf import get_setting
+from .export import RegistryPager, iter_pages
+from .models import RegisteredPhone, RegistryMirrorState
+from .normalization import normalize_phone_number
+
+MIRROR_FIELDS = ['phone_number', 'registered_at', 'botname', 'country', 'iso2', 'twofa', 'quality', 'is_bulked']
+LIST_FILTERS = ['botname', 'country', 'iso2', 'is_bulked', 'quality']
+
+
+class MirrorSyncError(Exception):
+    pass
+
+
+def parse_record(item):
+    """Build a ``RegisteredPhone`` from a ``/api/phone/list`` item, or None if unusable"""
+    registered_at = parse_datetime(str(item.get('registered_at') or ''))
+    phone_number = item.get('phone_number')
+    if registered_at is None or not phone_number:
+        return None
+    if timezone.is_naive(registered_at):
+        registered_at = timezone.make_aware(registered_at, dt_timezone.utc)
+    return RegisteredPhone(
+        phone_number=str(phone_number)[:32],
+        registered_at=registered_at,
+        botname=item.get('botname') or '',
+        country=item.get('country') or '',
+        iso2=item.get('iso2') or '',
+        twofa=item.get('twofa') or '',
+        quality=item.get('quality') or '',
+        is_bulked=bool(item.get('is_bulked')),
+    )
+
+
+def upsert_records(records):
+    RegisteredPhone.objects.bulk_create(
+        records,
+        update_conflicts=True,
+        unique_fields=['phone_number'],
+        update_fields=[field for field in MIRROR_FIELDS if field != 'phone_number'] + ['synced_at'],
+    )
+
+
+def sync_mirror(config, full=False, stdout=None):
+    """
+    Copy new upstream records into the mirror and advance the watermark.
+
+    A full sync walks the whole registry and afterwards deletes mirror rows
+    that were not seen, e.g. removed upstream by a retention cleanup.
+    Returns the number of records written.
+    """
+    state = RegistryMirrorState.load()
+    started_at = timezone.now()
+    cutoff = None
+    if not full and state.watermark is not None:
+        cutoff = state.watermark - timedelta(seconds=get_setting('MIRROR_SYNC_OVERLAP'))
+
+    pager = RegistryPager(config, {}, order_direction='desc', limit=get_setting('MIRROR_SYNC_PAGE_SIZE'))
+    response_status, response_data = pager.first_page()
+    if response_status != 200 or not isinstance(response_data, dict):
+        raise MirrorSyncError(f"Check API returned status {response_status}")
+
+    watermark = state.watermark
+    written = 0
+    pages = iter_pages(pager, response_data)
+    try:
+        for items in pages:
+            records = [record for record in map(parse_record, items) if record is not None]
+            passed_cutoff = cutoff is not None and any(record.registered_at < cutoff for record in records)
+            if cutoff is not None:
+                records = [record for record in records if record.registered_at >= cutoff]
+            if records:
+                for record in records:
+                    record.synced_at = started_at
+                upsert_records(records)
+                written += len(records)
+                newest = max(record.registered_at for record in records)
+                if watermark is None or newest > watermark:
+                    watermark = newest
+                if stdout is not None:
+                    stdout.write(f"Synced {written} records")
+            if passed_cutoff:
+                break
+    finally:
+        pages.close()
+
+    with transaction.atomic():
+        if full:
+            RegisteredPhone.objects.filter(synced_at__lt=started_at).delete()
+            state.last_full_sync_at = started_at
+        state.watermark = watermark
+        state.last_synced_at = started_at
+        state.last_sync_rows = written
+        state.last_error = ''
+        state.save()
+    return written
+
+
+def record_sync_error(error):
+    state = RegistryMirrorState.load()
+    state.last_error = str(error)
+    state.save(update_fields=['last_error'])
+
+
+def prune_mirror(retention_days):
+    """Mirror a retention cleanup locally"""
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    return RegisteredPhone.objects.filter(registered_at__lt=cutoff).delete()[0]
+
+
+def get_freshness():
+    """Return the mirror freshness block, or None if it is too stale to serve"""
+    state = RegistryMirrorState.objects.filter(pk=1).first()
+    if state is None or state.last_synced_at is None:
+        return None
+    age = (timezone.now() - state.last_synced_at).total_seconds()
+    max_staleness = get_setting('MIRROR_MAX_STALENESS')
+    if max_staleness and age > max_staleness:
+        return None
+    return {
+        'source': 'mirror',
+        'synced_at': state.last_synced_at,
+        'age_seconds': round(age, 1),
+    }
+
+
+def local_check(phone_number):
+    """
+    Answer a phone check from the mirror.
+
+    Only numbers found in the mirror are answered; anything else may have been
+    registered since the last sync and goes upstream. Returns None to fall back.
+    """
+    if not get_setting('MIRROR_SERVE_CHECK'):
+        return None
+    freshness = get_freshness()
+    if freshness is None:
+        return None
+    candidates = {phone_number, normalize_phone_number(phone_number)}
+    record = RegisteredPhone.objects.filter(phone_number__in=candidates).values(*MIRROR_FIELDS).first()
+    if record is None:
+        return None
+    return {'exists': True, **record, 'freshness': freshness}
+
+
+def local_list(params):
+    """
+    Answer a ``phone_list`` query from the mirror.
+
+    ``params`` are validated ``PhoneListSerializer`` data. Returns None to fall
+    back to the Check API.
+    """
+    if not get_setting('MIRROR_SERVE_LIST'):
+        return None
+    freshness = get_freshness()
+    if freshness is None:
+        return None
+
+    queryset = RegisteredPhone.objects.filter(
+        **{key: params[key] for key in LIST_FILTERS if params.get(key) not in (None, '')}
+    )
+    order_by = params.get('order_by') or 'registered_at'
+    prefix = '-' if params.get('order_direction', 'desc') == 'desc' else ''
+    page = params['page']
+    limit = params['limit']
+    offset = (page - 1) * limit
+
+    return {
+        'items': list(queryset.order_by(f'{prefix}{order_by}', 'pk').values(*MIRROR_FIELDS)[offset:offset + limit]),
+        'total': queryset.count(),
+        'page': page,
+        'limit': limit,
+        'freshness': freshness,
+    }
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.conf import settings
 
@@ -8,6 +9,22 @@ class CheckAPIConfig(models.Model):
     api_key = models.CharField(max_length=255, help_text="API Key for Check API")
     base_url = models.URLField(default='http://checkapi.org', help_text="Base URL for Check API")
     is_active = models.BooleanField(default=True)
+    weight = models.PositiveIntegerField(
+        default=1, validators=[MinValueValidator(1)],
+        help_text="Share of requests sent to this upstream when several configurations are active"
+    )
+    rate_limit_per_second = models.FloatField(
+        default=0, validators=[MinValueValidator(0)], help_text="Maximum requests per second sent to the Check API (0 = unlimited)"
+    )
+    rate_limit_burst = models.PositiveIntegerField(
+        default=10, validators=[MinValueValidator(1)], help_text="Requests that may be sent at once before the rate limit applies"
+    )
+    rate_limit_queue_size = models.PositiveIntegerField(
+        default=100, help_text="Requests allowed to wait for the rate limit before returning 429"
+    )
+    rate_limit_queue_timeout = models.FloatField(
+        default=5, validators=[MinValueValidator(0)], help_text="Seconds a request may wait for the rate limit before returning 429"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -18,3 +35,143 @@ class CheckAPIConfig(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.base_url}"
+
+
+class BulkRegisterJob(models.Model):
+    """Background registration of a large uploaded list of phone numbers"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='bulk_register_jobs'
+    )
+    file_path = models.CharField(max_length=500)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    chunk_size = models.PositiveIntegerField(default=1000)
+    total_numbers = models.PositiveIntegerField(default=0)
+    duplicates_collapsed = models.PositiveIntegerField(default=0)
+    invalid_numbers = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_succeeded = models.PositiveIntegerField(default=0)
+    chunks_failed = models.PositiveIntegerField(default=0)
+    newly_registered = models.PositiveIntegerField(default=0)
+    already_exists = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    chunk_results = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'phone_registry_bulk_register_jobs'
+        ordering = ['-created_at']
+        verbose_name = 'Bulk Register Job'
+        verbose_name_plural = 'Bulk Register Jobs'
+
+    def __str__(self):
+        return f"Bulk register #{self.pk} - {self.status}"
+
+
+class CleanupJob(models.Model):
+    """Background retention cleanup, run against the Check API in age slices"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='phone_cleanup_jobs'
+    )
+    retention_days = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    is_running = models.BooleanField(default=True, help_text="Set while pending or processing; only one job may run")
+    steps_total = models.PositiveIntegerField(default=0)
+    steps_completed = models.PositiveIntegerField(default=0)
+    current_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    deleted_count = models.PositiveBigIntegerField(default=0)
+    mirror_deleted_count = models.PositiveBigIntegerField(default=0)
+    step_results = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'phone_registry_cleanup_jobs'
+        ordering = ['-created_at']
+        verbose_name = 'Cleanup Job'
+        verbose_name_plural = 'Cleanup Jobs'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_running'], condition=models.Q(is_running=True), name='phone_registry_one_running_cleanup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Cleanup #{self.pk} ({self.retention_days} days) - {self.status}"
+
+    @property
+    def progress(self):
+        """Fraction of cleanup steps done"""
+        if self.status == 'completed':
+            return 1.0
+        return self.steps_completed / self.steps_total if self.steps_total else 0.0
+
+
+class RegisteredPhone(models.Model):
+    """Local mirror of a Check API registry record, kept current by ``sync_phone_registry``"""
+    phone_number = models.CharField(max_length=32, unique=True)
+    registered_at = models.DateTimeField(db_index=True)
+    botname = models.CharField(max_length=100, blank=True, db_index=True)
+    country = models.CharField(max_length=100, blank=True, db_index=True)
+    iso2 = models.CharField(max_length=10, blank=True, db_index=True)
+    twofa = models.CharField(max_length=1000, blank=True)
+    quality = models.CharField(max_length=50, blank=True, db_index=True)
+    is_bulked = models.BooleanField(default=False)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'phone_registry_registered_phones'
+        ordering = ['-registered_at']
+        verbose_name = 'Registered Phone (mirror)'
+        verbose_name_plural = 'Registered Phones (mirror)'
+
+    def __str__(self):
+        return self.phone_number
+
+
+class RegistryMirrorState(models.Model):
+    """Sync watermark and freshness of the local registry mirror (single row)"""
+    watermark = models.DateTimeField(null=True, blank=True, help_text="Newest registered_at seen upstream")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    last_sync_rows = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'phone_registry_mirror_state'
+        verbose_name = 'Registry Mirror State'
+
+    def __str__(self):
+        return f"Registry mirror synced at {self.last_synced_at}"
+
+    @classmethod
+    def load(cls):
+        state, _ = cls.objects.get_or_create(pk=1)
+        return state
@@ -0,0 +1,87 @@
+"""
+Phone number normalization helpers.
+
+Numbers are canonicalized E.164-style: formatting characters are removed, a
+leading ``00`` international prefix becomes ``+`` and only digits (plus a
+leading ``+``) are kept. Numbers without an international prefix are left as
+bare digits since their country cannot be inferred.
+"""
+
+import re
+from itertools import islice
+
+_FORMATTING = str.maketrans('', '', ' \t\r\n -.()[]/')
+_NON_DIGIT_RE = re.compile(r'\D')
+
+BATCH_SIZE = 10000
+
+
+def normalize_phone_number(phone_number):
+    """Canonicalize a phone number, e.g. ``"00 44 (20) 7946-0018"`` -> ``"+442079460018"``"""
+    value = phone_number.translate(_FORMATTING)
+    if value[1:].isdigit() and value[0] == '+':
+        return value
+    if not value.isdigit():
+        # Slow path for a '+' prefix or stray characters
+        has_plus = value.startswith('+')
+        value = _NON_DIGIT_RE.sub('', value)
+        if has_plus and value:
+            return '+' + value
+    if value.startswith('00'):
+        return '+' + value[2:] if len(value) > 2 else ''
+    return value
+
+
+class PhoneNumberDeduplicator:
+    """
+    Normalizes and de-duplicates a stream of phone numbers.
+
+    Numbers are processed in batches of ``BATCH_SIZE`` so the per-item work
+    runs in C (``map`` / ``dict.fromkeys``) rather than a Python loop.
+    Counters report how many entries were submitted, dropped as empty and
+    collapsed into an earlier duplicate.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.submitted = 0
+        self.invalid = 0
+
+    def filter(self, phone_numbers):
+        """Yield each normalized phone number the first time it is seen"""
+        iterator = iter(phone_numbers)
+        while True:
+            batch = list(islice(iterator, BATCH_SIZE))
+            if not batch:
+                return
+            self.submitted += len(batch)
+            normalized = dict.fromkeys(map(normalize_phone_number, batch))
+            if '' in normalized:
+                del normalized['']
+                self.invalid += sum(1 for phone_number in batch if not normalize_phone_number(phone_number))
+            new = [phone_number for phone_number in normalized if phone_number not in self.seen]
+            self.seen.update(new)
+            yield from new
+
+    @property
+    def unique(self):
+        return len(self.seen)
+
+    @property
+    def collapsed(self):
+        return self.submitted - self.invalid - self.unique
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'unique': self.unique,
+            'collapsed': self.collapsed,
+            'invalid': self.invalid,
+        }
+
+
+def normalize_batch(phone_numbers):
+    """Normalize and de-duplicate a list of phone numbers, returning ``(unique_numbers, stats)``"""
+    deduplicator = PhoneNumberDeduplicator()
+    unique_numbers = list(deduplicator.filter(phone_numbers))
+    return unique_numbers, deduplicator.stats()
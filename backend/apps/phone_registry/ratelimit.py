@@ -0,0 +1,180 @@
+"""
+Client-side rate limiting of Check API calls.
+
+Each ``CheckAPIConfig`` with a ``rate_limit_per_second`` gets a token bucket
+keyed by its API key. Calls that find the bucket empty wait in a queue until
+a token frees up. There is one queue per upstream endpoint, and the queues
+are served round robin, so a flood of bulk registrations can't starve phone
+checks. When the queue is full, or a call has waited ``queue_timeout``
+seconds, ``RateLimitExceeded`` is raised and the views answer 429 with
+``Retry-After`` without contacting the Check API.
+
+All limiter state lives on the client event loop.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Token bucket with per-lane FIFO queues served round robin."""
+
+    def __init__(self, rate, burst, max_queue, timeout):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lanes = OrderedDict()
+        self.queued = 0
+        self._timer = None
+        self.granted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def configure(self, rate, burst, max_queue, timeout):
+        self._refill()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.tokens = min(self.tokens, float(self.burst))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        """Whole seconds until the queue ahead of a new call has drained"""
+        self._refill()
+        return max(1, math.ceil((self.queued + 1 - self.tokens) / self.rate))
+
+    def try_acquire(self):
+        """Take a token without waiting; never jumps the queue"""
+        self._refill()
+        if self.queued == 0 and self.tokens >= 1:
+            self.tokens -= 1
+            self.granted += 1
+            return True
+        return False
+
+    async def acquire(self, lane):
+        """Wait for a token in ``lane``'s queue or raise ``RateLimitExceeded``"""
+        if self.try_acquire():
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded('Check API rate limit queue is full', self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self.lanes.setdefault(lane, deque()).append(future)
+        self.queued += 1
+        self.delayed += 1
+        self._schedule()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._remove(lane, future)
+            self.timeouts += 1
+            raise RateLimitExceeded('Timed out waiting for the Check API rate limit', self.retry_after())
+        except asyncio.CancelledError:
+            self._remove(lane, future)
+            raise
+
+    def _remove(self, lane, future):
+        waiters = self.lanes.get(lane)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self.lanes[lane]
+
+    def _schedule(self):
+        if self._timer is None and self.queued:
+            self._refill()
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._drain)
+
+    def _drain(self):
+        self._timer = None
+        self._refill()
+        while self.queued and self.tokens >= 1:
+            lane, waiters = next(iter(self.lanes.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self.lanes.move_to_end(lane)
+            else:
+                del self.lanes[lane]
+            self.tokens -= 1
+            self.granted += 1
+            future.set_result(None)
+        self._schedule()
+
+    def release_all(self):
+        """Let every queued call through, e.g. when the limit is removed"""
+        for waiters in self.lanes.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+        self.lanes.clear()
+        self.queued = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self):
+        tokens = min(float(self.burst), self.tokens + (time.monotonic() - self.updated) * self.rate)
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'tokens': round(tokens, 2),
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'granted': self.granted,
+            'delayed': self.delayed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
+
+
+class RateLimiterRegistry:
+    """Token buckets per API key, configured from the active ``CheckAPIConfig`` rows."""
+
+    def __init__(self):
+        self._limiters = {}
+        self._names = {}
+
+    def get(self, api_key):
+        return self._limiters.get(api_key)
+
+    def configure(self, limits):
+        """Apply ``[(name, api_key, rate, burst, max_queue, timeout), ...]``; runs on the client loop"""
+        seen = set()
+        for name, api_key, rate, burst, max_queue, timeout in limits:
+            if not rate or rate <= 0:
+                continue
+            seen.add(api_key)
+            self._names[api_key] = name
+            limiter = self._limiters.get(api_key)
+            if limiter is None:
+                self._limiters[api_key] = TokenBucketLimiter(rate, burst, max_queue, timeout)
+            else:
+                limiter.configure(rate, burst, max_queue, timeout)
+        for api_key in set(self._limiters) - seen:
+            self._limiters.pop(api_key).release_all()
+            self._names.pop(api_key, None)
+
+    def stats(self):
+        return {self._names.get(api_key, ''): limiter.stats() for api_key, limiter in list(self._limiters.items())}
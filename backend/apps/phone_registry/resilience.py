@@ -0,0 +1,129 @@
+"""
+Per-endpoint circuit breakers and latency tracking for the Check API client.
+
+Each upstream endpoint (method + URL) gets an ``Endpoint`` holding a circuit
+breaker and counters. After ``CIRCUIT_FAILURE_THRESHOLD`` consecutive failures
+(connection errors, timeouts or 5xx responses) the breaker opens and calls
+fail immediately with ``CircuitOpenError``. After ``CIRCUIT_RESET_TIMEOUT``
+seconds one trial call is let through; its outcome closes or re-opens it.
+
+All state is only changed on the client event loop, so no locking is needed.
+"""
+
+import random
+import time
+from collections import deque
+
+from .conf import get_setting
+
+LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Endpoint:
+    """Circuit breaker, recent latencies and retry/hedge counters for one upstream endpoint."""
+
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def allow(self):
+        """Return whether a call may go upstream now"""
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < get_setting('CIRCUIT_RESET_TIMEOUT'):
+                self.rejected += 1
+                return False
+            self.state = 'half_open'
+            self.trial_in_flight = False
+        if self.state == 'half_open':
+            if self.trial_in_flight:
+                self.rejected += 1
+                return False
+            self.trial_in_flight = True
+        self.requests += 1
+        return True
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+        self.state = 'closed'
+
+    def release(self):
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == 'half_open' or self.consecutive_failures >= get_setting('CIRCUIT_FAILURE_THRESHOLD'):
+            if self.state != 'open':
+                self.times_opened += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def p95(self):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[max(0, int(len(latencies) * 0.95) - 1)]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None until enough latencies are known"""
+        if self.state != 'closed' or len(self.latencies) < get_setting('HEDGE_MIN_SAMPLES'):
+            return None
+        return self.p95()
+
+    def stats(self):
+        p95 = self.p95()
+        return {
+            'method': self.method,
+            'url': self.url,
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened,
+            'requests': self.requests,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'p95_ms': p95 * 1000 if p95 is not None else None,
+        }
+
+
+class EndpointRegistry:
+    """Lazily created ``Endpoint`` per (method, URL)."""
+
+    def __init__(self):
+        self._endpoints = {}
+
+    def get(self, method, url):
+        key = (method.upper(), url)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints[key] = Endpoint(*key)
+        return endpoint
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in list(self._endpoints.values())]
+
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff before retry number ``attempt``"""
+    return random.uniform(0, min(get_setting('RETRY_BACKOFF_MAX'), get_setting('RETRY_BACKOFF_BASE') * 2 ** attempt))
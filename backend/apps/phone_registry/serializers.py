@@ -1,4 +1,12 @@
 from rest_framework import serializers
+from .models import BulkRegisterJob, CheckAPIConfig, CleanupJob
+
+
+class CheckAPIRateLimitSerializer(serializers.ModelSerializer):
+    """Serializer for the rate limit settings of a Check API configuration"""
+    class Meta:
+        model = CheckAPIConfig
+        fields = ['rate_limit_per_second', 'rate_limit_burst', 'rate_limit_queue_size', 'rate_limit_queue_timeout']
 
 
 class PhoneCheckSerializer(serializers.Serializer):
@@ -57,3 +65,62 @@ class PhoneCleanupSerializer(serializers.Serializer):
 class SpamAnalysisSerializer(serializers.Serializer):
     """Serializer for spam analysis request"""
     message = serializers.CharField()
+
+
+class SpamBatchAnalysisSerializer(serializers.Serializer):
+    """Serializer for batch spam analysis request"""
+    messages = serializers.ListField(
+        child=serializers.CharField(),
+        min_length=1,
+        max_length=1000,
+        help_text="List of messages (up to 1000)"
+    )
+    stream = serializers.BooleanField(default=False, help_text="Stream NDJSON results as they are ready")
+
+
+class BulkRegisterUploadSerializer(serializers.Serializer):
+    """Serializer for bulk register job file upload"""
+    file = serializers.FileField(help_text="CSV or NDJSON file of phone numbers")
+    file_format = serializers.ChoiceField(
+        choices=['csv', 'ndjson'], required=False,
+        help_text="Defaults to the file extension"
+    )
+
+    def validate(self, attrs):
+        if 'file_format' not in attrs:
+            name = attrs['file'].name.lower()
+            if name.endswith(('.ndjson', '.jsonl')):
+                attrs['file_format'] = 'ndjson'
+            elif name.endswith(('.csv', '.txt')):
+                attrs['file_format'] = 'csv'
+            else:
+                raise serializers.ValidationError({'file_format': 'Could not detect the file format.'})
+        return attrs
+
+
+class BulkRegisterJobSerializer(serializers.ModelSerializer):
+    """Serializer for bulk register job progress"""
+    class Meta:
+        model = BulkRegisterJob
+        fields = [
+            'id', 'status', 'file_format', 'chunk_size', 'total_numbers',
+            'duplicates_collapsed', 'invalid_numbers',
+            'chunks_total', 'chunks_succeeded', 'chunks_failed',
+            'newly_registered', 'already_exists', 'failed', 'chunk_results',
+            'error', 'created_at', 'updated_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
+
+
+class CleanupJobSerializer(serializers.ModelSerializer):
+    """Serializer for cleanup job progress"""
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = CleanupJob
+        fields = [
+            'id', 'status', 'retention_days', 'progress', 'steps_total', 'steps_completed',
+            'current_retention_days', 'deleted_count', 'mirror_deleted_count', 'step_results',
+            'error', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .config_cache import invalidate_config_cache
+from .models import CheckAPIConfig
+
+
+@receiver(post_save, sender=CheckAPIConfig)
+@receiver(post_delete, sender=CheckAPIConfig)
+def check_api_config_changed(sender, **kwargs):
+    """Invalidate the cached Check API configuration"""
+    invalidate_config_cache()
@@ -0,0 +1,243 @@
+"""
+Local fast path for ``analyze_spam``.
+
+Most analyzed messages are the same few account-status boilerplate texts, so
+the NLP service is only called for messages that can't be answered here:
+
+1. A phrase matcher (Aho–Corasick automaton) scans the normalized message
+   for known status phrases in several languages. When every phrase found
+   points to the same status, the message is answered locally with
+   ``source: 'local'``. Fields only the NLP service can fill in
+   (translation, template similarities, sentiment, confidence) are null.
+2. Otherwise the result cache is checked, keyed by the SHA-256 of the
+   normalized message (Unicode NFKC, case-folded, whitespace collapsed).
+3. Otherwise the message goes upstream and a successful result is cached.
+
+``SPAM_PHRASES_FILE`` can point to a JSON file of
+``{"status": {"language": ["phrase", ...]}}`` that is merged into the
+built-in phrases.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+
+from .cache import TTLCache
+from .conf import get_setting
+
+STATUSES = ['free', 'limited', 'registered', 'frozen']
+
+# Account-status boilerplate, by status and language. Phrases are matched
+# after normalize_message(), so they are written in lower case. There are no
+# phrases for 'registered', whose wording varies; those messages go upstream.
+SPAM_PHRASES = {
+    'free': {
+        'en': ['no limits are currently applied to your account', 'free as a bird'],
+        'ru': ['не наложено никаких ограничений', 'свободен от каких-либо ограничений', 'свободны как птица'],
+        'uk': ['не накладено жодних обмежень', 'вільні як птах'],
+        'es': ['tu cuenta no tiene ninguna limitación', 'libre como un pájaro'],
+        'pt': ['nenhum limite está aplicado à sua conta', 'livre como um pássaro'],
+        'de': ['keine einschränkungen für dein konto', 'frei wie ein vogel'],
+        'fr': ["aucune limite n'est actuellement appliquée à votre compte", 'libre comme un oiseau'],
+        'tr': ['hesabınıza şu anda herhangi bir sınırlama uygulanmıyor', 'kuş gibi özgürsünüz'],
+        'id': ['tidak ada batasan yang diterapkan pada akun anda', 'bebas seperti burung'],
+        'fa': ['هیچ محدودیتی روی حساب شما اعمال نشده', 'مثل پرنده آزاد هستید'],
+        'ar': ['لا توجد قيود مفروضة على حسابك', 'حر كالطائر'],
+    },
+    'limited': {
+        'en': [
+            'your account is now limited',
+            'your account was limited',
+            'may trigger a harsh response from our anti-spam systems',
+            "you will not be able to send messages to people who do not have your number",
+        ],
+        'ru': ['ваш аккаунт ограничен', 'резкую реакцию нашей антиспам-системы', 'не сможете писать тем, кто не добавил ваш номер'],
+        'uk': ['ваш акаунт обмежено', 'ваш обліковий запис обмежено'],
+        'es': ['tu cuenta está limitada', 'tu cuenta ha sido limitada'],
+        'pt': ['sua conta está limitada', 'sua conta foi limitada'],
+        'de': ['dein konto ist eingeschränkt', 'ihr konto ist eingeschränkt', 'dein konto wurde eingeschränkt'],
+        'fr': ['votre compte est limité', 'votre compte a été limité'],
+        'tr': ['hesabınız sınırlandırıldı', 'hesabınız sınırlı'],
+        'id': ['akun anda dibatasi', 'akun anda saat ini dibatasi'],
+        'fa': ['حساب شما محدود شده', 'حساب کاربری شما محدود شده'],
+        'ar': ['حسابك مقيد', 'تم تقييد حسابك'],
+    },
+    'frozen': {
+        'en': ['your account was frozen', 'your account has been frozen', 'your account is frozen'],
+        'ru': ['ваш аккаунт заморожен', 'ваш аккаунт был заморожен'],
+        'uk': ['ваш акаунт заморожено', 'ваш обліковий запис заморожено'],
+        'es': ['tu cuenta ha sido congelada', 'tu cuenta está congelada'],
+        'pt': ['sua conta foi congelada', 'sua conta está congelada'],
+        'de': ['dein konto wurde eingefroren', 'ihr konto wurde eingefroren'],
+        'fr': ['votre compte a été gelé', 'votre compte est gelé'],
+        'tr': ['hesabınız donduruldu'],
+        'id': ['akun anda dibekukan', 'akun anda telah dibekukan'],
+        'fa': ['حساب شما مسدود شده', 'حساب شما فریز شده'],
+        'ar': ['تم تجميد حسابك', 'حسابك مجمد'],
+    },
+}
+
+_WHITESPACE = re.compile(r'\s+')
+_QUOTES = str.maketrans({'’': "'", '‘': "'", '“': '"', '”': '"'})
+
+
+def normalize_message(message):
+    """Normalize a message for matching and hashing"""
+    message = unicodedata.normalize('NFKC', message).translate(_QUOTES).casefold()
+    return _WHITESPACE.sub(' ', message).strip()
+
+
+def message_key(message):
+    return hashlib.sha256(normalize_message(message).encode('utf-8')).hexdigest()
+
+
+class PhraseMatcher:
+    """Aho–Corasick automaton: finds every known phrase in one pass over the text."""
+
+    def __init__(self, phrases):
+        # phrases: [(phrase, payload), ...]
+        self.payloads = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for phrase, payload in phrases:
+            phrase = normalize_message(phrase)
+            if not phrase:
+                continue
+            node = 0
+            for char in phrase:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(len(self.payloads))
+            self.payloads.append((phrase, payload))
+
+        # Breadth-first so every fail link points to an already finished node
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        """Return ``(phrase, payload)`` for each distinct phrase found in normalized ``text``"""
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found.update(self.output[node])
+        return [self.payloads[index] for index in sorted(found)]
+
+
+def load_phrases():
+    """Built-in phrases merged with ``SPAM_PHRASES_FILE``, as ``[(phrase, (status, language)), ...]``"""
+    table = {status: {language: list(phrases) for language, phrases in languages.items()}
+             for status, languages in SPAM_PHRASES.items()}
+    path = get_setting('SPAM_PHRASES_FILE')
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for status, languages in json.load(f).items():
+                for language, phrases in languages.items():
+                    table.setdefault(status, {}).setdefault(language, []).extend(phrases)
+    return [
+        (phrase, (status, language))
+        for status, languages in table.items()
+        for language, phrases in languages.items()
+        for phrase in phrases
+    ]
+
+
+class SpamAnalyzer:
+    """Local phrase matching and a result cache in front of the analyze-spam service."""
+
+    def __init__(self, maxsize):
+        self.results = TTLCache(maxsize=maxsize)
+        self._matcher = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.local_hits = 0
+        self.ambiguous = 0
+        self.upstream_calls = 0
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = PhraseMatcher(load_phrases())
+        return self._matcher
+
+    def classify(self, message):
+        """Answer a message from known phrases, or return None if it isn't clear-cut"""
+        text = normalize_message(message)
+        matches = self.matcher.find(text)
+        if not matches:
+            return None
+        statuses = Counter(status for _, (status, _) in matches)
+        if len(statuses) > 1:
+            self.ambiguous += 1
+            return None
+
+        status = next(iter(statuses))
+        language = Counter(language for _, (_, language) in matches).most_common(1)[0][0]
+        # Only what the phrase match shows; the NLP-only fields are left null
+        return {
+            'status': status,
+            'detected_language': language,
+            'translated_text': None,
+            'indicators_found': {name: statuses.get(name, 0) for name in STATUSES},
+            'template_similarities': None,
+            'sentiment_polarity': None,
+            'message_length': len(text.split()),
+            'confidence': None,
+            'source': 'local',
+            'matched_phrases': [phrase for phrase, _ in matches],
+        }
+
+    def lookup(self, message):
+        """Return a local or cached result for a message, or None to call the service"""
+        self.requests += 1
+        if get_setting('SPAM_LOCAL_MATCHER'):
+            result = self.classify(message)
+            if result is not None:
+                self.local_hits += 1
+                return result
+        result = self.results.get(message_key(message))
+        if result is None:
+            self.upstream_calls += 1
+        return result
+
+    def store(self, message, response_status, response_data):
+        """Cache a successful service result (decoded or passthrough)"""
+        ttl = get_setting('SPAM_CACHE_TTL')
+        if response_status == 200 and ttl > 0:
+            self.results.set(message_key(message), response_data, ttl)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'local_hits': self.local_hits,
+            'local_hit_rate': self.local_hits / self.requests if self.requests else 0.0,
+            'ambiguous': self.ambiguous,
+            'upstream_calls': self.upstream_calls,
+            'phrases': len(self.matcher.payloads),
+            'result_cache': self.results.stats(),
+        }
+
+
+spam_analyzer = SpamAnalyzer(maxsize=get_setting('SPAM_CACHE_MAXSIZE'))
@@ -0,0 +1,154 @@
+"""
+Batch spam analysis.
+
+A batch is deduplicated by normalized message first, so each distinct text
+is analyzed once however often it appears. Texts known to the local fast
+path (see ``spam``) are answered straight away. The rest are sent to the
+analyze-spam service with at most ``SPAM_BATCH_CONCURRENCY`` requests in
+flight. A failed message gets an error result and the rest of the batch
+carries on.
+
+Results are produced as they become ready, as ``(indexes, status, data)``
+where ``indexes`` are the input positions that share the message.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+from collections import deque
+
+from .client import RawBody, get_client
+from .conf import get_setting
+from .ratelimit import RateLimitExceeded
+from .spam import message_key, spam_analyzer
+
+
+def decode(response_data):
+    """Decoded result; cached results may be passthrough bodies"""
+    if isinstance(response_data, RawBody):
+        return json.loads(response_data.content)
+    return response_data
+
+
+class SpamBatch:
+    """One batch of messages for the analyze-spam service."""
+
+    def __init__(self, config, messages):
+        self.config = config
+        self.total = len(messages)
+        groups = {}
+        for index, message in enumerate(messages):
+            groups.setdefault(message_key(message), (message, []))[1].append(index)
+        self.unique = len(groups)
+
+        self.known = []
+        self.unknown = []
+        for message, indexes in groups.values():
+            known_data = spam_analyzer.lookup(message)
+            if known_data is None:
+                self.unknown.append((message, indexes))
+            else:
+                self.known.append((indexes, 200, decode(known_data)))
+
+    def _analyze(self, message):
+        """Coroutine analyzing one message on the client loop"""
+        headers = {
+            'X-API-Key': self.config.api_key,
+            'Content-Type': 'application/json'
+        }
+        return get_client().fetch(
+            'POST', f"{self.config.base_url}/api/analyze-spam", headers, data={'message': message}, idempotent=True
+        )
+
+    def _result(self, message, indexes, future):
+        try:
+            response_status, response_data = future.result()
+        except RateLimitExceeded as e:
+            return indexes, 429, {'success': False, 'message': str(e), 'retry_after': e.retry_after}
+        except Exception as e:
+            return indexes, 500, {'success': False, 'message': f'Error connecting to Check API: {str(e)}'}
+        spam_analyzer.store(message, response_status, response_data)
+        return indexes, response_status, response_data
+
+    def results(self):
+        """Yield ``(indexes, status, data)`` as results become ready"""
+        yield from self.known
+
+        client = get_client()
+        queue = deque(self.unknown)
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < get_setting('SPAM_BATCH_CONCURRENCY'):
+                    message, indexes = queue.popleft()
+                    running[client.submit(self._analyze(message))] = (message, indexes)
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield self._result(*running.pop(future), future)
+        finally:
+            for future in running:
+                future.cancel()
+
+    async def aresults(self):
+        """Async version of ``results`` for the ASGI views"""
+        for result in self.known:
+            yield result
+
+        client = get_client()
+        queue = deque(self.unknown)
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < get_setting('SPAM_BATCH_CONCURRENCY'):
+                    message, indexes = queue.popleft()
+                    running[asyncio.wrap_future(client.submit(self._analyze(message)))] = (message, indexes)
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield self._result(*running.pop(future), future)
+        finally:
+            for future in running:
+                future.cancel()
+
+    def summary(self):
+        return {
+            'total': self.total,
+            'unique': self.unique,
+            'answered_locally': len(self.known),
+            'sent_upstream': len(self.unknown),
+        }
+
+
+def result_rows(indexes, response_status, response_data):
+    return [{'index': index, 'status': response_status, 'result': response_data} for index in indexes]
+
+
+def ordered_results(batch):
+    """All results of a batch, in input order"""
+    rows = [None] * batch.total
+    for result in batch.results():
+        for row in result_rows(*result):
+            rows[row['index']] = row
+    return rows
+
+
+async def aordered_results(batch):
+    rows = [None] * batch.total
+    async for result in batch.aresults():
+        for row in result_rows(*result):
+            rows[row['index']] = row
+    return rows
+
+
+def render_rows(rows):
+    return ''.join(json.dumps(row, default=str) + '\n' for row in rows)
+
+
+def stream_results(batch):
+    """Yield NDJSON lines as results become ready for ``StreamingHttpResponse``"""
+    for result in batch.results():
+        yield render_rows(result_rows(*result))
+
+
+async def astream_results(batch):
+    async for result in batch.aresults():
+        yield render_rows(result_rows(*result))
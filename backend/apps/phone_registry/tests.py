@@ -0,0 +1,1407 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from aiohttp import web
+from django.contrib.auth import get_user_model
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views
+from .analytics_cache import analytics_cache
+from .balancer import UpstreamBalancer, probe_upstream
+from .batching import CheckBatcher
+from .bloom import HEADER_SIZE, BloomFilter, PhoneBloom, build_bloom, phone_bloom
+from .cache import TTLCache, cache_check_result, get_cached_check, invalidate_phone_numbers, phone_check_cache
+from .client import CheckAPIClient, RawBody, get_client, request_key
+from .config_cache import ConfigCache, bump_config_version, get_active_config, invalidate_config_cache
+from .export import ExportError, RegistryPager, astream_export, stream_export
+from .jobs import (
+    BulkRegisterRunner, CleanupRunner, create_cleanup_job, expire_stale_bulk_register_jobs, run_bulk_register_job
+)
+from .metrics import Histogram, endpoint_name
+from .mirror import local_check, local_list, sync_mirror
+from .models import BulkRegisterJob, CheckAPIConfig, CleanupJob, RegisteredPhone, RegistryMirrorState
+from .normalization import PhoneNumberDeduplicator, normalize_batch, normalize_phone_number
+from .ratelimit import RateLimitExceeded, RateLimiterRegistry, TokenBucketLimiter
+from .resilience import CircuitOpenError, Endpoint, retry_delay
+from .spam import PhraseMatcher, SpamAnalyzer, message_key, normalize_message, spam_analyzer
+
+
+class StubUpstream:
+    """Minimal Check API served from a background event loop.
+
+    ``routes`` maps ``(method, path)`` to an async handler taking the aiohttp
+    request; ``hits`` counts the requests received per route.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.runner = None
+        self.base_url = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _handle(self, request):
+        key = (request.method, request.path)
+        self.hits[key] = self.hits.get(key, 0) + 1
+        handler = self.routes.get(key)
+        if handler is None:
+            return web.json_response({'detail': 'Not found'}, status=404)
+        return await handler(request)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}'
+
+    def json(self, method, path, body, status=200, delay=0):
+        async def handler(request):
+            if delay:
+                await asyncio.sleep(delay)
+            return web.json_response(body, status=status)
+        self.routes[(method, path)] = handler
+
+    def text(self, method, path, body, content_type='application/json', status=200):
+        async def handler(request):
+            return web.Response(text=body, content_type=content_type, status=status)
+        self.routes[(method, path)] = handler
+
+    def echo(self, method, path, respond):
+        """Answer with ``respond(json_body)``, which returns ``(status, body)``"""
+        async def handler(request):
+            response_status, body = respond(await request.json())
+            return web.json_response(body, status=response_status)
+        self.routes[(method, path)] = handler
+
+    def sequence(self, method, path, responses):
+        """Answer successive requests with ``(status, body, delay)`` from ``responses``, repeating the last"""
+        responses = list(responses)
+
+        async def handler(request):
+            response_status, body, delay = responses.pop(0) if len(responses) > 1 else responses[0]
+            if delay:
+                await asyncio.sleep(delay)
+            return web.json_response(body, status=response_status)
+        self.routes[(method, path)] = handler
+
+    def pages(self, path, items, page_size_cap=None, fail_page=None):
+        """Serve ``items`` page by page like ``/api/phone/list``; ``fail_page`` answers 502"""
+        self.requested_pages = []
+
+        async def handler(request):
+            page, limit = int(request.query['page']), int(request.query['limit'])
+            self.requested_pages.append(dict(request.query))
+            if page == fail_page:
+                return web.json_response({'detail': 'Bad gateway'}, status=502)
+            limit = min(limit, page_size_cap or limit)
+            return web.json_response({'total': len(items), 'items': items[(page - 1) * limit:page * limit]})
+        self.routes[('GET', path)] = handler
+
+    def reset(self):
+        self.routes.clear()
+        self.hits.clear()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class UpstreamTestMixin:
+    """Runs a ``StubUpstream`` for the test class and gives each test a fresh client."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.upstream = StubUpstream()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.upstream.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.upstream.reset()
+        self.api = CheckAPIClient()
+        self.addCleanup(self.api.close)
+
+    def url(self, path):
+        return f'{self.upstream.base_url}{path}'
+
+
+class CheckAPIClientTests(UpstreamTestMixin, SimpleTestCase):
+    def test_request_returns_status_and_decoded_body(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': True}, status=200)
+        response_status, data = self.api.request(
+            'POST', self.url('/api/phone/check'), {'X-API-Key': 'key'}, data={'phone_number': '+15550100'}
+        )
+        self.assertEqual(response_status, 200)
+        self.assertEqual(data, {'exists': True})
+
+    def test_sync_and_async_callers_share_one_session(self):
+        self.upstream.json('GET', '/api/phone/list', {'results': []})
+        self.api.request('GET', self.url('/api/phone/list'), {})
+        session = self.api._session
+
+        async def call():
+            return await self.api.arequest('GET', self.url('/api/phone/list'), {})
+
+        self.assertEqual(asyncio.run(call()), (200, {'results': []}))
+        self.assertIs(self.api._session, session)
+        self.assertEqual(self.upstream.hits[('GET', '/api/phone/list')], 2)
+
+    def test_close_stops_the_loop_and_a_new_request_restarts_it(self):
+        self.upstream.json('GET', '/health', {'ok': True})
+        self.api.request('GET', self.url('/health'), {})
+        thread = self.api._thread
+        self.api.close()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.api.request('GET', self.url('/health'), {}), (200, {'ok': True}))
+
+
+class SingleFlightTests(UpstreamTestMixin, SimpleTestCase):
+    def concurrent_requests(self, count, method='GET', headers=None, **kwargs):
+        futures = [
+            self.api._submit_request(method, self.url('/api/phone/list'), headers or {}, **kwargs)
+            for _ in range(count)
+        ]
+        return [future.result() for future in futures]
+
+    def test_identical_gets_share_one_upstream_call(self):
+        self.upstream.json('GET', '/api/phone/list', {'results': []}, delay=0.2)
+        results = self.concurrent_requests(5, params={'page': '1'})
+        self.assertEqual(results, [(200, {'results': []})] * 5)
+        self.assertEqual(self.upstream.hits[('GET', '/api/phone/list')], 1)
+        self.assertEqual(self.api.single_flight_stats(), {'in_flight': 0, 'coalesced': 4})
+
+    def test_posts_are_not_shared_unless_asked(self):
+        self.upstream.json('POST', '/api/phone/list', {'ok': True}, delay=0.1)
+        self.concurrent_requests(3, method='POST', data={'a': 1})
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/list')], 3)
+        self.concurrent_requests(3, method='POST', data={'a': 1}, coalesce=True)
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/list')], 4)
+
+    def test_cancelled_waiter_does_not_cancel_the_shared_call(self):
+        self.upstream.json('GET', '/api/phone/list', {'results': []}, delay=0.2)
+        waiting = self.api._submit_request('GET', self.url('/api/phone/list'), {})
+
+        async def disconnect():
+            task = asyncio.ensure_future(self.api.arequest('GET', self.url('/api/phone/list'), {}))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        asyncio.run(disconnect())
+
+        self.assertEqual(waiting.result(), (200, {'results': []}))
+        self.assertEqual(self.upstream.hits[('GET', '/api/phone/list')], 1)
+        self.assertEqual(self.api.single_flight_stats()['coalesced'], 1)
+
+    @override_settings(PHONE_REGISTRY={'COALESCE_REQUESTS': False})
+    def test_coalescing_can_be_disabled(self):
+        self.upstream.json('GET', '/api/phone/list', {'results': []}, delay=0.1)
+        self.concurrent_requests(3)
+        self.assertEqual(self.upstream.hits[('GET', '/api/phone/list')], 3)
+
+    def test_requests_with_other_keys_or_params_are_separate(self):
+        url = 'http://upstream.test/api/phone/list'
+        key = request_key('GET', url, {'X-API-Key': 'a'}, None, {'page': '1'})
+        self.assertEqual(key, request_key('get', url, {'X-API-Key': 'a'}, None, {'page': '1'}))
+        self.assertNotEqual(key, request_key('GET', url, {'X-API-Key': 'b'}, None, {'page': '1'}))
+        self.assertNotEqual(key, request_key('GET', url, {'X-API-Key': 'a'}, None, {'page': '2'}))
+        self.assertNotEqual(key, request_key('GET', url, {'X-API-Key': 'a'}, None, {'page': '1'}, raw=True))
+
+
+class CheckBatcherTests(UpstreamTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleNamespace(base_url=self.upstream.base_url, api_key='key')
+        self.batches = []
+
+        def bulk_check(body):
+            self.batches.append(body['phone_numbers'])
+            return 200, {'results': [
+                {'phone_number': phone_number, 'exists': phone_number.endswith('0')}
+                for phone_number in body['phone_numbers'] if not phone_number.endswith('9')
+            ]}
+
+        self.upstream.echo('POST', '/bulk-check', bulk_check)
+
+    def check_all(self, batcher, phone_numbers):
+        with ThreadPoolExecutor(len(phone_numbers)) as executor:
+            return list(executor.map(lambda phone_number: batcher.check(self.config, phone_number), phone_numbers))
+
+    def test_checks_in_one_window_share_a_bulk_call(self):
+        batcher = CheckBatcher(self.api, window_ms=100, max_size=100, endpoint='/bulk-check')
+        results = self.check_all(batcher, ['+15550100', '+15550101', '+1 555 0100'])
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(sorted(self.batches[0]), ['+15550100', '+15550101'])
+        self.assertEqual([result[1]['exists'] for result in results], [True, False, True])
+        self.assertEqual(batcher.stats()['checks_batched'], 3)
+
+    def test_full_batch_is_sent_without_waiting_for_the_window(self):
+        batcher = CheckBatcher(self.api, window_ms=60000, max_size=2, endpoint='/bulk-check')
+        self.check_all(batcher, ['+15550100', '+15550101'])
+        self.assertEqual(len(self.batches), 1)
+
+    def test_numbers_missing_from_the_batch_answer_are_checked_singly(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': False, 'source': 'single'})
+        batcher = CheckBatcher(self.api, window_ms=10, max_size=100, endpoint='/bulk-check')
+        self.assertEqual(batcher.check(self.config, '+15550109'), (200, {'exists': False, 'source': 'single'}))
+
+    def test_without_a_bulk_endpoint_each_distinct_number_is_checked_once(self):
+        self.upstream.echo('POST', '/api/phone/check', lambda body: (200, {'exists': True, **body}))
+        batcher = CheckBatcher(self.api, window_ms=100, max_size=100, endpoint='')
+        results = self.check_all(batcher, ['+15550100', '+1 555 0100', '+15550101'])
+        self.assertEqual([result[1]['exists'] for result in results], [True] * 3)
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/check')], 2)
+        self.assertEqual(self.batches, [])
+
+    def test_failed_batch_is_relayed_to_every_caller(self):
+        self.upstream.json('POST', '/bulk-check', {'detail': 'Bad request'}, status=400)
+        batcher = CheckBatcher(self.api, window_ms=50, max_size=100, endpoint='/bulk-check')
+        results = self.check_all(batcher, ['+15550100', '+15550101'])
+        self.assertEqual(results, [(400, {'detail': 'Bad request'})] * 2)
+
+
+class ProxyViewTestMixin(UpstreamTestMixin):
+    """Staff user and an active configuration pointing at the stub upstream."""
+
+    def setUp(self):
+        super().setUp()
+        self.config = CheckAPIConfig.objects.create(name='default', base_url=self.upstream.base_url, api_key='key')
+        invalidate_config_cache()
+        self.addCleanup(invalidate_config_cache)
+        phone_check_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='admin', email='admin@example.com', is_staff=True
+        )
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.http = APIClient()
+        self.http.force_authenticate(self.user)
+
+
+class AsyncProxyViewTests(ProxyViewTestMixin, TestCase):
+    factory = AsyncRequestFactory()
+
+    def post(self, path, data, headers=None):
+        return self.factory.post(path, data, content_type='application/json', headers=headers)
+
+    async def test_phone_check_relays_the_upstream_answer(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': False, 'phone_number': '+15550100'})
+        response = await async_views.phone_check(self.post('/check/', {'phone_number': '+15550100'}, self.auth))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'exists': False, 'phone_number': '+15550100'})
+
+    async def test_requires_authentication(self):
+        response = await async_views.phone_check(self.post('/check/', {'phone_number': '+15550100'}))
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn(('POST', '/api/phone/check'), self.upstream.hits)
+
+    async def test_requires_staff(self):
+        self.user.is_staff = False
+        await self.user.asave()
+        response = await async_views.phone_check(self.post('/check/', {'phone_number': '+15550100'}, self.auth))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_invalid_body_is_rejected_before_calling_upstream(self):
+        response = await async_views.phone_check(self.post('/check/', {}, self.auth))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(json.loads(response.content)['success'])
+        self.assertNotIn(('POST', '/api/phone/check'), self.upstream.hits)
+
+
+class ConfigCacheTests(TestCase):
+    def setUp(self):
+        self.config = CheckAPIConfig.objects.create(name='default', base_url='http://upstream.test', api_key='key')
+        self.cache = ConfigCache()
+
+    def test_active_configs_are_loaded_once(self):
+        self.assertEqual(self.cache.get_active_configs(), [self.config])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get_active_configs(), [self.config])
+
+    def test_inactive_configs_are_skipped(self):
+        CheckAPIConfig.objects.create(name='spare', base_url='http://spare.test', api_key='key', is_active=False)
+        self.assertEqual(self.cache.get_active_configs(), [self.config])
+
+    @override_settings(PHONE_REGISTRY={'CONFIG_VERSION_CHECK_INTERVAL': 0})
+    def test_other_workers_reload_after_a_version_bump(self):
+        self.cache.get_active_configs()
+        CheckAPIConfig.objects.filter(pk=self.config.pk).update(api_key='rotated')
+        self.assertEqual(self.cache.get_active_configs()[0].api_key, 'key')
+        bump_config_version()
+        self.assertEqual(self.cache.get_active_configs()[0].api_key, 'rotated')
+
+    @override_settings(PHONE_REGISTRY={'CONFIG_CACHE_MAX_AGE': 0})
+    def test_max_age_bounds_staleness(self):
+        self.cache.get_active_configs()
+        CheckAPIConfig.objects.filter(pk=self.config.pk).update(api_key='rotated')
+        self.assertEqual(self.cache.get_active_configs()[0].api_key, 'rotated')
+
+    def test_saving_a_config_invalidates_the_shared_cache(self):
+        self.assertEqual(get_active_config(), self.config)
+        self.config.is_active = False
+        self.config.save()
+        self.assertIsNone(get_active_config())
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_entries_expire_after_their_ttl(self):
+        cache = TTLCache(maxsize=10)
+        with mock.patch('apps.phone_registry.cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1, ttl=5)
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('apps.phone_registry.cache.time.monotonic', return_value=105.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1, ttl=60)
+        cache.set('b', 2, ttl=60)
+        cache.get('a')
+        cache.set('c', 3, ttl=60)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_stats_count_hits_and_misses(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1, ttl=60)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class CheckResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        phone_check_cache.clear()
+        self.addCleanup(phone_check_cache.clear)
+
+    def test_results_are_keyed_by_normalized_number(self):
+        cache_check_result('+1 (555) 0100', 200, {'exists': True})
+        self.assertEqual(get_cached_check('0015550100'), {'exists': True})
+        invalidate_phone_numbers(['+1-555-0100'])
+        self.assertIsNone(get_cached_check('+15550100'))
+
+    @override_settings(PHONE_REGISTRY={'CHECK_CACHE_POSITIVE_TTL': 300, 'CHECK_CACHE_NEGATIVE_TTL': 0})
+    def test_negative_ttl_is_separate(self):
+        cache_check_result('+15550100', 200, {'exists': True})
+        cache_check_result('+15550101', 200, {'exists': False})
+        self.assertIsNotNone(get_cached_check('+15550100'))
+        self.assertIsNone(get_cached_check('+15550101'))
+
+    def test_errors_are_not_cached(self):
+        cache_check_result('+15550100', 500, {'exists': False})
+        cache_check_result('+15550101', 200, ['unexpected'])
+        self.assertIsNone(get_cached_check('+15550100'))
+        self.assertIsNone(get_cached_check('+15550101'))
+
+
+class PhoneCheckViewTests(ProxyViewTestMixin, TestCase):
+    def test_repeated_checks_are_answered_from_the_cache(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': True})
+        for phone_number in ['+15550100', '+1 555 0100']:
+            response = self.http.post('/api/phone/check/', {'phone_number': phone_number}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'exists': True})
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/check')], 1)
+
+    def test_register_drops_the_cached_answer(self):
+        self.upstream.json('POST', '/api/phone/register', {'success': True}, status=201)
+        cache_check_result('+15550100', 200, {'exists': False})
+        response = self.http.post('/api/phone/register/', {
+            'phone_number': '+15550100', 'botname': 'bot', 'country': 'United States', 'iso2': 'US',
+            'twofa': 'secret', 'session_string': 'session'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(get_cached_check('+15550100'))
+
+
+@override_settings(PHONE_REGISTRY={'BULK_JOB_MAX_RETRIES': 0, 'BULK_JOB_CONCURRENCY': 2})
+class BulkRegisterJobTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+
+        def bulk_register(body):
+            self.batches.append(body['phone_numbers'])
+            return 200, {'newly_registered': len(body['phone_numbers']) - 1, 'already_exists': 1, 'failed': 0}
+
+        self.upstream.echo('POST', '/api/phone/bulk-register', bulk_register)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def create_job(self, lines, file_format='csv', chunk_size=2):
+        path = os.path.join(self.directory, f'{len(os.listdir(self.directory))}.{file_format}')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return BulkRegisterJob.objects.create(file_path=path, file_format=file_format, chunk_size=chunk_size)
+
+    def test_numbers_are_normalized_deduplicated_and_sent_in_chunks(self):
+        job = self.create_job(['phone_number', '+1 555 0100', '0015550100', '+15550101', '+15550102', '()'])
+        BulkRegisterRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(sorted(sum(self.batches, [])), ['+15550100', '+15550101', '+15550102'])
+        self.assertEqual((job.total_numbers, job.duplicates_collapsed, job.invalid_numbers), (3, 1, 1))
+        self.assertEqual((job.chunks_total, job.chunks_succeeded), (2, 2))
+        self.assertEqual((job.newly_registered, job.already_exists), (1, 2))
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_failed_chunks_fail_the_job(self):
+        self.upstream.json('POST', '/api/phone/bulk-register', {'detail': 'Bad request'}, status=400)
+        job = self.create_job(['+15550100', '+15550101', '+15550102'])
+        BulkRegisterRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, '2 of 2 chunks failed')
+        self.assertEqual(job.chunk_results[0]['status'], 400)
+
+    def test_chunks_in_flight_are_recorded_when_the_file_turns_out_malformed(self):
+        # The first read batch is sent before the bad line is reached
+        lines = [json.dumps(f'+1555{number:07d}') for number in range(10000)] + ['{not json']
+        job = self.create_job(lines, file_format='ndjson', chunk_size=5000)
+        with self.assertLogs('apps.phone_registry.jobs', 'ERROR'):
+            run_bulk_register_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual((job.chunks_total, job.chunks_succeeded), (2, 2))
+        self.assertEqual(len(job.chunk_results), 2)
+
+    def test_job_expired_while_running_stays_failed(self):
+        job = self.create_job(['+15550100', '+15550101', '+15550102'])
+        record_chunk = BulkRegisterRunner.record_chunk
+
+        def record_and_expire(runner, *args):
+            record_chunk(runner, *args)
+            BulkRegisterJob.objects.filter(pk=job.pk).update(status='failed', error='Job stopped reporting progress')
+
+        with mock.patch.object(BulkRegisterRunner, 'record_chunk', record_and_expire):
+            BulkRegisterRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Job stopped reporting progress'))
+        self.assertEqual((job.chunks_total, job.chunks_succeeded, job.newly_registered), (2, 2, 1))
+
+    def test_job_that_is_no_longer_pending_is_not_started(self):
+        job = self.create_job(['+15550100'])
+        BulkRegisterJob.objects.filter(pk=job.pk).update(status='failed', error='Job stopped reporting progress')
+        with self.assertLogs('apps.phone_registry.jobs', 'WARNING'):
+            BulkRegisterRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(self.batches, [])
+
+    def test_jobs_that_stop_reporting_progress_are_expired(self):
+        stale = self.create_job(['+15550100'])
+        live = self.create_job(['+15550101'])
+        BulkRegisterJob.objects.filter(pk=stale.pk).update(
+            status='processing', updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(expire_stale_bulk_register_jobs(), 1)
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual((stale.status, stale.error), ('failed', 'Job stopped reporting progress'))
+        self.assertEqual(live.status, 'pending')
+
+
+class NormalizationTests(SimpleTestCase):
+    def test_numbers_are_canonicalized(self):
+        cases = {
+            '+15550100': '+15550100',
+            ' +1 (555) 010-0 ': '+15550100',
+            '00 44 (20) 7946-0018': '+442079460018',
+            '+44.20.7946.0018': '+442079460018',
+            '+1 555 0100 ext': '+15550100',
+            '5550100': '5550100',
+            '00': '',
+            '(--)': '',
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone_number(raw), expected)
+
+    def test_batch_keeps_the_first_of_each_number(self):
+        phone_numbers, stats = normalize_batch(['+1 555 0101', '+15550100', '0015550101', '', '+', '+15550100'])
+        self.assertEqual(phone_numbers, ['+15550101', '+15550100'])
+        self.assertEqual(stats, {'submitted': 6, 'unique': 2, 'collapsed': 2, 'invalid': 2})
+
+    def test_duplicates_are_collapsed_across_read_batches(self):
+        deduplicator = PhoneNumberDeduplicator()
+        with mock.patch('apps.phone_registry.normalization.BATCH_SIZE', 2):
+            phone_numbers = list(deduplicator.filter(['+15550100', '+15550101', '+1 555 0100', '', '+15550102']))
+        self.assertEqual(phone_numbers, ['+15550100', '+15550101', '+15550102'])
+        self.assertEqual((deduplicator.collapsed, deduplicator.invalid), (1, 1))
+
+
+class BulkRegisterViewTests(ProxyViewTestMixin, TestCase):
+    def test_only_unique_normalized_numbers_are_sent(self):
+        sent = []
+
+        def bulk_register(body):
+            sent.append(body['phone_numbers'])
+            return 200, {'newly_registered': 2}
+
+        self.upstream.echo('POST', '/api/phone/bulk-register', bulk_register)
+        response = self.http.post('/api/phone/bulk-register/', {
+            'phone_numbers': ['+1 555 0100', '0015550100', '+15550101', '--']
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sent, [['+15550100', '+15550101']])
+        self.assertEqual(response.json()['normalization'], {'submitted': 4, 'unique': 2, 'collapsed': 1, 'invalid': 1})
+
+    def test_no_valid_numbers_is_a_validation_error(self):
+        response = self.http.post('/api/phone/bulk-register/', {'phone_numbers': ['--', '+']}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('phone_numbers', response.json()['errors'])
+        self.assertNotIn(('POST', '/api/phone/bulk-register'), self.upstream.hits)
+
+
+def registry_items(count):
+    return [
+        {'phone_number': f'+1555{number:07d}', 'registered_at': f'2024-01-{number + 1:02d}T00:00:00Z', 'iso2': 'US'}
+        for number in range(count)
+    ]
+
+
+@override_settings(PHONE_REGISTRY={'EXPORT_PAGE_SIZE': 2, 'EXPORT_PREFETCH_PAGES': 2, 'RETRY_MAX_ATTEMPTS': 0})
+class ExportTests(ProxyViewTestMixin, TestCase):
+    def export(self, **params):
+        response = self.http.get('/api/phone/export/', params)
+        return response, b''.join(response.streaming_content).decode() if response.streaming else None
+
+    def test_csv_export_walks_every_page(self):
+        self.upstream.pages('/api/phone/list', registry_items(5))
+        response, body = self.export(iso2='US')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'phone_number,registered_at,botname,country,iso2,twofa,quality,is_bulked')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [item['phone_number'] for item in registry_items(5)])
+        self.assertEqual({page['iso2'] for page in self.upstream.requested_pages}, {'US'})
+        self.assertEqual(len(self.upstream.requested_pages), 3)
+
+    def test_ndjson_export(self):
+        self.upstream.pages('/api/phone/list', registry_items(3))
+        response, body = self.export(file_format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], registry_items(3))
+
+    def test_capped_page_size_is_followed(self):
+        self.upstream.pages('/api/phone/list', registry_items(5), page_size_cap=1)
+        pager = RegistryPager(self.config, {}, limit=3)
+        pager.first_page()
+        self.assertEqual((pager.limit, pager.last_page), (1, 5))
+
+    def test_unknown_format_is_rejected(self):
+        response, _ = self.export(file_format='xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_page_aborts_the_stream(self):
+        self.upstream.pages('/api/phone/list', registry_items(6), fail_page=2)
+        pager = RegistryPager(self.config, {})
+        stream = stream_export(pager, pager.first_page()[1], 'csv')
+        self.assertIn('+15550000000', next(stream))
+        with self.assertLogs('apps.phone_registry.export', 'ERROR'), self.assertRaises(ExportError):
+            list(stream)
+
+    async def test_failed_page_aborts_the_async_stream(self):
+        self.upstream.pages('/api/phone/list', registry_items(6), fail_page=3)
+        pager = RegistryPager(self.config, {})
+        _, first_data = await pager.afirst_page()
+        chunks = []
+        with self.assertLogs('apps.phone_registry.export', 'ERROR'), self.assertRaises(ExportError):
+            async for chunk in astream_export(pager, first_data, 'ndjson'):
+                chunks.append(chunk)
+        self.assertEqual(len(chunks), 2)
+
+
+@override_settings(PHONE_REGISTRY={
+    'MIRROR_SYNC_PAGE_SIZE': 2, 'MIRROR_SYNC_OVERLAP': 0, 'EXPORT_PREFETCH_PAGES': 1,
+    'MIRROR_SERVE_CHECK': True, 'MIRROR_SERVE_LIST': True,
+})
+class RegistryMirrorTests(ProxyViewTestMixin, TestCase):
+    def serve(self, count):
+        self.upstream.pages('/api/phone/list', registry_items(count)[::-1])
+
+    def test_first_sync_copies_the_registry_and_sets_the_watermark(self):
+        self.serve(5)
+        self.assertEqual(sync_mirror(self.config), 5)
+        state = RegistryMirrorState.load()
+        self.assertEqual(state.watermark.isoformat(), '2024-01-05T00:00:00+00:00')
+        self.assertEqual(RegisteredPhone.objects.count(), 5)
+
+    def test_incremental_sync_stops_past_the_watermark(self):
+        self.serve(5)
+        sync_mirror(self.config)
+        self.serve(9)
+        self.assertEqual(sync_mirror(self.config), 5)
+        # Pages 1-3 hold the four new records and the one at the watermark
+        self.assertEqual([page['page'] for page in self.upstream.requested_pages], ['1', '2', '3'])
+        self.assertEqual(RegisteredPhone.objects.count(), 9)
+        self.assertEqual(RegistryMirrorState.load().watermark.isoformat(), '2024-01-09T00:00:00+00:00')
+
+    def test_full_sync_drops_records_removed_upstream(self):
+        self.serve(5)
+        sync_mirror(self.config)
+        self.upstream.pages('/api/phone/list', registry_items(5)[:1:-1])
+        sync_mirror(self.config, full=True)
+        self.assertEqual(
+            sorted(RegisteredPhone.objects.values_list('phone_number', flat=True)),
+            [item['phone_number'] for item in registry_items(5)[2:]]
+        )
+
+    def test_checks_and_lists_are_answered_while_fresh(self):
+        self.serve(3)
+        sync_mirror(self.config)
+        data = local_check('+1 555 000 0001')
+        self.assertTrue(data['exists'])
+        self.assertEqual(data['freshness']['source'], 'mirror')
+        self.assertIsNone(local_check('+15559999999'))
+        page = local_list({'page': 2, 'limit': 2, 'iso2': 'US', 'order_direction': 'desc'})
+        self.assertEqual((page['total'], [item['phone_number'] for item in page['items']]), (3, ['+15550000000']))
+
+    def test_stale_mirror_is_not_served(self):
+        self.serve(3)
+        sync_mirror(self.config)
+        RegistryMirrorState.objects.update(last_synced_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(local_check('+15550000001'))
+        self.assertIsNone(local_list({'page': 1, 'limit': 2}))
+
+
+class AnalyticsCacheTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        analytics_cache.clear()
+        self.addCleanup(analytics_cache.clear)
+        self.upstream.json('GET', '/api/phone/analytics', {'total': 10})
+
+    def analytics(self, **params):
+        response = self.http.get('/api/phone/analytics/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def hits(self):
+        return self.upstream.hits.get(('GET', '/api/phone/analytics'), 0)
+
+    def test_repeat_queries_are_cache_hits(self):
+        self.assertEqual(self.analytics(is_bulked='true')['cache']['status'], 'miss')
+        self.assertEqual(self.analytics(is_bulked='True')['cache']['status'], 'hit')
+        self.assertEqual(self.analytics(is_bulked='false')['cache']['status'], 'miss')
+        self.assertEqual(self.hits(), 2)
+
+    @override_settings(PHONE_REGISTRY={'ANALYTICS_CACHE_FRESH_TTL': 0})
+    def test_stale_results_are_served_while_one_refresh_runs(self):
+        self.analytics()
+        self.upstream.json('GET', '/api/phone/analytics', {'total': 11}, delay=0.2)
+        first = self.analytics()
+        second = self.analytics()
+        self.assertEqual((first['cache']['status'], first['total']), ('stale', 10))
+        self.assertEqual(second['cache']['status'], 'stale')
+        self.wait_for_refresh()
+        self.assertEqual(self.hits(), 2)
+        self.assertEqual(self.analytics()['total'], 11)
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 5
+        while analytics_cache._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @override_settings(PHONE_REGISTRY={
+        'ANALYTICS_CACHE_FRESH_TTL': 0, 'ANALYTICS_CACHE_REFRESH_BACKOFF': 0.2, 'RETRY_MAX_ATTEMPTS': 0
+    })
+    def test_failed_refresh_backs_off_before_retrying(self):
+        self.analytics()
+        self.upstream.json('GET', '/api/phone/analytics', {'detail': 'Unavailable'}, status=503)
+        self.assertEqual(self.analytics()['cache']['status'], 'stale')
+        self.wait_for_refresh()
+        for _ in range(3):
+            self.assertEqual(self.analytics()['total'], 10)
+        self.assertEqual(self.hits(), 2)
+        self.assertEqual(analytics_cache.stats()['failed_refreshes'], 1)
+
+        time.sleep(0.25)
+        self.upstream.json('GET', '/api/phone/analytics', {'total': 11})
+        self.analytics()
+        self.wait_for_refresh()
+        self.assertEqual(self.hits(), 3)
+        self.assertEqual(self.analytics()['total'], 11)
+
+    @override_settings(PHONE_REGISTRY={'ANALYTICS_CACHE_FRESH_TTL': 0})
+    def test_closed_ranges_do_not_go_stale(self):
+        past = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+        self.analytics(**past)
+        self.assertEqual(self.analytics(**past)['cache']['status'], 'hit')
+        self.assertEqual(self.hits(), 1)
+
+    def test_refresh_bypasses_the_cache(self):
+        self.analytics()
+        self.assertEqual(self.analytics(refresh='1')['cache']['status'], 'refreshed')
+        self.assertEqual(self.hits(), 2)
+
+    def test_errors_are_not_cached(self):
+        self.upstream.json('GET', '/api/phone/analytics', {'detail': 'Unavailable'}, status=503)
+        with override_settings(PHONE_REGISTRY={'RETRY_MAX_ATTEMPTS': 0}):
+            response = self.http.get('/api/phone/analytics/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(analytics_cache.stats()['size'], 0)
+
+
+@override_settings(PHONE_REGISTRY={'CIRCUIT_FAILURE_THRESHOLD': 2, 'CIRCUIT_RESET_TIMEOUT': 30})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.endpoint = Endpoint('GET', 'http://upstream.test/api/phone/list')
+
+    def open_breaker(self, now=100.0):
+        with mock.patch('apps.phone_registry.resilience.time.monotonic', return_value=now):
+            self.assertTrue(self.endpoint.allow())
+            self.endpoint.record_failure()
+            self.assertTrue(self.endpoint.allow())
+            self.endpoint.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.assertTrue(self.endpoint.allow())
+        self.endpoint.record_failure()
+        self.endpoint.record_success(0.01)
+        self.assertEqual(self.endpoint.state, 'closed')
+        self.open_breaker()
+        self.assertEqual((self.endpoint.state, self.endpoint.times_opened), ('open', 1))
+        with mock.patch('apps.phone_registry.resilience.time.monotonic', return_value=129.0):
+            self.assertFalse(self.endpoint.allow())
+        self.assertEqual(self.endpoint.rejected, 1)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.open_breaker()
+        with mock.patch('apps.phone_registry.resilience.time.monotonic', return_value=130.0):
+            self.assertTrue(self.endpoint.allow())
+            self.assertEqual(self.endpoint.state, 'half_open')
+            self.assertFalse(self.endpoint.allow())
+        self.endpoint.record_success(0.01)
+        self.assertEqual(self.endpoint.state, 'closed')
+        self.assertTrue(self.endpoint.allow())
+
+    def test_failed_trial_reopens(self):
+        self.open_breaker()
+        with mock.patch('apps.phone_registry.resilience.time.monotonic', return_value=130.0):
+            self.assertTrue(self.endpoint.allow())
+            self.endpoint.record_failure()
+            self.assertEqual((self.endpoint.state, self.endpoint.times_opened), ('open', 2))
+            self.assertFalse(self.endpoint.allow())
+
+    def test_released_trial_frees_the_slot(self):
+        self.open_breaker()
+        with mock.patch('apps.phone_registry.resilience.time.monotonic', return_value=130.0):
+            self.assertTrue(self.endpoint.allow())
+            self.endpoint.release()
+            self.assertTrue(self.endpoint.allow())
+
+    @override_settings(PHONE_REGISTRY={'RETRY_BACKOFF_BASE': 0.2, 'RETRY_BACKOFF_MAX': 1})
+    def test_retry_delay_is_capped_full_jitter(self):
+        with mock.patch('apps.phone_registry.resilience.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([retry_delay(attempt) for attempt in (1, 2, 3)], [0.4, 0.8, 1])
+
+
+@override_settings(PHONE_REGISTRY={
+    'RETRY_MAX_ATTEMPTS': 2, 'RETRY_BACKOFF_BASE': 0.001, 'RETRY_BACKOFF_MAX': 0.001,
+    'CIRCUIT_FAILURE_THRESHOLD': 3, 'CIRCUIT_RESET_TIMEOUT': 30,
+})
+class ResilientClientTests(UpstreamTestMixin, SimpleTestCase):
+    def test_idempotent_calls_are_retried_on_5xx(self):
+        self.upstream.sequence('GET', '/api/phone/list', [(503, {}, 0), (200, {'items': []}, 0)])
+        self.assertEqual(self.api.request('GET', self.url('/api/phone/list'), {}), (200, {'items': []}))
+        self.assertEqual(self.api.endpoint_stats()[0]['retries'], 1)
+
+    def test_other_calls_are_not_retried(self):
+        self.upstream.sequence('POST', '/api/phone/register', [(503, {}, 0), (201, {}, 0)])
+        self.assertEqual(self.api.request('POST', self.url('/api/phone/register'), {}, data={})[0], 503)
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/register')], 1)
+
+    def test_open_breaker_fails_fast(self):
+        self.upstream.json('GET', '/api/phone/list', {}, status=502)
+        self.assertEqual(self.api.request('GET', self.url('/api/phone/list'), {})[0], 502)
+        with self.assertRaises(CircuitOpenError):
+            self.api.request('GET', self.url('/api/phone/list'), {})
+        self.assertEqual(self.upstream.hits[('GET', '/api/phone/list')], 3)
+
+    @override_settings(PHONE_REGISTRY={'HEDGE_REQUESTS': True, 'HEDGE_MIN_SAMPLES': 1, 'RETRY_MAX_ATTEMPTS': 0})
+    def test_slow_call_is_hedged(self):
+        self.upstream.sequence('GET', '/api/phone/list', [(200, {'from': 'slow'}, 1), (200, {'from': 'hedge'}, 0)])
+        endpoint = self.api.endpoints.get('GET', self.url('/api/phone/list'))
+        endpoint.latencies.extend([0.01] * 5)
+        self.assertEqual(self.api.request('GET', self.url('/api/phone/list'), {}), (200, {'from': 'hedge'}))
+        self.assertEqual((endpoint.hedges, endpoint.hedge_wins), (1, 1))
+
+
+class TokenBucketTests(SimpleTestCase):
+    async def test_burst_is_granted_then_calls_wait_for_tokens(self):
+        limiter = TokenBucketLimiter(rate=50, burst=2, max_queue=10, timeout=1)
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire('check')
+        self.assertGreaterEqual(time.monotonic() - started, 0.015)
+        self.assertEqual((limiter.granted, limiter.delayed), (3, 1))
+
+    async def test_full_queue_is_rejected_with_retry_after(self):
+        limiter = TokenBucketLimiter(rate=0.5, burst=1, max_queue=1, timeout=5)
+        await limiter.acquire('check')
+        waiter = asyncio.ensure_future(limiter.acquire('check'))
+        await asyncio.sleep(0)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            await limiter.acquire('check')
+        self.assertEqual(raised.exception.retry_after, 4)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        self.assertEqual(limiter.queued, 0)
+
+    async def test_waiting_too_long_is_rejected(self):
+        limiter = TokenBucketLimiter(rate=0.1, burst=1, max_queue=5, timeout=0.01)
+        await limiter.acquire('check')
+        with self.assertRaises(RateLimitExceeded):
+            await limiter.acquire('check')
+        self.assertEqual((limiter.timeouts, limiter.queued), (1, 0))
+
+    async def test_lanes_are_served_round_robin(self):
+        limiter = TokenBucketLimiter(rate=200, burst=1, max_queue=10, timeout=1)
+        await limiter.acquire('bulk')
+        order = []
+
+        async def call(lane):
+            await limiter.acquire(lane)
+            order.append(lane)
+
+        await asyncio.gather(call('bulk'), call('bulk'), call('bulk'), call('check'))
+        self.assertEqual(order, ['bulk', 'check', 'bulk', 'bulk'])
+
+    async def test_removed_limits_release_waiting_calls(self):
+        registry = RateLimiterRegistry()
+        registry.configure([('default', 'key', 0.1, 1, 5, 5), ('spare', 'other', 0, 1, 5, 5)])
+        self.assertIsNone(registry.get('other'))
+        limiter = registry.get('key')
+        await limiter.acquire('check')
+        waiter = asyncio.ensure_future(limiter.acquire('check'))
+        await asyncio.sleep(0)
+        registry.configure([])
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(registry.stats(), {})
+
+
+class RateLimitedViewTests(ProxyViewTestMixin, TestCase):
+    def test_calls_over_the_limit_get_429_without_reaching_upstream(self):
+        # Limiters live on the shared client, so use a key no other test does
+        self.config.api_key = 'rate-limited-key'
+        self.config.rate_limit_per_second = 0.01
+        self.config.rate_limit_burst = 1
+        self.config.rate_limit_queue_size = 0
+        self.config.save()
+        self.upstream.json('POST', '/api/phone/check', {'exists': False})
+        first = self.http.post('/api/phone/check/', {'phone_number': '+15550100'}, format='json')
+        second = self.http.post('/api/phone/check/', {'phone_number': '+15550101'}, format='json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], '100')
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/check')], 1)
+
+    def test_health_probes_do_not_use_the_rate_limit(self):
+        self.config.api_key = 'rate-limited-probe-key'
+        self.config.rate_limit_per_second = 0.01
+        self.config.rate_limit_burst = 1
+        self.config.rate_limit_queue_size = 0
+        self.config.save()
+        get_active_config()  # loads the configuration into the client's limiters
+        self.upstream.json('POST', '/api/phone/check', {'exists': False})
+        for _ in range(2):
+            self.assertTrue(get_client().submit(probe_upstream(self.config)).result()[0])
+        response = self.http.post('/api/phone/check/', {'phone_number': '+15550100'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/check')], 3)
+
+
+UPSTREAM_LIST_BODY = '{"items":[{"phone_number":"+15550100","quality":"high"}],  "total":1}'
+
+
+class PassthroughTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstream.text('GET', '/api/phone/list', UPSTREAM_LIST_BODY)
+
+    def test_raw_requests_return_the_undecoded_body(self):
+        response_status, data = self.api.request('GET', self.url('/api/phone/list'), {}, raw=True)
+        self.assertEqual(response_status, 200)
+        self.assertIsInstance(data, RawBody)
+        self.assertEqual(data.content, UPSTREAM_LIST_BODY.encode())
+        self.assertEqual(data.content_type, 'application/json; charset=utf-8')
+
+    def test_list_relays_the_upstream_bytes(self):
+        response = self.http.get('/api/phone/list/', {'page': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, UPSTREAM_LIST_BODY.encode())
+
+    async def test_async_list_relays_the_upstream_bytes(self):
+        response = await async_views.phone_list(AsyncRequestFactory().get('/list/', headers=self.auth))
+        self.assertEqual(response.content, UPSTREAM_LIST_BODY.encode())
+
+    @override_settings(PHONE_REGISTRY={'PASSTHROUGH_RESPONSES': False})
+    def test_passthrough_can_be_disabled(self):
+        response = self.http.get('/api/phone/list/', {'page': 1})
+        self.assertEqual(response.json(), json.loads(UPSTREAM_LIST_BODY))
+        self.assertNotEqual(response.content, UPSTREAM_LIST_BODY.encode())
+
+
+@override_settings(PHONE_REGISTRY={'HEALTH_CHECK_FAILURES': 2, 'HEALTH_CHECK_SUCCESSES': 2})
+class UpstreamBalancerTests(SimpleTestCase):
+    def setUp(self):
+        self.balancer = UpstreamBalancer()
+        patcher = mock.patch.object(UpstreamBalancer, '_ensure_prober')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.primary = CheckAPIConfig(pk=1, name='primary', base_url='http://primary.test', weight=2)
+        self.secondary = CheckAPIConfig(pk=2, name='secondary', base_url='http://secondary.test', weight=1)
+        self.configs = [self.primary, self.secondary]
+
+    def picks(self, count):
+        return [self.balancer.choose(self.configs).name for _ in range(count)]
+
+    def test_smooth_weighted_round_robin(self):
+        self.assertEqual(self.picks(6), ['primary', 'secondary', 'primary'] * 2)
+
+    def test_unhealthy_upstream_is_ejected_and_readmitted(self):
+        self.balancer.record_probe(self.primary, False, 'down')
+        self.assertIn('primary', self.picks(3))
+        self.balancer.record_probe(self.primary, False, 'down')
+        self.assertEqual(self.picks(3), ['secondary'] * 3)
+        self.balancer.record_probe(self.primary, True, 'up')
+        self.assertNotIn('primary', self.picks(3))
+        self.balancer.record_probe(self.primary, True, 'up')
+        self.assertIn('primary', self.picks(3))
+        self.assertEqual(self.balancer._state(self.primary).times_ejected, 1)
+
+    def test_all_ejected_uses_every_upstream(self):
+        for config in self.configs:
+            for _ in range(2):
+                self.balancer.record_probe(config, False, 'down')
+        self.assertEqual(set(self.picks(3)), {'primary', 'secondary'})
+
+    @override_settings(PHONE_REGISTRY={'LOAD_BALANCING': 'least_outstanding'})
+    def test_least_outstanding_per_weight(self):
+        outstanding = {'http://primary.test': 4, 'http://secondary.test': 1}
+        with mock.patch('apps.phone_registry.balancer.get_client') as get_client:
+            get_client.return_value.outstanding_requests.side_effect = outstanding.get
+            self.assertEqual(self.picks(2), ['secondary'] * 2)
+            outstanding['http://secondary.test'] = 2
+            self.assertEqual(self.picks(2), ['primary', 'secondary'])
+
+
+class ConnectionTestViewTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # A second, unreachable upstream the balancer might pick
+        CheckAPIConfig.objects.create(name='spare', base_url='http://127.0.0.1:9', api_key='key')
+
+    async def test_async_view_tests_the_configured_upstream(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': False})
+        for _ in range(2):
+            response = await async_views.test_config(AsyncRequestFactory().post('/config/test/', headers=self.auth))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.upstream.hits[('POST', '/api/phone/check')], 2)
+
+    async def test_async_view_reports_the_failure(self):
+        self.upstream.json('POST', '/api/phone/check', {}, status=500)
+        with override_settings(PHONE_REGISTRY={'RETRY_MAX_ATTEMPTS': 0}):
+            response = await async_views.test_config(AsyncRequestFactory().post('/config/test/', headers=self.auth))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(json.loads(response.content)['message'], 'Connection failed with status 500')
+
+
+class HistogramTests(SimpleTestCase):
+    def test_observations_land_in_cumulative_buckets(self):
+        histogram = Histogram()
+        for seconds in (0.0005, 0.003, 0.003, 0.02, 20):
+            histogram.observe(seconds)
+        stats = histogram.stats()
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(stats['max_ms'], 20000)
+        self.assertEqual(
+            (stats['buckets']['1'], stats['buckets']['5'], stats['buckets']['25'], stats['buckets']['+Inf']), (1, 3, 4, 5)
+        )
+
+    def test_quantiles_interpolate_within_a_bucket(self):
+        histogram = Histogram()
+        for _ in range(4):
+            histogram.observe(0.008)
+        self.assertEqual(histogram.quantile(0.5), 6.5)
+        self.assertEqual(histogram.quantile(1), 8)
+
+    def test_empty_histogram(self):
+        stats = Histogram().stats()
+        self.assertEqual((stats['count'], stats['mean_ms'], stats['p95_ms']), (0, None, None))
+
+    def test_endpoint_names(self):
+        self.assertEqual(endpoint_name('http://upstream.test/api/phone/bulk-register/'), 'bulk-register')
+        self.assertEqual(endpoint_name('http://upstream.test'), '/')
+
+
+class UpstreamMetricsTests(UpstreamTestMixin, SimpleTestCase):
+    def endpoint_stats(self, endpoint):
+        return next(stats for stats in self.api.metrics_stats() if stats['endpoint'] == endpoint)
+
+    def test_calls_are_timed_by_phase(self):
+        self.upstream.json('POST', '/api/phone/check', {'exists': True})
+        self.upstream.json('GET', '/api/phone/list', {}, status=404)
+        self.api.request('POST', self.url('/api/phone/check'), {}, data={}, coalesce=False)
+        self.api.request('POST', self.url('/api/phone/check'), {}, data={}, coalesce=False)
+        self.api.request('GET', self.url('/api/phone/list'), {})
+        stats = self.endpoint_stats('check')
+        self.assertEqual(stats['upstream'], self.upstream.base_url)
+        self.assertEqual(stats['statuses'], {'200': 2})
+        self.assertEqual((stats['new_connections'], stats['reused_connections']), (1, 1))
+        self.assertEqual(stats['phases']['connect']['count'], 1)
+        self.assertEqual((stats['phases']['server']['count'], stats['phases']['total']['count']), (2, 2))
+        self.assertEqual(self.endpoint_stats('list')['statuses'], {'404': 1})
+
+    @override_settings(PHONE_REGISTRY={'RETRY_MAX_ATTEMPTS': 0})
+    def test_connection_errors_are_counted(self):
+        with self.assertRaises(Exception):
+            self.api.request('GET', 'http://127.0.0.1:9/api/phone/list', {})
+        self.assertEqual(self.endpoint_stats('list')['errors'], {'ClientConnectorError': 1})
+
+    def test_reset_clears_every_endpoint(self):
+        self.upstream.json('GET', '/api/phone/list', {})
+        self.api.request('GET', self.url('/api/phone/list'), {})
+        self.api.reset_metrics()
+        self.assertEqual(self.api.metrics_stats(), [])
+
+
+LIMITED_MESSAGE = "I'm very sorry that you had to contact us. Unfortunately, your account is now limited."
+
+
+class PhraseMatcherTests(SimpleTestCase):
+    def test_overlapping_phrases_are_all_found(self):
+        matcher = PhraseMatcher([('he', 1), ('she', 2), ('his', 3), ('hers', 4)])
+        self.assertEqual(matcher.find('ushers'), [('he', 1), ('she', 2), ('hers', 4)])
+        self.assertEqual(matcher.find('this'), [('his', 3)])
+        self.assertEqual(matcher.find('nothing'), [])
+
+    def test_phrases_are_normalized(self):
+        matcher = PhraseMatcher([('Your  Account', 'a'), ('', 'empty')])
+        self.assertEqual(matcher.find(normalize_message('YOUR\naccount')), [('your account', 'a')])
+
+    def test_messages_are_normalized_before_hashing(self):
+        self.assertEqual(normalize_message('  Ｙour account’s\tLIMITED '), "your account's limited")
+        self.assertEqual(message_key('Your account  is limited'), message_key('your account is limited'))
+
+
+class SpamAnalyzerTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = SpamAnalyzer(maxsize=10)
+
+    def test_known_phrase_is_answered_locally_without_nlp_fields(self):
+        result = self.analyzer.classify(LIMITED_MESSAGE)
+        self.assertEqual((result['status'], result['detected_language'], result['source']), ('limited', 'en', 'local'))
+        self.assertEqual(result['matched_phrases'], ['your account is now limited'])
+        self.assertEqual(result['indicators_found'], {'free': 0, 'limited': 1, 'registered': 0, 'frozen': 0})
+        for field in ('translated_text', 'template_similarities', 'sentiment_polarity', 'confidence'):
+            self.assertIsNone(result[field])
+
+    def test_conflicting_phrases_go_upstream(self):
+        self.assertIsNone(self.analyzer.classify('Your account is now limited. Free as a bird!'))
+        self.assertEqual(self.analyzer.ambiguous, 1)
+        self.assertIsNone(self.analyzer.classify('Hello there'))
+
+    def test_service_results_are_cached_by_normalized_message(self):
+        self.assertIsNone(self.analyzer.lookup('Hello there'))
+        self.analyzer.store('Hello there', 200, {'status': 'registered'})
+        self.analyzer.store('Server error', 500, {})
+        self.assertEqual(self.analyzer.lookup('HELLO   there'), {'status': 'registered'})
+        self.assertIsNone(self.analyzer.lookup('Server error'))
+        self.assertEqual(self.analyzer.stats()['upstream_calls'], 2)
+
+    @override_settings(PHONE_REGISTRY={'SPAM_LOCAL_MATCHER': False})
+    def test_local_matcher_can_be_disabled(self):
+        self.assertIsNone(self.analyzer.lookup(LIMITED_MESSAGE))
+
+    def test_phrases_file_is_merged(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'registered': {'en': ['welcome to the registry']}}, f)
+        self.addCleanup(os.remove, f.name)
+        with override_settings(PHONE_REGISTRY={'SPAM_PHRASES_FILE': f.name}):
+            result = SpamAnalyzer(maxsize=10).classify('Welcome to the registry!')
+        self.assertEqual(result['status'], 'registered')
+
+
+class AnalyzeSpamViewTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        spam_analyzer.results.clear()
+        self.upstream.json('POST', '/api/analyze-spam', {'status': 'registered', 'confidence': 0.9})
+
+    def analyze(self, message):
+        return self.http.post('/api/phone/analyze-spam/', {'message': message}, format='json')
+
+    def test_known_phrases_do_not_reach_upstream(self):
+        response = self.analyze(LIMITED_MESSAGE)
+        self.assertEqual(response.json()['source'], 'local')
+        self.assertNotIn(('POST', '/api/analyze-spam'), self.upstream.hits)
+
+    def test_other_messages_go_upstream_once(self):
+        first = self.analyze('Hello there')
+        second = self.analyze('hello  THERE')
+        self.assertEqual(json.loads(first.content), {'status': 'registered', 'confidence': 0.9})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.upstream.hits[('POST', '/api/analyze-spam')], 1)
+
+
+class AnalyzeSpamBatchTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        spam_analyzer.results.clear()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def analyze(request):
+            message = (await request.json())['message']
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            if message == 'Broken':
+                return web.json_response({'detail': 'Unprocessable'}, status=422)
+            return web.json_response({'status': 'registered', 'message': message})
+
+        self.upstream.routes[('POST', '/api/analyze-spam')] = analyze
+
+    def analyze(self, messages, **extra):
+        return self.http.post('/api/phone/analyze-spam/batch/', {'messages': messages, **extra}, format='json')
+
+    def test_duplicates_are_analyzed_once_and_results_keep_input_order(self):
+        response = self.analyze(['Hello', LIMITED_MESSAGE, 'HELLO ', 'Other'])
+        data = response.json()['data']
+        self.assertEqual(
+            {key: data[key] for key in ('total', 'unique', 'answered_locally', 'sent_upstream')},
+            {'total': 4, 'unique': 3, 'answered_locally': 1, 'sent_upstream': 2}
+        )
+        self.assertEqual([row['index'] for row in data['results']], [0, 1, 2, 3])
+        self.assertEqual(data['results'][1]['result']['source'], 'local')
+        self.assertEqual(data['results'][2]['result'], data['results'][0]['result'])
+        self.assertEqual(self.upstream.hits[('POST', '/api/analyze-spam')], 2)
+
+    def test_failed_message_does_not_stop_the_batch(self):
+        rows = self.analyze(['Broken', 'Fine']).json()['data']['results']
+        self.assertEqual([row['status'] for row in rows], [422, 200])
+
+    @override_settings(PHONE_REGISTRY={'SPAM_BATCH_CONCURRENCY': 2})
+    def test_requests_in_flight_are_bounded(self):
+        self.analyze([f'Message {number}' for number in range(6)])
+        self.assertEqual(self.max_in_flight, 2)
+
+    def test_streamed_results_cover_every_input(self):
+        response = self.analyze(['Hello', 'hello', LIMITED_MESSAGE], stream=True)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[0]['index'], 2)
+        self.assertEqual(sorted(row['index'] for row in rows), [0, 1, 2])
+
+    async def test_async_view_keeps_input_order(self):
+        request = AsyncRequestFactory().post(
+            '/analyze-spam/batch/', {'messages': ['b', 'a', 'B']}, content_type='application/json', headers=self.auth
+        )
+        rows = json.loads((await async_views.analyze_spam_batch(request)).content)['data']['results']
+        self.assertEqual([row['result']['message'] for row in rows], ['b', 'a', 'b'])
+
+
+@override_settings(PHONE_REGISTRY={'CLEANUP_JOB_STEP_DAYS': 30, 'CLEANUP_JOB_MAX_RETRIES': 0})
+class CleanupJobTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.deleted = []
+
+        def cleanup(body):
+            self.deleted.append(body['retention_days'])
+            return 200, {'deleted_count': 5}
+
+        self.upstream.echo('DELETE', '/api/phone/cleanup', cleanup)
+
+    def oldest_record(self, days_ago):
+        registered_at = (timezone.now() - timedelta(days=days_ago)).isoformat()
+        self.upstream.json('GET', '/api/phone/list', {'items': [{'registered_at': registered_at}], 'total': 1})
+
+    def test_steps_go_from_the_oldest_record_down_to_the_retention(self):
+        self.oldest_record(100)
+        job = CleanupJob.objects.create(retention_days=10)
+        self.assertEqual(CleanupRunner(job).plan_steps(self.config), [70, 40, 10])
+        self.oldest_record(5)
+        self.assertEqual(CleanupRunner(job).plan_steps(self.config), [10])
+        self.upstream.json('GET', '/api/phone/list', {'items': [], 'total': 0})
+        self.assertEqual(CleanupRunner(job).plan_steps(self.config), [10])
+
+    def test_job_deletes_step_by_step_and_prunes_the_mirror(self):
+        self.oldest_record(100)
+        RegisteredPhone.objects.create(phone_number='+15550100', registered_at=timezone.now() - timedelta(days=80))
+        RegisteredPhone.objects.create(phone_number='+15550101', registered_at=timezone.now())
+        phone_check_cache.set('+15550100', {'exists': True}, ttl=60)
+        job = CleanupJob.objects.create(retention_days=10)
+        CleanupRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual(self.deleted, [70, 40, 10])
+        self.assertEqual((job.status, job.is_running, job.progress), ('completed', False, 1.0))
+        self.assertEqual((job.deleted_count, job.mirror_deleted_count), (15, 1))
+        self.assertIsNone(phone_check_cache.get('+15550100'))
+
+    def test_failed_step_stops_the_job(self):
+        self.oldest_record(100)
+        self.upstream.json('DELETE', '/api/phone/cleanup', {'detail': 'Unavailable'}, status=503)
+        job = CleanupJob.objects.create(retention_days=10)
+        CleanupRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.steps_completed), ('failed', 0))
+        self.assertEqual(job.error, 'Cleanup of records older than 70 days failed')
+        self.assertEqual(self.upstream.hits[('DELETE', '/api/phone/cleanup')], 1)
+
+    def test_job_expired_while_running_stops_and_stays_failed(self):
+        self.oldest_record(100)
+        job = CleanupJob.objects.create(retention_days=10)
+        record_step = CleanupRunner.record_step
+
+        def record_and_expire(runner, *args):
+            succeeded = record_step(runner, *args)
+            CleanupJob.objects.filter(pk=job.pk).update(
+                status='failed', is_running=False, error='Job stopped reporting progress'
+            )
+            return succeeded
+
+        with mock.patch.object(CleanupRunner, 'record_step', record_and_expire), \
+                self.assertLogs('apps.phone_registry.jobs', 'WARNING'):
+            CleanupRunner(job).run()
+        job.refresh_from_db()
+        self.assertEqual(self.deleted, [70])
+        self.assertEqual((job.status, job.is_running, job.steps_completed), ('failed', False, 1))
+        self.assertEqual(job.error, 'Job stopped reporting progress')
+
+    def test_only_one_job_runs_at_a_time(self):
+        job, _ = create_cleanup_job(self.user, 30)
+        self.assertEqual(create_cleanup_job(self.user, 60), (None, job))
+        response = self.http.delete('/api/phone/cleanup/', {'retention_days': 60}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['data']['id'], job.pk)
+
+    def test_stale_job_does_not_block_a_new_one(self):
+        stale, _ = create_cleanup_job(self.user, 30)
+        CleanupJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        response = self.http.delete('/api/phone/cleanup/', {'retention_days': 60}, format='json')
+        self.assertEqual(response.status_code, 202)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.is_running), ('failed', False))
+
+
+class BloomFilterTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'registered.bloom')
+
+    def create(self, capacity=1000):
+        bloom = BloomFilter.create(self.path, capacity, 0.01)
+        self.addCleanup(bloom.close)
+        return bloom
+
+    def test_added_numbers_are_always_found(self):
+        bloom = self.create()
+        phone_numbers = [f'+1555{number:07d}' for number in range(1000)]
+        self.assertEqual(bloom.add(phone_numbers), 1000)
+        self.assertTrue(all(phone_number in bloom for phone_number in phone_numbers))
+        false_positives = sum(f'+4420{number:07d}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_fill_ratio_is_kept_in_the_header(self):
+        bloom = self.create()
+        bloom.add(['+15550100', '+15550101'])
+        bloom.add(['+15550100'])
+        bits = int.from_bytes(bloom.buffer[HEADER_SIZE:], 'little').bit_count()
+        self.assertEqual(bloom.bits_set, bits)
+        self.assertEqual(bloom.fill_ratio(), bits / bloom.bit_count)
+        self.assertEqual(bloom.insertions, 3)
+
+    def test_other_workers_see_additions_through_the_shared_file(self):
+        bloom = self.create()
+        other = BloomFilter(self.path)
+        self.addCleanup(other.close)
+        bloom.add(['+15550100'])
+        self.assertIn('+15550100', other)
+        self.assertEqual(other.bits_set, bloom.bits_set)
+
+    def test_other_files_are_rejected(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 128)
+        with self.assertRaises(ValueError):
+            BloomFilter(self.path)
+
+
+class PhoneBloomTests(ProxyViewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Runs last: drop this test's filter from the shared instance
+        self.addCleanup(phone_bloom.current, force=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'registered.bloom')
+        settings = override_settings(PHONE_REGISTRY={
+            'BLOOM_SERVE_CHECK': True, 'BLOOM_FILTER_PATH': self.path, 'BLOOM_RELOAD_INTERVAL': 0,
+            'BLOOM_MIN_CAPACITY': 100, 'EXPORT_PAGE_SIZE': 2,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.upstream.pages('/api/phone/list', registry_items(5)[::-1])
+
+    def test_build_adds_the_whole_registry(self):
+        # Every record predates the build, so the catch-up walk adds none
+        self.assertEqual(build_bloom(self.config), 5)
+        bloom = PhoneBloom().current(force=True)
+        self.assertTrue(all(item['phone_number'] in bloom for item in registry_items(5)))
+        self.assertGreater(bloom.built_at, 0)
+
+    def test_definitely_unregistered_numbers_are_answered_locally(self):
+        build_bloom(self.config)
+        bloom = PhoneBloom()
+        answer = bloom.check('+1 555 999 9999')
+        self.assertEqual((answer['exists'], answer['freshness']['source']), (False, 'bloom'))
+        self.assertIsNone(bloom.check('+15550000001'))
+        bloom.record_result('+15550000001', 200, {'exists': True})
+        self.assertEqual((bloom.definite_negatives, bloom.possible_positives, bloom.confirmed_positives), (1, 1, 1))
+
+    def test_registered_numbers_are_added_before_they_go_upstream(self):
+        build_bloom(self.config)
+        self.upstream.json('POST', '/api/phone/bulk-register', {'newly_registered': 1})
+        self.http.post('/api/phone/bulk-register/', {'phone_numbers': ['+1 555 777 0000']}, format='json')
+        self.assertIsNone(PhoneBloom().check('+15557770000'))
+
+    def test_stale_filter_is_not_used(self):
+        build_bloom(self.config)
+        bloom = PhoneBloom()
+        bloom.current(force=True).set_built_at(time.time() - 7200)
+        self.assertIsNone(bloom.check('+15559999999'))
+
+    def test_check_view_skips_upstream_for_unregistered_numbers(self):
+        build_bloom(self.config)
+        response = self.http.post('/api/phone/check/', {'phone_number': '+15559999999'}, format='json')
+        self.assertEqual(response.json()['freshness']['source'], 'bloom')
+        self.assertNotIn(('POST', '/api/phone/check'), self.upstream.hits)
@@ -1,16 +1,32 @@
 from django.urls import path
-from . import views
+from . import views, async_views
+from .conf import get_setting
+
+# Serve the upstream proxy endpoints natively async under ASGI
+proxy_views = async_views if get_setting('ASYNC_VIEWS') else views
 
 urlpatterns = [
-    path('check/', views.phone_check, name='phone-check'),
-    path('register/', views.phone_register, name='phone-register'),
-    path('bulk-register/', views.phone_bulk_register, name='phone-bulk-register'),
-    path('list/', views.phone_list, name='phone-list'),
-    path('analytics/', views.phone_analytics, name='phone-analytics'),
+    path('check/', proxy_views.phone_check, name='phone-check'),
+    path('register/', proxy_views.phone_register, name='phone-register'),
+    path('bulk-register/', proxy_views.phone_bulk_register, name='phone-bulk-register'),
+    path('bulk-register/jobs/', views.bulk_register_jobs, name='phone-bulk-register-jobs'),
+    path('bulk-register/jobs/<int:pk>/', views.bulk_register_job_detail, name='phone-bulk-register-job-detail'),
+    path('list/', proxy_views.phone_list, name='phone-list'),
+    path('export/', proxy_views.phone_export, name='phone-export'),
+    path('analytics/', proxy_views.phone_analytics, name='phone-analytics'),
     path('cleanup/', views.phone_cleanup, name='phone-cleanup'),
-    path('analyze-spam/', views.analyze_spam, name='analyze-spam'),
+    path('cleanup/jobs/', views.cleanup_jobs, name='phone-cleanup-jobs'),
+    path('cleanup/jobs/<int:pk>/', views.cleanup_job_detail, name='phone-cleanup-job-detail'),
+    path('analyze-spam/', proxy_views.analyze_spam, name='analyze-spam'),
+    path('analyze-spam/batch/', proxy_views.analyze_spam_batch, name='analyze-spam-batch'),
     # Configuration endpoints
     path('config/', views.get_config, name='get-config'),
     path('config/update/', views.update_config, name='update-config'),
-    path('config/test/', views.test_config, name='test-config'),
+    path('config/test/', proxy_views.test_config, name='test-config'),
+    # Cache statistics
+    path('cache/stats/', views.cache_stats, name='cache-stats'),
+    # Upstream circuit breakers
+    path('upstream/status/', views.upstream_status, name='upstream-status'),
+    # Upstream latency histograms
+    path('upstream/metrics/', views.upstream_metrics, name='upstream-metrics'),
 ]
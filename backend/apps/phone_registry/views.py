@@ -2,20 +2,38 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-import aiohttp
-import asyncio
-from .models import CheckAPIConfig
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from .analytics_cache import analytics_cache, analytics_params, wants_refresh
+from .balancer import balancer, get_balanced_config, probe_upstream
+from .batching import get_batcher
+from .bloom import phone_bloom
+from .cache import cache_check_result, get_cache_stats, get_cached_check, invalidate_phone_numbers
+from .client import RawBody, get_client
+from .conf import get_setting
+from .config_cache import get_active_config, invalidate_config_cache
+from .export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, EXPORT_FILTERS, RegistryPager, stream_export
+from .jobs import (
+    create_cleanup_job, expire_stale_bulk_register_jobs, save_job_file, start_bulk_register_job, start_cleanup_job
+)
+from .mirror import local_check, local_list
+from .models import CheckAPIConfig, BulkRegisterJob, CleanupJob
+from .normalization import normalize_batch
+from .ratelimit import RateLimitExceeded
 from .serializers import (
     PhoneCheckSerializer, PhoneRegisterSerializer, PhoneBulkRegisterSerializer,
     PhoneListSerializer, PhoneAnalyticsSerializer, PhoneCleanupSerializer,
-    SpamAnalysisSerializer
+    SpamAnalysisSerializer, SpamBatchAnalysisSerializer, BulkRegisterUploadSerializer,
+    BulkRegisterJobSerializer, CheckAPIRateLimitSerializer, CleanupJobSerializer
 )
+from .spam import spam_analyzer
+from .spam_batch import SpamBatch, ordered_results, stream_results
 
 
 def get_api_config():
-    """Get the active API configuration"""
+    """Get the active API configuration to use for this request"""
     try:
-        config = CheckAPIConfig.objects.filter(is_active=True).first()
+        config = get_balanced_config()
         if not config:
             return None, "No active API configuration found. Please configure Check API in admin panel."
         return config, None
@@ -23,19 +41,26 @@ def get_api_config():
         return None, str(e)
 
 
-async def make_api_request(method, endpoint, headers, data=None, params=None):
-    """Make async API request to external Check API"""
-    async with aiohttp.ClientSession() as session:
-        async with session.request(
-            method=method,
-            url=endpoint,
-            headers=headers,
-            json=data,
-            params=params,
-            timeout=aiohttp.ClientTimeout(total=30)
-        ) as response:
-            response_data = await response.json()
-            return response.status, response_data
+def make_api_request(method, endpoint, headers, data=None, params=None, coalesce=None, raw=False):
+    """Make API request to external Check API over the shared connection pool"""
+    return get_client().request(method, endpoint, headers, data=data, params=params, coalesce=coalesce, raw=raw)
+
+
+def relay_response(response_status, response_data):
+    """Relay an upstream result; passthrough bodies are returned without decoding"""
+    if isinstance(response_data, RawBody):
+        return HttpResponse(response_data.content, status=response_status, content_type=response_data.content_type)
+    return Response(response_data, status=response_status)
+
+
+def rate_limited_response(e):
+    """429 telling the client when to retry, returned instead of calling the Check API"""
+    response = Response({
+        'success': False,
+        'message': str(e)
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(e.retry_after)
+    return response
 
 
 @api_view(['POST'])
@@ -50,6 +75,15 @@ def phone_check(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    phone_number = serializer.validated_data['phone_number']
+    cached_data = get_cached_check(phone_number)
+    if cached_data is not None:
+        return Response(cached_data)
+    
+    local_data = local_check(phone_number) or phone_bloom.check(phone_number)
+    if local_data is not None:
+        return Response(local_data)
+    
     config, error = get_api_config()
     if error:
         return Response({
@@ -64,16 +98,20 @@ def phone_check(request):
             'Content-Type': 'application/json'
         }
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('POST', endpoint, headers, data=serializer.validated_data)
-        )
-        loop.close()
+        if get_setting('CHECK_BATCHING'):
+            response_status, response_data = get_batcher().check(config, phone_number)
+        else:
+            response_status, response_data = make_api_request(
+                'POST', endpoint, headers, data=serializer.validated_data, coalesce=True
+            )
+        
+        cache_check_result(phone_number, response_status, response_data)
+        phone_bloom.record_result(phone_number, response_status, response_data)
         
         return Response(response_data, status=response_status)
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -100,6 +138,8 @@ def phone_register(request):
             'message': error
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    phone_bloom.add([serializer.validated_data['phone_number']])
+    
     try:
         endpoint = f"{config.base_url}/api/phone/register"
         headers = {
@@ -107,16 +147,16 @@ def phone_register(request):
             'Content-Type': 'application/json'
         }
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('POST', endpoint, headers, data=serializer.validated_data)
+        response_status, response_data = make_api_request(
+            'POST', endpoint, headers, data=serializer.validated_data, raw=get_setting('PASSTHROUGH_RESPONSES')
         )
-        loop.close()
         
-        return Response(response_data, status=response_status)
+        invalidate_phone_numbers([serializer.validated_data['phone_number']])
+        
+        return relay_response(response_status, response_data)
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -136,6 +176,15 @@ def phone_bulk_register(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    # Canonicalize and de-duplicate before anything is sent upstream
+    phone_numbers, normalization = normalize_batch(serializer.validated_data['phone_numbers'])
+    if not phone_numbers:
+        return Response({
+            'success': False,
+            'message': 'Validation error',
+            'errors': {'phone_numbers': ['No valid phone numbers provided.']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
     config, error = get_api_config()
     if error:
         return Response({
@@ -143,6 +192,8 @@ def phone_bulk_register(request):
             'message': error
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    phone_bloom.add(phone_numbers)
+    
     try:
         endpoint = f"{config.base_url}/api/phone/bulk-register"
         headers = {
@@ -150,16 +201,18 @@ def phone_bulk_register(request):
             'Content-Type': 'application/json'
         }
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('POST', endpoint, headers, data=serializer.validated_data)
+        response_status, response_data = make_api_request(
+            'POST', endpoint, headers, data={'phone_numbers': phone_numbers}
         )
-        loop.close()
+        
+        invalidate_phone_numbers(phone_numbers)
+        if isinstance(response_data, dict):
+            response_data['normalization'] = normalization
         
         return Response(response_data, status=response_status)
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -167,10 +220,77 @@ def phone_bulk_register(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def bulk_register_jobs(request):
+    """List bulk register jobs, or upload a CSV/NDJSON file to start one"""
+    expire_stale_bulk_register_jobs()
+    if request.method == 'GET':
+        jobs = BulkRegisterJob.objects.all()[:50]
+        return Response({
+            'success': True,
+            'data': BulkRegisterJobSerializer(jobs, many=True).data
+        })
+    
+    serializer = BulkRegisterUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'message': 'Validation error',
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    config, error = get_api_config()
+    if error:
+        return Response({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    file_format = serializer.validated_data['file_format']
+    job = BulkRegisterJob.objects.create(
+        created_by=request.user,
+        file_path=save_job_file(serializer.validated_data['file'], file_format),
+        file_format=file_format,
+        chunk_size=get_setting('BULK_JOB_CHUNK_SIZE'),
+    )
+    transaction.on_commit(lambda: start_bulk_register_job(job))
+    
+    return Response({
+        'success': True,
+        'message': 'Bulk registration started',
+        'data': BulkRegisterJobSerializer(job).data
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def bulk_register_job_detail(request, pk):
+    """Get progress of a bulk register job"""
+    expire_stale_bulk_register_jobs()
+    try:
+        job = BulkRegisterJob.objects.get(pk=pk)
+        return Response({
+            'success': True,
+            'data': BulkRegisterJobSerializer(job).data
+        })
+    except BulkRegisterJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def phone_list(request):
     """Retrieve phone registry with pagination and filtering"""
+    list_serializer = PhoneListSerializer(data=request.query_params)
+    if list_serializer.is_valid():
+        local_data = local_list(list_serializer.validated_data)
+        if local_data is not None:
+            return Response(local_data)
+    
     config, error = get_api_config()
     if error:
         return Response({
@@ -191,21 +311,66 @@ def phone_list(request):
             if value is not None:
                 params[key] = value
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('GET', endpoint, headers, params=params)
+        response_status, response_data = make_api_request(
+            'GET', endpoint, headers, params=params, raw=get_setting('PASSTHROUGH_RESPONSES')
         )
-        loop.close()
         
-        return Response(response_data, status=response_status)
+        return relay_response(response_status, response_data)
+        
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'Error connecting to Check API: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def phone_export(request):
+    """Stream the full phone registry as CSV or NDJSON"""
+    file_format = request.query_params.get('file_format', 'csv')
+    if file_format not in EXPORT_CONTENT_TYPES:
+        return Response({
+            'success': False,
+            'message': 'Validation error',
+            'errors': {'file_format': ['Must be "csv" or "ndjson".']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    config, error = get_api_config()
+    if error:
+        return Response({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    try:
+        filters = {}
+        for key in EXPORT_FILTERS:
+            value = request.query_params.get(key)
+            if value is not None:
+                filters[key] = value
         
+        pager = RegistryPager(config, filters)
+        response_status, response_data = pager.first_page()
+        if response_status != 200:
+            return Response(response_data, status=response_status)
+        
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
             'message': f'Error connecting to Check API: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    response = StreamingHttpResponse(
+        stream_export(pager, response_data, file_format),
+        content_type=EXPORT_CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="phone_registry.{file_format}"'
+    return response
 
 
 @api_view(['GET'])
@@ -226,22 +391,23 @@ def phone_analytics(request):
         }
         
         # Get query parameters
-        params = {}
-        for key in ['start_date', 'end_date', 'is_bulked']:
-            value = request.query_params.get(key)
-            if value is not None:
-                params[key] = value
+        params = analytics_params(request.query_params)
+        refresh = wants_refresh(request.query_params)
+        
+        if not refresh:
+            cached_data = analytics_cache.get(config, params)
+            if cached_data is not None:
+                return Response(cached_data)
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('GET', endpoint, headers, params=params)
+        response_status, response_data = make_api_request('GET', endpoint, headers, params=params)
+        response_data = analytics_cache.put(
+            config, params, response_status, response_data, cache_status='refreshed' if refresh else 'miss'
         )
-        loop.close()
         
         return Response(response_data, status=response_status)
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -252,7 +418,7 @@ def phone_analytics(request):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def phone_cleanup(request):
-    """Delete phone records older than the specified retention period"""
+    """Start a background job deleting phone records older than the specified retention period"""
     serializer = PhoneCleanupSerializer(data=request.data)
     if not serializer.is_valid():
         return Response({
@@ -268,28 +434,48 @@ def phone_cleanup(request):
             'message': error
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    job, running_job = create_cleanup_job(request.user, serializer.validated_data['retention_days'])
+    if job is None:
+        return Response({
+            'success': False,
+            'message': 'A cleanup job is already running',
+            'data': CleanupJobSerializer(running_job).data if running_job else None
+        }, status=status.HTTP_409_CONFLICT)
+    transaction.on_commit(lambda: start_cleanup_job(job))
+    
+    return Response({
+        'success': True,
+        'message': 'Cleanup started',
+        'data': CleanupJobSerializer(job).data
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cleanup_jobs(request):
+    """List cleanup jobs"""
+    jobs = CleanupJob.objects.all()[:50]
+    return Response({
+        'success': True,
+        'data': CleanupJobSerializer(jobs, many=True).data
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cleanup_job_detail(request, pk):
+    """Get progress of a cleanup job"""
     try:
-        endpoint = f"{config.base_url}/api/phone/cleanup"
-        headers = {
-            'X-API-Key': config.api_key,
-            'Content-Type': 'application/json'
-        }
-        
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('DELETE', endpoint, headers, data=serializer.validated_data)
-        )
-        loop.close()
-        
-        return Response(response_data, status=response_status)
-        
-    except Exception as e:
+        job = CleanupJob.objects.get(pk=pk)
+        return Response({
+            'success': True,
+            'data': CleanupJobSerializer(job).data
+        })
+    except CleanupJob.DoesNotExist:
         return Response({
             'success': False,
-            'message': f'Error connecting to Check API: {str(e)}'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'message': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
 
 
 @api_view(['POST'])
@@ -304,6 +490,11 @@ def analyze_spam(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    message = serializer.validated_data['message']
+    known_data = spam_analyzer.lookup(message)
+    if known_data is not None:
+        return relay_response(status.HTTP_200_OK, known_data)
+    
     config, error = get_api_config()
     if error:
         return Response({
@@ -318,16 +509,17 @@ def analyze_spam(request):
             'Content-Type': 'application/json'
         }
         
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('POST', endpoint, headers, data=serializer.validated_data)
+        response_status, response_data = make_api_request(
+            'POST', endpoint, headers, data=serializer.validated_data, coalesce=True,
+            raw=get_setting('PASSTHROUGH_RESPONSES')
         )
-        loop.close()
         
-        return Response(response_data, status=response_status)
+        spam_analyzer.store(message, response_status, response_data)
         
+        return relay_response(response_status, response_data)
+        
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
     except Exception as e:
         return Response({
             'success': False,
@@ -335,12 +527,44 @@ def analyze_spam(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def analyze_spam_batch(request):
+    """Analyze a list of account status messages, in input order or streamed as NDJSON"""
+    serializer = SpamBatchAnalysisSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'message': 'Validation error',
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    config, error = get_api_config()
+    if error:
+        return Response({
+            'success': False,
+            'message': error
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    batch = SpamBatch(config, serializer.validated_data['messages'])
+    if serializer.validated_data['stream']:
+        return StreamingHttpResponse(stream_results(batch), content_type='application/x-ndjson')
+    
+    return Response({
+        'success': True,
+        'data': {
+            **batch.summary(),
+            'results': ordered_results(batch),
+        }
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def get_config(request):
     """Get Check API configuration"""
     try:
-        config = CheckAPIConfig.objects.filter(is_active=True).first()
+        config = get_active_config()
         if not config:
             return Response({
                 'success': True,
@@ -362,6 +586,7 @@ def get_config(request):
                 'api_key': '***' + config.api_key[-4:] if config.api_key and len(config.api_key) > 4 else '***',
                 'is_active': config.is_active,
                 'exists': True,
+                **CheckAPIRateLimitSerializer(config).data,
                 'created_at': config.created_at.isoformat(),
                 'updated_at': config.updated_at.isoformat(),
             }
@@ -394,13 +619,23 @@ def update_config(request):
                 'message': 'API Key is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        rate_limit_serializer = CheckAPIRateLimitSerializer(data=request.data, partial=True)
+        if not rate_limit_serializer.is_valid():
+            return Response({
+                'success': False,
+                'message': 'Validation error',
+                'errors': rate_limit_serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        rate_limits = rate_limit_serializer.validated_data
+        
         # Get or create the default config
         config, created = CheckAPIConfig.objects.get_or_create(
             name='default',
             defaults={
                 'base_url': base_url,
                 'api_key': api_key,
-                'is_active': is_active
+                'is_active': is_active,
+                **rate_limits
             }
         )
         
@@ -409,8 +644,12 @@ def update_config(request):
             config.base_url = base_url
             config.api_key = api_key
             config.is_active = is_active
+            for field, value in rate_limits.items():
+                setattr(config, field, value)
             config.save()
         
+        invalidate_config_cache()
+        
         return Response({
             'success': True,
             'message': 'Configuration saved successfully',
@@ -419,6 +658,7 @@ def update_config(request):
                 'name': config.name,
                 'base_url': config.base_url,
                 'is_active': config.is_active,
+                **CheckAPIRateLimitSerializer(config).data,
             }
         })
     except Exception as e:
@@ -433,41 +673,24 @@ def update_config(request):
 def test_config(request):
     """Test Check API connection"""
     try:
-        config = CheckAPIConfig.objects.filter(is_active=True).first()
+        config = get_active_config()
         if not config:
             return Response({
                 'success': False,
                 'message': 'No active configuration found. Please save configuration first.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Try to make a simple request to the API
-        endpoint = f"{config.base_url}/api/phone/check"
-        headers = {
-            'X-API-Key': config.api_key,
-            'Content-Type': 'application/json'
-        }
-        
-        # Test with a dummy phone number
-        test_data = {'phone_number': '+1234567890'}
-        
-        # Run async request
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response_status, response_data = loop.run_until_complete(
-            make_api_request('POST', endpoint, headers, data=test_data)
-        )
-        loop.close()
-        
-        # If we got any response (even if phone doesn't exist), connection works
-        if response_status < 500:
+        # Same request as the background health probe, with a dummy phone number
+        ok, message = get_client().submit(probe_upstream(config)).result()
+        if ok:
             return Response({
                 'success': True,
-                'message': 'Connection successful! Check API is reachable.',
+                'message': message,
             })
         else:
             return Response({
                 'success': False,
-                'message': f'Connection failed with status {response_status}'
+                'message': message
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
     except Exception as e:
@@ -475,3 +698,54 @@ def test_config(request):
             'success': False,
             'message': f'Connection test failed: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cache_stats(request):
+    """Get hit/miss counters for the Check API result caches, request coalescing, batching and local fast paths"""
+    return Response({
+        'success': True,
+        'data': {
+            **get_cache_stats(),
+            'single_flight': get_client().single_flight_stats(),
+            'phone_analytics': analytics_cache.stats(),
+            'analyze_spam': spam_analyzer.stats(),
+            'phone_bloom': phone_bloom.stats(),
+            'check_batching': get_batcher().stats(),
+        }
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def upstream_status(request):
+    """Get upstream health, circuit breaker, retry, hedge and rate limiter state for the Check API"""
+    return Response({
+        'success': True,
+        'data': {
+            'upstreams': balancer.stats(),
+            'endpoints': get_client().endpoint_stats(),
+            'rate_limits': get_client().rate_limit_stats(),
+        }
+    })
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def upstream_metrics(request):
+    """Get per-endpoint latency histograms by phase and status counts for the Check API; DELETE resets them"""
+    if request.method == 'DELETE':
+        get_client().reset_metrics()
+        return Response({
+            'success': True,
+            'message': 'Upstream metrics reset'
+        })
+
+    return Response({
+        'success': True,
+        'data': {
+            'enabled': get_setting('UPSTREAM_METRICS'),
+            'endpoints': get_client().metrics_stats(),
+        }
+    })
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Serve the phone registry proxy endpoints as native async views
+os.environ.setdefault('PHONE_REGISTRY_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -183,3 +183,67 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
+
+# Phone Registry (Check API) Settings
+PHONE_REGISTRY = {
+    'ASYNC_VIEWS': os.environ.get('PHONE_REGISTRY_ASYNC_VIEWS', 'False') == 'True',
+    'POOL_LIMIT': int(os.environ.get('CHECK_API_POOL_LIMIT', '100')),
+    'POOL_LIMIT_PER_HOST': int(os.environ.get('CHECK_API_POOL_LIMIT_PER_HOST', '50')),
+    'DNS_CACHE_TTL': int(os.environ.get('CHECK_API_DNS_CACHE_TTL', '300')),
+    'KEEPALIVE_TIMEOUT': float(os.environ.get('CHECK_API_KEEPALIVE_TIMEOUT', '30')),
+    'REQUEST_TIMEOUT': float(os.environ.get('CHECK_API_REQUEST_TIMEOUT', '30')),
+    'COALESCE_REQUESTS': os.environ.get('CHECK_API_COALESCE_REQUESTS', 'True') == 'True',
+    'PASSTHROUGH_RESPONSES': os.environ.get('CHECK_API_PASSTHROUGH_RESPONSES', 'True') == 'True',
+    'LOAD_BALANCING': os.environ.get('CHECK_API_LOAD_BALANCING', 'round_robin'),
+    'HEALTH_CHECK_INTERVAL': float(os.environ.get('CHECK_API_HEALTH_CHECK_INTERVAL', '10')),
+    'HEALTH_CHECK_FAILURES': int(os.environ.get('CHECK_API_HEALTH_CHECK_FAILURES', '2')),
+    'HEALTH_CHECK_SUCCESSES': int(os.environ.get('CHECK_API_HEALTH_CHECK_SUCCESSES', '2')),
+    'CIRCUIT_FAILURE_THRESHOLD': int(os.environ.get('CHECK_API_CIRCUIT_FAILURE_THRESHOLD', '5')),
+    'CIRCUIT_RESET_TIMEOUT': float(os.environ.get('CHECK_API_CIRCUIT_RESET_TIMEOUT', '30')),
+    'RETRY_MAX_ATTEMPTS': int(os.environ.get('CHECK_API_RETRY_MAX_ATTEMPTS', '2')),
+    'RETRY_BACKOFF_BASE': float(os.environ.get('CHECK_API_RETRY_BACKOFF_BASE', '0.2')),
+    'RETRY_BACKOFF_MAX': float(os.environ.get('CHECK_API_RETRY_BACKOFF_MAX', '2')),
+    'HEDGE_REQUESTS': os.environ.get('CHECK_API_HEDGE_REQUESTS', 'False') == 'True',
+    'HEDGE_MIN_SAMPLES': int(os.environ.get('CHECK_API_HEDGE_MIN_SAMPLES', '20')),
+    'UPSTREAM_METRICS': os.environ.get('CHECK_API_UPSTREAM_METRICS', 'True') == 'True',
+    'CHECK_BATCHING': os.environ.get('CHECK_API_CHECK_BATCHING', 'False') == 'True',
+    'CHECK_BATCH_WINDOW_MS': float(os.environ.get('CHECK_API_CHECK_BATCH_WINDOW_MS', '10')),
+    'CHECK_BATCH_MAX_SIZE': int(os.environ.get('CHECK_API_CHECK_BATCH_MAX_SIZE', '100')),
+    'CHECK_BATCH_ENDPOINT': os.environ.get('CHECK_API_CHECK_BATCH_ENDPOINT', ''),
+    'CONFIG_VERSION_CHECK_INTERVAL': float(os.environ.get('CHECK_API_CONFIG_VERSION_CHECK_INTERVAL', '1')),
+    'CONFIG_CACHE_MAX_AGE': float(os.environ.get('CHECK_API_CONFIG_CACHE_MAX_AGE', '30')),
+    'CHECK_CACHE_MAXSIZE': int(os.environ.get('CHECK_API_CHECK_CACHE_MAXSIZE', '10000')),
+    'CHECK_CACHE_POSITIVE_TTL': float(os.environ.get('CHECK_API_CHECK_CACHE_POSITIVE_TTL', '300')),
+    'CHECK_CACHE_NEGATIVE_TTL': float(os.environ.get('CHECK_API_CHECK_CACHE_NEGATIVE_TTL', '30')),
+    'ANALYTICS_CACHE_MAXSIZE': int(os.environ.get('CHECK_API_ANALYTICS_CACHE_MAXSIZE', '1000')),
+    'ANALYTICS_CACHE_FRESH_TTL': float(os.environ.get('CHECK_API_ANALYTICS_CACHE_FRESH_TTL', '60')),
+    'ANALYTICS_CACHE_STALE_TTL': float(os.environ.get('CHECK_API_ANALYTICS_CACHE_STALE_TTL', '3600')),
+    'ANALYTICS_CACHE_HISTORICAL_TTL': float(os.environ.get('CHECK_API_ANALYTICS_CACHE_HISTORICAL_TTL', '86400')),
+    'ANALYTICS_CACHE_REFRESH_BACKOFF': float(os.environ.get('CHECK_API_ANALYTICS_CACHE_REFRESH_BACKOFF', '5')),
+    'SPAM_LOCAL_MATCHER': os.environ.get('CHECK_API_SPAM_LOCAL_MATCHER', 'True') == 'True',
+    'SPAM_PHRASES_FILE': os.environ.get('CHECK_API_SPAM_PHRASES_FILE', ''),
+    'SPAM_CACHE_MAXSIZE': int(os.environ.get('CHECK_API_SPAM_CACHE_MAXSIZE', '10000')),
+    'SPAM_CACHE_TTL': float(os.environ.get('CHECK_API_SPAM_CACHE_TTL', '86400')),
+    'SPAM_BATCH_CONCURRENCY': int(os.environ.get('CHECK_API_SPAM_BATCH_CONCURRENCY', '8')),
+    'EXPORT_PAGE_SIZE': int(os.environ.get('CHECK_API_EXPORT_PAGE_SIZE', '1000')),
+    'EXPORT_PREFETCH_PAGES': int(os.environ.get('CHECK_API_EXPORT_PREFETCH_PAGES', '4')),
+    'MIRROR_SERVE_LIST': os.environ.get('PHONE_REGISTRY_MIRROR_SERVE_LIST', 'False') == 'True',
+    'MIRROR_SERVE_CHECK': os.environ.get('PHONE_REGISTRY_MIRROR_SERVE_CHECK', 'False') == 'True',
+    'MIRROR_MAX_STALENESS': float(os.environ.get('PHONE_REGISTRY_MIRROR_MAX_STALENESS', '900')),
+    'MIRROR_SYNC_PAGE_SIZE': int(os.environ.get('PHONE_REGISTRY_MIRROR_SYNC_PAGE_SIZE', '1000')),
+    'MIRROR_SYNC_OVERLAP': float(os.environ.get('PHONE_REGISTRY_MIRROR_SYNC_OVERLAP', '300')),
+    'BLOOM_SERVE_CHECK': os.environ.get('PHONE_REGISTRY_BLOOM_SERVE_CHECK', 'False') == 'True',
+    'BLOOM_FILTER_PATH': os.environ.get('PHONE_REGISTRY_BLOOM_FILTER_PATH', ''),
+    'BLOOM_FALSE_POSITIVE_RATE': float(os.environ.get('PHONE_REGISTRY_BLOOM_FALSE_POSITIVE_RATE', '0.01')),
+    'BLOOM_MIN_CAPACITY': int(os.environ.get('PHONE_REGISTRY_BLOOM_MIN_CAPACITY', '1000000')),
+    'BLOOM_MAX_STALENESS': float(os.environ.get('PHONE_REGISTRY_BLOOM_MAX_STALENESS', '3600')),
+    'BLOOM_RELOAD_INTERVAL': float(os.environ.get('PHONE_REGISTRY_BLOOM_RELOAD_INTERVAL', '10')),
+    'JOB_FILES_DIR': os.environ.get('PHONE_REGISTRY_JOB_FILES_DIR', str(BASE_DIR / 'media' / 'phone_registry')),
+    'BULK_JOB_CHUNK_SIZE': int(os.environ.get('CHECK_API_BULK_JOB_CHUNK_SIZE', '1000')),
+    'BULK_JOB_CONCURRENCY': int(os.environ.get('CHECK_API_BULK_JOB_CONCURRENCY', '4')),
+    'BULK_JOB_MAX_RETRIES': int(os.environ.get('CHECK_API_BULK_JOB_MAX_RETRIES', '3')),
+    'BULK_JOB_STALE_AFTER': float(os.environ.get('CHECK_API_BULK_JOB_STALE_AFTER', '900')),
+    'CLEANUP_JOB_STEP_DAYS': int(os.environ.get('CHECK_API_CLEANUP_JOB_STEP_DAYS', '30')),
+    'CLEANUP_JOB_MAX_RETRIES': int(os.environ.get('CHECK_API_CLEANUP_JOB_MAX_RETRIES', '3')),
+    'CLEANUP_JOB_STALE_AFTER': float(os.environ.get('CHECK_API_CLEANUP_JOB_STALE_AFTER', '900')),
+}
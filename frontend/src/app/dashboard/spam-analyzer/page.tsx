@@ -24,7 +24,8 @@ import { useToast } from '@/contexts/ToastContext';
 interface SpamAnalysisResult {
   status: string;
   detected_language: string;
-  translated_text: string;
+  // null when the message was matched locally rather than analyzed by the NLP service
+  translated_text: string | null;
   indicators_found: {
     free: number;
     limited: number;
@@ -36,10 +37,12 @@ interface SpamAnalysisResult {
     limited: number;
     registered: number;
     frozen: number;
-  };
-  sentiment_polarity: number;
+  } | null;
+  sentiment_polarity: number | null;
   message_length: number;
-  confidence: string;
+  confidence: string | null;
+  source?: 'local';
+  matched_phrases?: string[];
 }
 
 export default function SpamAnalyzerPage() {
@@ -148,11 +151,16 @@ export default function SpamAnalyzerPage() {
                     label={result.status.toUpperCase()} 
                     color={getStatusColor(result.status) as any}
                   />
-                  <Chip 
-                    label={`${result.confidence} confidence`}
-                    color={getConfidenceColor(result.confidence) as any}
-                    size="small"
-                  />
+                  {result.confidence && (
+                    <Chip 
+                      label={`${result.confidence} confidence`}
+                      color={getConfidenceColor(result.confidence) as any}
+                      size="small"
+                    />
+                  )}
+                  {result.source === 'local' && (
+                    <Chip label="Known phrase match" variant="outlined" size="small" />
+                  )}
                 </Box>
 
                 <Box display="flex" flexWrap="wrap" gap={2}>
@@ -174,37 +182,41 @@ export default function SpamAnalyzerPage() {
                     </Typography>
                   </Box>
 
-                  <Box flex="1" minWidth="100%">
-                    <Typography variant="subtitle2" color="text.secondary" gutterBottom>
-                      Sentiment Polarity
-                    </Typography>
-                    <Box display="flex" alignItems="center" gap={2}>
-                      <LinearProgress 
-                        variant="determinate" 
-                        value={Math.abs(result.sentiment_polarity) * 100}
-                        color={result.sentiment_polarity >= 0 ? 'success' : 'error'}
-                        sx={{ flex: 1, height: 8, borderRadius: 4 }}
-                      />
-                      <Typography variant="body2" fontWeight={600}>
-                        {result.sentiment_polarity.toFixed(2)}
+                  {result.sentiment_polarity !== null && (
+                    <Box flex="1" minWidth="100%">
+                      <Typography variant="subtitle2" color="text.secondary" gutterBottom>
+                        Sentiment Polarity
                       </Typography>
+                      <Box display="flex" alignItems="center" gap={2}>
+                        <LinearProgress 
+                          variant="determinate" 
+                          value={Math.abs(result.sentiment_polarity) * 100}
+                          color={result.sentiment_polarity >= 0 ? 'success' : 'error'}
+                          sx={{ flex: 1, height: 8, borderRadius: 4 }}
+                        />
+                        <Typography variant="body2" fontWeight={600}>
+                          {result.sentiment_polarity.toFixed(2)}
+                        </Typography>
+                      </Box>
                     </Box>
-                  </Box>
+                  )}
 
-                  <Box flex="1" minWidth="100%">
-                    <Divider sx={{ my: 2 }} />
-                    <Typography variant="subtitle2" color="text.secondary" gutterBottom>
-                      Translated Text
-                    </Typography>
-                    <Typography variant="body2" sx={{ 
-                      bgcolor: 'action.hover', 
-                      p: 2, 
-                      borderRadius: 1,
-                      fontStyle: 'italic'
-                    }}>
-                      {result.translated_text}
-                    </Typography>
-                  </Box>
+                  {result.translated_text !== null && (
+                    <Box flex="1" minWidth="100%">
+                      <Divider sx={{ my: 2 }} />
+                      <Typography variant="subtitle2" color="text.secondary" gutterBottom>
+                        Translated Text
+                      </Typography>
+                      <Typography variant="body2" sx={{ 
+                        bgcolor: 'action.hover', 
+                        p: 2, 
+                        borderRadius: 1,
+                        fontStyle: 'italic'
+                      }}>
+                        {result.translated_text}
+                      </Typography>
+                    </Box>
+                  )}
 
                   <Box flex="1" minWidth="100%">
                     <Divider sx={{ my: 2 }} />
@@ -229,31 +241,33 @@ export default function SpamAnalyzerPage() {
                     </Box>
                   </Box>
 
-                  <Box flex="1" minWidth="100%">
-                    <Divider sx={{ my: 2 }} />
-                    <Typography variant="subtitle2" color="text.secondary" gutterBottom>
-                      Template Similarities
-                    </Typography>
-                    <Box display="flex" flexWrap="wrap" gap={2}>
-                      {Object.entries(result.template_similarities).map(([key, value]) => (
-                        <Box flex="1" minWidth="200px" key={key}>
-                          <Box>
-                            <Typography variant="caption" color="text.secondary">
-                              {key.toUpperCase()}
-                            </Typography>
-                            <LinearProgress 
-                              variant="determinate" 
-                              value={value * 100}
-                              sx={{ height: 8, borderRadius: 4, mt: 0.5 }}
-                            />
-                            <Typography variant="caption" fontWeight={600}>
-                              {(value * 100).toFixed(1)}%
-                            </Typography>
+                  {result.template_similarities && (
+                    <Box flex="1" minWidth="100%">
+                      <Divider sx={{ my: 2 }} />
+                      <Typography variant="subtitle2" color="text.secondary" gutterBottom>
+                        Template Similarities
+                      </Typography>
+                      <Box display="flex" flexWrap="wrap" gap={2}>
+                        {Object.entries(result.template_similarities).map(([key, value]) => (
+                          <Box flex="1" minWidth="200px" key={key}>
+                            <Box>
+                              <Typography variant="caption" color="text.secondary">
+                                {key.toUpperCase()}
+                              </Typography>
+                              <LinearProgress 
+                                variant="determinate" 
+                                value={value * 100}
+                                sx={{ height: 8, borderRadius: 4, mt: 0.5 }}
+                              />
+                              <Typography variant="caption" fontWeight={600}>
+                                {(value * 100).toFixed(1)}%
+                              </Typography>
+                            </Box>
                           </Box>
-                        </Box>
-                      ))}
+                        ))}
+                      </Box>
                     </Box>
-                  </Box>
+                  )}
                 </Box>
               </CardContent>
             </Card>